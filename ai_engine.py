@@ -1,20 +1,47 @@
 import numpy as np
 import json
 from datetime import datetime, timedelta
-from sklearn.linear_model import LinearRegression
-from sklearn.cluster import KMeans
-from models import db, Product, Order, OrderItem, Inventory, User, AIInsight
+from models import db, Product, Order, OrderItem, OrderStatus, Inventory, User, AIInsight, InsightWatermark, RawProduct, ProductRecipe
 import random
-from collections import defaultdict
+from collections import defaultdict, namedtuple
+import profiling
+from db_routing import reads_from_replica
+
+# An analysis method, the insight type it produces, the columns it reads and
+# whether its output also depends on the current date
+Analysis = namedtuple('Analysis', ['name', 'insight_type', 'inputs', 'daily'])
+
 
 class SmartBakeryAI:
     """Advanced AI engine for bakery operations with machine learning capabilities"""
     
+    # Per analysis, the columns its watermark is built from: the newest timestamp of
+    # a datetime column, the total of any other, plus the row count of each table
+    ANALYSES = (
+        Analysis('demand_forecasting_ml', 'ml_demand_forecast',
+                 (Order.updated_at, OrderItem.quantity, Product.created_at), daily=True),
+        Analysis('customer_behavior_analysis', 'customer_segmentation',
+                 (Order.updated_at, User.created_at), daily=True),
+        Analysis('dynamic_pricing_optimization', 'dynamic_pricing',
+                 (Order.updated_at, OrderItem.quantity, Inventory.last_updated, Inventory.quantity,
+                  Product.created_at, Product.price),
+                 daily=True),
+        Analysis('predictive_maintenance_alerts', 'predictive_maintenance', (), daily=False),
+        Analysis('supply_chain_optimization', 'supply_chain_optimization',
+                 (Order.updated_at, OrderItem.quantity, RawProduct.last_updated,
+                  ProductRecipe.created_at, ProductRecipe.quantity_required), daily=True),
+    )
+    
     def __init__(self):
         self.confidence_threshold = 0.7
+        self.last_run = {}
         
+    @reads_from_replica
     def demand_forecasting_ml(self):
         """Use machine learning to predict product demand"""
+        # scikit-learn is imported on first use to keep it out of web worker startup
+        from sklearn.linear_model import LinearRegression
+
         try:
             # Get historical order data
             orders = db.session.query(Order).join(OrderItem).all()
@@ -85,8 +112,11 @@ class SmartBakeryAI:
             print(f"ML Forecasting error: {e}")
             return self._generate_mock_forecast()
     
+    @reads_from_replica
     def customer_behavior_analysis(self):
         """Analyze customer purchasing patterns using clustering"""
+        from sklearn.cluster import KMeans
+
         try:
             customers = User.query.filter_by(role_id=5).all()  # Customer role
             
@@ -176,6 +206,7 @@ class SmartBakeryAI:
             print(f"Customer analysis error: {e}")
             return self._generate_mock_behavior_analysis()
     
+    @reads_from_replica
     def dynamic_pricing_optimization(self):
         """AI-powered dynamic pricing suggestions"""
         try:
@@ -239,6 +270,7 @@ class SmartBakeryAI:
             print(f"Pricing optimization error: {e}")
             return []
     
+    @reads_from_replica
     def predictive_maintenance_alerts(self):
         """Predict equipment maintenance needs based on usage patterns"""
         equipment_data = [
@@ -282,74 +314,239 @@ class SmartBakeryAI:
         
         return insights
     
-    def supply_chain_optimization(self):
-        """Optimize ingredient ordering with AI predictions"""
-        ingredients = [
-            {'name': 'Flour', 'current_stock': 150, 'weekly_usage': 200, 'unit_cost': 0.80, 'supplier_lead_time': 3},
-            {'name': 'Sugar', 'current_stock': 80, 'weekly_usage': 120, 'unit_cost': 1.20, 'supplier_lead_time': 2},
-            {'name': 'Butter', 'current_stock': 25, 'weekly_usage': 60, 'unit_cost': 4.50, 'supplier_lead_time': 1},
-            {'name': 'Chocolate', 'current_stock': 15, 'weekly_usage': 40, 'unit_cost': 6.00, 'supplier_lead_time': 5}
+    @reads_from_replica
+    def supply_chain_optimization(self, window_days=28, review_days=7, service_level_z=1.65, max_alerts=25):
+        """
+        Optimize ingredient ordering from real consumption.
+
+        Daily product sales over the trailing window are multiplied through the
+        recipe matrix to get the daily usage of every raw material, then days of
+        cover, safety stock and reorder quantity are derived for all raw materials
+        in one vectorized pass.
+        """
+        from scipy import sparse
+
+        # Order.created_at is stored in UTC, and so are the days it is grouped by
+        start_date = datetime.utcnow().date() - timedelta(days=window_days - 1)
+        
+        raw_rows = db.session.query(
+            RawProduct.id, RawProduct.name, RawProduct.unit_of_measure,
+            RawProduct.current_stock, RawProduct.cost_per_unit, RawProduct.lead_time_days
+        ).filter(RawProduct.is_active == True).all()
+        
+        if not raw_rows:
+            return []
+        
+        raw_index = {row.id: i for i, row in enumerate(raw_rows)}
+        
+        # Daily units sold per product
+        sale_day = db.func.date(Order.created_at)
+        sales_rows = db.session.query(
+            OrderItem.product_id, sale_day, db.func.sum(OrderItem.quantity)
+        ).join(Order, OrderItem.order_id == Order.id)\
+         .filter(Order.created_at >= datetime.combine(start_date, datetime.min.time()),
+                 Order.status != OrderStatus.CANCELLED)\
+         .group_by(OrderItem.product_id, sale_day).all()
+        
+        recipe_rows = db.session.query(
+            ProductRecipe.product_id, ProductRecipe.raw_product_id, ProductRecipe.quantity_required
+        ).all()
+        
+        # Days past the window, e.g. from a clock ahead of this one, would not fit the matrix
+        sales_rows = [
+            (product_id, (datetime.strptime(str(day)[:10], '%Y-%m-%d').date() - start_date).days, quantity)
+            for product_id, day, quantity in sales_rows
         ]
+        sales_rows = [r for r in sales_rows if 0 <= r[1] < window_days]
+        
+        product_index = {}
+        for product_id in [r[0] for r in sales_rows] + [r[0] for r in recipe_rows]:
+            product_index.setdefault(product_id, len(product_index))
+        
+        n_raw, n_products = len(raw_rows), max(1, len(product_index))
+        
+        # products x days sales matrix
+        sales = sparse.coo_matrix(
+            (
+                [float(r[2]) for r in sales_rows],
+                (
+                    [product_index[r[0]] for r in sales_rows],
+                    [r[1] for r in sales_rows]
+                )
+            ),
+            shape=(n_products, window_days)
+        ).tocsr()
+        
+        # raw materials x products recipe matrix
+        recipes = [r for r in recipe_rows if r[1] in raw_index]
+        recipe_matrix = sparse.coo_matrix(
+            (
+                [float(r[2]) for r in recipes],
+                ([raw_index[r[1]] for r in recipes], [product_index[r[0]] for r in recipes])
+            ),
+            shape=(n_raw, n_products)
+        ).tocsr()
+        
+        daily_usage = (recipe_matrix @ sales).toarray()
+        
+        stock = np.array([float(r.current_stock or 0) for r in raw_rows])
+        unit_cost = np.array([float(r.cost_per_unit or 0) for r in raw_rows])
+        lead_time = np.array([r.lead_time_days if r.lead_time_days is not None else 3 for r in raw_rows], dtype=float)
+        
+        mean_usage = daily_usage.mean(axis=1)
+        std_usage = daily_usage.std(axis=1)
+        active_days = np.count_nonzero(daily_usage, axis=1)
+        
+        days_remaining = np.divide(stock, mean_usage, out=np.full(n_raw, np.inf), where=mean_usage > 0)
+        safety_stock = service_level_z * std_usage * np.sqrt(lead_time)
+        reorder_point = mean_usage * lead_time + safety_stock
+        reorder_quantity = np.ceil(np.maximum(0, mean_usage * (lead_time + review_days) + safety_stock - stock))
+        order_cost = reorder_quantity * unit_cost
+        confidence = np.minimum(0.95, 0.6 + 0.35 * active_days / window_days)
+        
+        critical = (mean_usage > 0) & (days_remaining <= lead_time)
+        high = (mean_usage > 0) & ~critical & (stock <= reorder_point)
+        
+        # Most urgent first: critical before high, then fewest days of cover
+        alert_rows = np.flatnonzero(critical | high)
+        alert_rows = alert_rows[np.lexsort((days_remaining[alert_rows], ~critical[alert_rows]))][:max_alerts]
         
         insights = []
-        for ingredient in ingredients:
-            days_remaining = (ingredient['current_stock'] / ingredient['weekly_usage']) * 7
-            
-            # AI ordering optimization
-            safety_stock = ingredient['weekly_usage'] * 0.5  # 3.5 days
-            optimal_order_quantity = ingredient['weekly_usage'] * 2  # 2 weeks supply
-            
-            if days_remaining <= ingredient['supplier_lead_time'] + 2:
-                urgency = "CRITICAL"
-                order_now = True
-            elif days_remaining <= 7:
-                urgency = "HIGH"
-                order_now = True
-            else:
-                urgency = "NORMAL"
-                order_now = False
-            
-            cost_optimization = optimal_order_quantity * ingredient['unit_cost']
+        for i in alert_rows:
+            row = raw_rows[i]
+            urgency = "CRITICAL" if critical[i] else "HIGH"
             
             insights.append(AIInsight(
                 insight_type='supply_chain_optimization',
-                title=f'Inventory Alert: {ingredient["name"]}',
-                description=f'{urgency} - {days_remaining:.1f} days remaining. {"ORDER NOW" if order_now else "Monitor closely"}. Optimal order: {optimal_order_quantity:.0f} units (${cost_optimization:.2f})',
-                confidence_score=0.92,
+                title=f'Inventory Alert: {row.name}',
+                description=f'{urgency} - {days_remaining[i]:.1f} days remaining with a {int(lead_time[i])} day supplier lead time. ORDER NOW. Optimal order: {reorder_quantity[i]:.0f} {row.unit_of_measure} (${order_cost[i]:.2f})',
+                confidence_score=round(float(confidence[i]), 2),
                 data=json.dumps({
-                    'ingredient': ingredient['name'],
-                    'days_remaining': round(days_remaining, 1),
+                    'raw_product_id': row.id,
+                    'ingredient': row.name,
+                    'days_remaining': round(float(days_remaining[i]), 1),
                     'urgency': urgency,
-                    'order_now': order_now,
-                    'optimal_order_quantity': optimal_order_quantity,
-                    'cost_optimization': cost_optimization,
-                    'current_stock': ingredient['current_stock'],
-                    'weekly_usage': ingredient['weekly_usage']
+                    'order_now': True,
+                    'optimal_order_quantity': float(reorder_quantity[i]),
+                    'cost_optimization': round(float(order_cost[i]), 2),
+                    'current_stock': float(stock[i]),
+                    'daily_usage': round(float(mean_usage[i]), 3),
+                    'weekly_usage': round(float(mean_usage[i] * 7), 3),
+                    'safety_stock': round(float(safety_stock[i]), 3),
+                    'reorder_point': round(float(reorder_point[i]), 3),
+                    'lead_time_days': int(lead_time[i])
                 })
             ))
         
         return insights
     
-    def generate_all_insights(self):
-        """Generate comprehensive AI insights"""
-        all_insights = []
+    def generate_all_insights(self, force=False):
+        """
+        Generate comprehensive AI insights.
+
+        Analyses whose input watermark matches the one recorded by their last run
+        are skipped; the others have their insights upserted by title. Returns the
+        insights that were created or changed.
+        """
+        changed = []
+        input_values = self._input_watermarks()
         
-        # Clear old insights
-        AIInsight.query.delete()
+        for analysis in self.ANALYSES:
+            watermark = self._watermark_for(analysis, input_values)
+            record = InsightWatermark.query.filter_by(analysis=analysis.name).first()
+            
+            if not force and record and record.watermark == watermark:
+                self.last_run[analysis.name] = 'skipped'
+                continue
+            
+            with profiling.stage(analysis.name):
+                insights = getattr(self, analysis.name)()
+                changed.extend(self._upsert_insights(analysis.insight_type, insights))
+            
+            if not record:
+                record = InsightWatermark(analysis=analysis.name)
+                db.session.add(record)
+            record.watermark = watermark
+            record.computed_at = datetime.utcnow()
+            self.last_run[analysis.name] = 'recomputed'
         
-        # Generate new insights
-        all_insights.extend(self.demand_forecasting_ml())
-        all_insights.extend(self.customer_behavior_analysis())
-        all_insights.extend(self.dynamic_pricing_optimization())
-        all_insights.extend(self.predictive_maintenance_alerts())
-        all_insights.extend(self.supply_chain_optimization())
+        db.session.commit()
+        return changed
+    
+    def current_watermark(self, analysis_name):
+        """Return the watermark an analysis would record if it ran now"""
+        analysis = next(a for a in self.ANALYSES if a.name == analysis_name)
+        return self._watermark_for(analysis, self._input_watermarks([analysis]))
+    
+    def is_fresh(self, analysis_name, watermark=None):
+        """Whether the stored insights of an analysis match its current inputs"""
+        watermark = watermark or self.current_watermark(analysis_name)
+        record = InsightWatermark.query.filter_by(analysis=analysis_name).first()
+        return record is not None and record.watermark == watermark
+    
+    @reads_from_replica
+    def _input_watermarks(self, analyses=None):
+        """
+        Fetch the row count of every input table, and MAX() or SUM() of every
+        input column, in a single round trip. The counts catch deleted rows,
+        and the totals catch edits to rows without a timestamp.
+        """
+        aggregates = {}
+        for analysis in analyses or self.ANALYSES:
+            for column in analysis.inputs:
+                aggregates.setdefault(column.table.name, db.select(db.func.count()).select_from(column.table))
+                aggregate = db.func.max(column) if isinstance(column.type, db.DateTime) else db.func.sum(column)
+                aggregates.setdefault(str(column), db.select(aggregate))
         
-        # Save to database
-        for insight in all_insights:
-            db.session.add(insight)
+        if not aggregates:
+            return {}
         
-        db.session.commit()
-        return all_insights
+        row = db.session.execute(db.select(*[
+            query.scalar_subquery() for query in aggregates.values()
+        ])).one()
+        return dict(zip(aggregates.keys(), row))
+    
+    def _watermark_for(self, analysis, input_values):
+        """Build the watermark string for an analysis from its input values, one part per table"""
+        tables = {}
+        for column in analysis.inputs:
+            value = input_values.get(str(column))
+            value = value.isoformat() if isinstance(value, datetime) else ('-' if value is None else value)
+            tables.setdefault(column.table.name, [input_values.get(column.table.name)]).append(value)
+        parts = [f"{table}={':'.join(str(value) for value in values)}" for table, values in tables.items()]
+        if analysis.daily:
+            parts.append(f"day={datetime.now().date().isoformat()}")
+        return '|'.join(parts) or 'static'
+    
+    def _upsert_insights(self, insight_type, insights):
+        """Replace the stored insights of one type, touching only rows that changed"""
+        existing = defaultdict(list)
+        for row in AIInsight.query.filter_by(insight_type=insight_type).order_by(AIInsight.id).all():
+            existing[row.title].append(row)
+        
+        changed = []
+        for insight in insights:
+            matches = existing.get(insight.title)
+            current = matches.pop(0) if matches else None
+            
+            if current is None:
+                db.session.add(insight)
+                changed.append(insight)
+            elif (current.description, current.confidence_score, current.data) != \
+                    (insight.description, insight.confidence_score, insight.data):
+                current.description = insight.description
+                current.confidence_score = insight.confidence_score
+                current.data = insight.data
+                current.is_active = True
+                current.created_at = datetime.utcnow()
+                changed.append(current)
+        
+        # Insights the analysis no longer produces
+        for rows in existing.values():
+            for row in rows:
+                db.session.delete(row)
+        
+        return changed
     
     def _get_season(self, date):
         """Get season number (0-3) from date"""
@@ -1,3 +1,4 @@
+import json
 import os
 import logging
 
@@ -7,61 +8,182 @@ from werkzeug.middleware.proxy_fix import ProxyFix
 
 # Import db from models to avoid circular imports
 from models import db
+from jobs import job_runner
+from day_close import day_close_scheduler
+from principals import principal_cache, load_principal
+from notifications import notification_hub
+from mail_queue import mail_queue
+from config_cache import configuration_cache
+from session_activity import session_activity
+from unit_of_work import unit_of_work
+from sqlite_profile import sqlite_profile, engine_options, is_sqlite_file
 
 login_manager = LoginManager()
 
-# create the app
+# the application; routes.py and commands.py register their views and commands on it
 app = Flask(__name__)
-app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key-change-in-production")
-app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
-
-# configure the database
-app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///bakery.db")
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-}
-
-# initialize extensions
-db.init_app(app)
-login_manager.init_app(app)
-login_manager.login_view = 'login'
-login_manager.login_message = 'Please log in to access this page.'
-login_manager.login_message_category = 'info'
-
-# configure logging
-logging.basicConfig(level=logging.DEBUG)
 
-@login_manager.user_loader
-def load_user(user_id):
-    from models import User
-    return User.query.get(int(user_id))
 
-with app.app_context():
-    # Import models to ensure tables are created
-    from models import *
-    import routes
-    
-    db.create_all()
+def configure(app):
+    """Read the application configuration from the environment"""
+    app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key-change-in-production")
 
-# Add custom Jinja filters
-import json
+    # configure the database
+    app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///bakery.db")
 
-@app.template_filter('from_json')
-def from_json_filter(value):
-    """Convert JSON string to Python object"""
-    if isinstance(value, str):
-        try:
-            return json.loads(value)
-        except (json.JSONDecodeError, TypeError):
-            return {}
-    return value if isinstance(value, dict) else {}
+    # SQLite files: WAL so readers and the writer do not block each other, and a busy
+    # timeout so concurrent writers queue for the lock instead of failing
+    app.config["SQLITE_JOURNAL_MODE"] = os.environ.get("SQLITE_JOURNAL_MODE", "WAL")
+    app.config["SQLITE_SYNCHRONOUS"] = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL")
+    app.config["SQLITE_BUSY_TIMEOUT_MS"] = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", 10000))
+    app.config["SQLITE_MMAP_SIZE"] = int(os.environ.get("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+    # page cache per connection, on top of the shared memory map
+    app.config["SQLITE_CACHE_SIZE_KB"] = int(os.environ.get("SQLITE_CACHE_SIZE_KB", 16 * 1024))
+    app.config["SQLITE_JOURNAL_SIZE_LIMIT"] = int(os.environ.get("SQLITE_JOURNAL_SIZE_LIMIT", 64 * 1024 * 1024))
+    # connections kept open per worker, plus overflow for the rest of the gunicorn threads and background jobs
+    app.config["SQLITE_POOL_SIZE"] = int(os.environ.get("SQLITE_POOL_SIZE", 8))
+    app.config["SQLITE_POOL_OVERFLOW"] = int(os.environ.get("SQLITE_POOL_OVERFLOW", int(os.environ.get("GUNICORN_THREADS", 32))))
+    app.config["SQLITE_POOL_TIMEOUT"] = int(os.environ.get("SQLITE_POOL_TIMEOUT", 30))
+
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config["SQLALCHEMY_DATABASE_URI"], app.config)
+
+    # optional read replica for reports and analytics; reads fall back to the primary
+    # when it is not set or lags by more than REPLICA_MAX_LAG seconds
+    if os.environ.get("REPLICA_DATABASE_URL"):
+        replica_uri = os.environ["REPLICA_DATABASE_URL"]
+        if is_sqlite_file(replica_uri):
+            app.config["SQLALCHEMY_BINDS"] = {"replica": {"url": replica_uri, **engine_options(replica_uri, app.config)}}
+        else:
+            app.config["SQLALCHEMY_BINDS"] = {"replica": replica_uri}
+    app.config["REPLICA_MAX_LAG"] = float(os.environ.get("REPLICA_MAX_LAG", 30))
+    app.config["REPLICA_LAG_CHECK_INTERVAL"] = float(os.environ.get("REPLICA_LAG_CHECK_INTERVAL", 5))
+
+    # background jobs (AI insight regeneration)
+    app.config["JOB_WORKERS"] = int(os.environ.get("JOB_WORKERS", 1))
+    app.config["INSIGHT_REFRESH_COOLDOWN"] = int(os.environ.get("INSIGHT_REFRESH_COOLDOWN", 60))
+    app.config["PREDICTIVE_CACHE_TTL"] = int(os.environ.get("PREDICTIVE_CACHE_TTL", 300))
+    app.config["INSIGHT_PROFILE_MEMORY"] = os.environ.get("INSIGHT_PROFILE_MEMORY", "true").lower() == "true"
+    app.config["RECOMMENDATION_COUNT"] = int(os.environ.get("RECOMMENDATION_COUNT", 6))
+    app.config["RECOMMENDATION_REFRESH_COOLDOWN"] = int(os.environ.get("RECOMMENDATION_REFRESH_COOLDOWN", 60))
+
+    # generated invoice PDFs
+    app.config["INVOICE_CACHE_DIR"] = os.environ.get("INVOICE_CACHE_DIR", os.path.join(app.instance_path, "invoice_cache"))
+    app.config["INVOICE_CACHE_MAX_BYTES"] = int(os.environ.get("INVOICE_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+    app.config["INVOICE_EXPORT_WORKERS"] = int(os.environ.get("INVOICE_EXPORT_WORKERS", os.cpu_count() or 2))
+
+    # report PDFs larger than this spill from memory to a temporary file
+    app.config["REPORT_SPOOL_MAX_BYTES"] = int(os.environ.get("REPORT_SPOOL_MAX_BYTES", 8 * 1024 * 1024))
+
+    # reports prebuilt when a day is closed; set DAY_CLOSE_AT (HH:MM UTC, e.g. 00:05) to close the previous UTC day in-process
+    app.config["REPORT_CACHE_DIR"] = os.environ.get("REPORT_CACHE_DIR", os.path.join(app.instance_path, "report_cache"))
+    app.config["REPORT_CACHE_MAX_BYTES"] = int(os.environ.get("REPORT_CACHE_MAX_BYTES", 1024 * 1024 * 1024))
+    app.config["DAY_CLOSE_AT"] = os.environ.get("DAY_CLOSE_AT")
+
+    # expired sessions, OTPs and reset tokens are purged this long after they expire
+    app.config["EXPIRED_ROW_RETENTION_HOURS"] = int(os.environ.get("EXPIRED_ROW_RETENTION_HOURS", 24))
+
+    # cached user and role lookups for login and role checks
+    app.config["PRINCIPAL_CACHE_TTL"] = int(os.environ.get("PRINCIPAL_CACHE_TTL", 60))
+    app.config["PRINCIPAL_CACHE_SIZE"] = int(os.environ.get("PRINCIPAL_CACHE_SIZE", 1024))
+
+    # session last_activity is buffered and written in batches this often (seconds)
+    app.config["SESSION_ACTIVITY_FLUSH_INTERVAL"] = int(os.environ.get("SESSION_ACTIVITY_FLUSH_INTERVAL", 30))
+
+    # notification streams send a keep-alive comment this often (seconds); unread counts are recounted after the TTL
+    app.config["NOTIFICATION_STREAM_HEARTBEAT"] = int(os.environ.get("NOTIFICATION_STREAM_HEARTBEAT", 15))
+    app.config["NOTIFICATION_UNREAD_TTL"] = int(os.environ.get("NOTIFICATION_UNREAD_TTL", 300))
+
+    # only these roles get a notification stream, and each worker holds at most this many open,
+    # since every stream keeps a thread busy; other browsers poll /api/notifications (seconds)
+    app.config["NOTIFICATION_STREAM_ROLES"] = [r for r in os.environ.get("NOTIFICATION_STREAM_ROLES", "admin,manager,staff").split(",") if r]
+    app.config["NOTIFICATION_STREAM_MAX"] = int(os.environ.get("NOTIFICATION_STREAM_MAX", 16))
+    app.config["NOTIFICATION_POLL_INTERVAL"] = int(os.environ.get("NOTIFICATION_POLL_INTERVAL", 60))
+
+    # configuration values are cached per process; the stored version is checked at most this often (seconds)
+    app.config["CONFIG_VERSION_CHECK_INTERVAL"] = int(os.environ.get("CONFIG_VERSION_CHECK_INTERVAL", 5))
+
+    # outbound mail is queued in the database and sent by a background worker,
+    # through Mailgun if configured and then SMTP (Gmail when only GMAIL_USER is set)
+    app.config["MAILGUN_API_KEY"] = os.environ.get("MAILGUN_API_KEY")
+    app.config["MAILGUN_DOMAIN"] = os.environ.get("MAILGUN_DOMAIN")
+    # https://api.eu.mailgun.net/v3 for domains in the EU region
+    app.config["MAILGUN_API_URL"] = os.environ.get("MAILGUN_API_URL", "https://api.mailgun.net/v3")
+    app.config["MAIL_SMTP_HOST"] = os.environ.get("MAIL_SMTP_HOST") or ("smtp.gmail.com" if os.environ.get("GMAIL_USER") else None)
+    app.config["MAIL_SMTP_PORT"] = int(os.environ.get("MAIL_SMTP_PORT", 587))
+    app.config["MAIL_SMTP_USERNAME"] = os.environ.get("MAIL_SMTP_USERNAME") or os.environ.get("GMAIL_USER")
+    app.config["MAIL_SMTP_PASSWORD"] = os.environ.get("MAIL_SMTP_PASSWORD") or os.environ.get("GMAIL_APP_PASSWORD")
+    app.config["MAIL_SMTP_STARTTLS"] = os.environ.get("MAIL_SMTP_STARTTLS", "1") == "1"
+    app.config["MAIL_SMTP_IDLE_TIMEOUT"] = int(os.environ.get("MAIL_SMTP_IDLE_TIMEOUT", 60))
+    app.config["MAIL_FROM"] = os.environ.get("MAIL_FROM") or app.config["MAIL_SMTP_USERNAME"] or "noreply@bakebrain.local"
+    app.config["MAIL_TIMEOUT"] = int(os.environ.get("MAIL_TIMEOUT", 10))
+    app.config["MAIL_QUEUE_WORKER"] = os.environ.get("MAIL_QUEUE_WORKER", "1") == "1"
+    app.config["MAIL_QUEUE_POLL_INTERVAL"] = int(os.environ.get("MAIL_QUEUE_POLL_INTERVAL", 5))
+    app.config["MAIL_MAX_ATTEMPTS"] = int(os.environ.get("MAIL_MAX_ATTEMPTS", 6))
+    app.config["MAIL_RETRY_BASE_SECONDS"] = int(os.environ.get("MAIL_RETRY_BASE_SECONDS", 30))
+    app.config["MAIL_RETRY_MAX_SECONDS"] = int(os.environ.get("MAIL_RETRY_MAX_SECONDS", 3600))
+    app.config["MAIL_CLAIM_LEASE_SECONDS"] = int(os.environ.get("MAIL_CLAIM_LEASE_SECONDS", 300))
+
+
+def _dispose_engines_after_fork():
+    # Connections opened before a fork, e.g. by a gunicorn --preload master, must not be shared
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
 
-with app.app_context():
-    # Create default admin user if it doesn't exist
+
+def create_app():
+    """
+    Configure the application and register its extensions, views and CLI
+    commands. Safe to call more than once; returns the application.
+
+    Loading the app does not touch the database and does not import the
+    analytics or PDF libraries, which are imported when first used. That
+    keeps worker startup short, and under gunicorn --preload everything loaded
+    here is shared copy-on-write by the workers. Create the schema and the
+    default roles and admin user with `flask init-db`.
+    """
+    if 'bakebrain' in app.extensions:
+        return app
+    app.extensions['bakebrain'] = True
+
+    configure(app)
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
+
+    # initialize extensions
+    db.init_app(app)
+    sqlite_profile.init_app(app)
+    login_manager.init_app(app)
+    job_runner.init_app(app)
+    day_close_scheduler.init_app(app)
+    session_activity.init_app(app)
+    notification_hub.init_app(app)
+    mail_queue.init_app(app)
+    configuration_cache.init_app(app)
+    unit_of_work.init_app(app)
+    principal_cache.ttl = app.config["PRINCIPAL_CACHE_TTL"]
+    principal_cache.maxsize = app.config["PRINCIPAL_CACHE_SIZE"]
+    login_manager.login_view = 'login'
+    login_manager.login_message = 'Please log in to access this page.'
+    login_manager.login_message_category = 'info'
+    os.register_at_fork(after_in_child=_dispose_engines_after_fork)
+
+    # configure logging
+    logging.basicConfig(level=logging.DEBUG)
+
+    with app.app_context():
+        import routes
+        import commands
+
+    return app
+
+
+def init_db():
+    """Create missing tables, and the default roles and admin user if they do not exist"""
     from models import User, Role
     from werkzeug.security import generate_password_hash
-    
+
+    db.create_all()
+
     # Create roles
     admin_role = Role.query.filter_by(name='admin').first()
     if not admin_role:
@@ -106,5 +228,27 @@ with app.app_context():
         db.session.add(admin_user)
         db.session.commit()
 
+
+@login_manager.user_loader
+def load_user(user_id):
+    # Served from the principal cache; deactivated users are logged out
+    return load_principal(int(user_id))
+
+
+@app.template_filter('from_json')
+def from_json_filter(value):
+    """Convert JSON string to Python object"""
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except (json.JSONDecodeError, TypeError):
+            return {}
+    return value if isinstance(value, dict) else {}
+
+
+create_app()
+
 if __name__ == '__main__':
+    with app.app_context():
+        init_db()
     app.run(debug=True, host='0.0.0.0', port=5000)
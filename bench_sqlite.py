@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+SQLite concurrency benchmark: order writes per second from several worker
+processes at once, with the previous engine settings and with the SQLite
+profile (WAL, synchronous=NORMAL, busy timeout, mmap, cache size, sized pool).
+
+    python bench_sqlite.py                         # 4 processes x 8 threads, 10 s per run
+    python bench_sqlite.py --processes 8 --seconds 20
+    python bench_sqlite.py --reads 4               # four dashboard reads per order
+
+The processes stand in for gunicorn workers. Every thread places orders in a
+loop: an order, three order items and a stock update in one transaction,
+each followed by --reads dashboard queries over the orders table. Each run
+uses a fresh throwaway database, since WAL mode stays set on the file.
+"""
+
+import argparse
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+MODES = ('previous', 'profile')
+
+
+def _engine(database, mode):
+    import sqlalchemy as sa
+    from app import app
+    from sqlite_profile import engine_options, sqlite_pragmas, apply_pragmas
+
+    url = f'sqlite:///{database}'
+    if mode == 'previous':
+        # What every deployment used before: no pragmas, pysqlite's 5 s lock timeout
+        return sa.create_engine(url, pool_recycle=300, pool_pre_ping=True)
+    engine = sa.create_engine(url, **engine_options(url, app.config))
+    pragmas = sqlite_pragmas(app.config)
+    sa.event.listen(engine, 'connect', lambda dbapi_connection, record: apply_pragmas(dbapi_connection, pragmas))
+    return engine
+
+
+def setup(database):
+    from models import db, Inventory
+
+    engine = _engine(database, 'previous')
+    db.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(Inventory.__table__.insert().values(id=1, product_id=1, quantity=10 ** 9))
+    engine.dispose()
+
+
+def _place_order(engine, number, reads):
+    import sqlalchemy as sa
+    from models import Order, OrderItem, Inventory, OrderStatus
+
+    orders, items, inventory = Order.__table__, OrderItem.__table__, Inventory.__table__
+    now = datetime.utcnow()
+    with engine.begin() as connection:
+        order_id = connection.execute(orders.insert().values(
+            order_number=number, customer_id=1, status=OrderStatus.PENDING.name, total_amount=12,
+            created_at=now, updated_at=now
+        )).inserted_primary_key[0]
+        connection.execute(items.insert(), [
+            {'order_id': order_id, 'product_id': 1, 'quantity': 1, 'unit_price': 4, 'total_price': 4}
+            for _ in range(3)
+        ])
+        connection.execute(inventory.update().where(inventory.c.product_id == 1)
+                           .values(quantity=inventory.c.quantity - 3, last_updated=now))
+    for _ in range(reads):
+        with engine.connect() as connection:
+            connection.execute(sa.select(sa.func.count(), sa.func.sum(orders.c.total_amount))
+                               .where(orders.c.status == OrderStatus.PENDING.name)).one()
+
+
+def worker(database, mode, threads, reads, start_at, seconds, results):
+    engine = _engine(database, mode)
+    stats = {'writes': 0, 'locked': 0, 'latencies': []}
+    lock = threading.Lock()
+
+    def run(thread):
+        count = 0
+        time.sleep(max(start_at - time.time(), 0))
+        while time.time() < start_at + seconds:
+            count += 1
+            started = time.perf_counter()
+            try:
+                _place_order(engine, f'B-{os.getpid()}-{thread}-{count}', reads)
+            except Exception as e:
+                if 'locked' not in str(e):
+                    raise
+                with lock:
+                    stats['locked'] += 1
+                continue
+            with lock:
+                stats['writes'] += 1
+                stats['latencies'].append(time.perf_counter() - started)
+
+    pool = [threading.Thread(target=run, args=(thread,)) for thread in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    engine.dispose()
+    results.put(stats)
+
+
+def run(database, mode, processes, threads, reads, seconds):
+    setup(database)
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    start_at = time.time() + 1
+    children = [context.Process(target=worker, args=(database, mode, threads, reads, start_at, seconds, results))
+                for _ in range(processes)]
+    for child in children:
+        child.start()
+    stats = [results.get() for _ in children]
+    for child in children:
+        child.join()
+
+    latencies = sorted(latency for s in stats for latency in s['latencies'])
+    writes = sum(s['writes'] for s in stats)
+    return {
+        'writes': writes,
+        'writes_per_s': writes / seconds,
+        'locked_errors': sum(s['locked'] for s in stats),
+        'p50_ms': statistics.median(latencies) * 1000 if latencies else 0.0,
+        'p95_ms': latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0.0,
+        'max_ms': latencies[-1] * 1000 if latencies else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--processes', type=int, default=4, help='worker processes writing at once')
+    parser.add_argument('--threads', type=int, default=8, help='threads per process')
+    parser.add_argument('--reads', type=int, default=1, help='dashboard queries after each order')
+    parser.add_argument('--seconds', type=float, default=10, help='duration of each run')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp, 'app.db')}"
+        for mode in MODES:
+            print(f"{mode.capitalize()} settings, {args.processes} processes x {args.threads} threads, "
+                  f"{args.reads} read(s) per order, {args.seconds:g} s")
+            result = run(os.path.join(tmp, f'{mode}.db'), mode, args.processes, args.threads, args.reads, args.seconds)
+            for key, value in result.items():
+                print(f"  {key:22} {value:.3f}" if isinstance(value, float) else f"  {key:22} {value}")
+            print()
+
+
+if __name__ == '__main__':
+    main()
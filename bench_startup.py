@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark: how long loading the app takes, and how much memory each
+gunicorn worker uses.
+
+    python bench_startup.py                  # cold import and first request, 5 runs
+    python bench_startup.py --gunicorn 4     # also start 4 workers with and without --preload
+
+Every measurement runs in a fresh process against a throwaway SQLite
+database. Worker memory is read from /proc, so the gunicorn part needs Linux.
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+HEAVY_MODULES = ('numpy', 'scipy', 'sklearn', 'reportlab')
+
+# Runs in a child process; prints one JSON line
+COLD_START = '''
+import json, sys, time
+started = time.perf_counter()
+from app import app
+imported = time.perf_counter() - started
+
+def rss_kb():
+    with open('/proc/self/status') as status:
+        return next(int(line.split()[1]) for line in status if line.startswith('VmRSS:'))
+
+after_import = rss_kb()
+client = app.test_client()
+started = time.perf_counter()
+status = client.get('/login').status_code
+first_request = time.perf_counter() - started
+print(json.dumps({
+    'import_s': imported,
+    'first_request_s': first_request,
+    'status': status,
+    'rss_after_import_mb': after_import / 1024,
+    'rss_after_request_mb': rss_kb() / 1024,
+    'heavy_modules': [name for name in %r if name in sys.modules],
+}))
+''' % (HEAVY_MODULES,)
+
+
+def _env(database):
+    return dict(os.environ, DATABASE_URL=f'sqlite:///{database}', PYTHONPATH=HERE)
+
+
+def cold_start(database, runs):
+    results = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', COLD_START], cwd=HERE, env=_env(database),
+                                capture_output=True, text=True, check=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    summary = {key: statistics.median(r[key] for r in results)
+               for key in ('import_s', 'first_request_s', 'rss_after_import_mb', 'rss_after_request_mb')}
+    summary['heavy_modules'] = results[-1]['heavy_modules']
+    return summary
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _children(pid):
+    path = f'/proc/{pid}/task/{pid}/children'
+    with open(path) as children:
+        return [int(child) for child in children.read().split()]
+
+
+def _memory_kb(pid):
+    """RSS, and PSS which splits pages shared with other processes between them"""
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as rollup:
+        for line in rollup:
+            name, _, rest = line.partition(':')
+            if name in ('Rss', 'Pss'):
+                values[name] = int(rest.split()[0])
+    return values
+
+
+def gunicorn_workers(database, workers, preload, timeout=60):
+    port = _free_port()
+    env = _env(database)
+    env.update(WEB_CONCURRENCY=str(workers), GUNICORN_BIND=f'127.0.0.1:{port}',
+               GUNICORN_PRELOAD='1' if preload else '0')
+    started = time.perf_counter()
+    master = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'main:app'],
+                              cwd=HERE, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        ready = None
+        while time.perf_counter() - started < timeout:
+            try:
+                urllib.request.urlopen(f'http://127.0.0.1:{port}/login', timeout=5)
+                ready = time.perf_counter() - started
+                break
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.05)
+        if ready is None:
+            raise RuntimeError('gunicorn did not answer in time')
+
+        # Let every worker finish booting before measuring
+        while len(_children(master.pid)) < workers and time.perf_counter() - started < timeout:
+            time.sleep(0.05)
+        time.sleep(1)
+        for _ in range(workers * 4):
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/login', timeout=5).read()
+        memory = [_memory_kb(pid) for pid in _children(master.pid)]
+        return {
+            'preload': preload,
+            'workers': len(memory),
+            'first_response_s': ready,
+            'worker_rss_mb': statistics.mean(m['Rss'] for m in memory) / 1024,
+            'worker_pss_mb': statistics.mean(m['Pss'] for m in memory) / 1024,
+            'total_pss_mb': (sum(m['Pss'] for m in memory) + _memory_kb(master.pid)['Pss']) / 1024,
+        }
+    finally:
+        master.terminate()
+        master.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help='cold starts to take the median of')
+    parser.add_argument('--gunicorn', type=int, metavar='WORKERS', help='also measure this many gunicorn workers')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database = os.path.join(tmp, 'bench.db')
+        subprocess.run([sys.executable, '-m', 'flask', '--app', 'main', 'init-db'], cwd=HERE, env=_env(database),
+                       capture_output=True, check=True)
+
+        print(f"Cold start (median of {args.runs})")
+        for key, value in cold_start(database, args.runs).items():
+            print(f"  {key:22} {value:.3f}" if isinstance(value, float) else f"  {key:22} {value}")
+
+        if args.gunicorn:
+            for preload in (False, True):
+                print(f"\nGunicorn, {args.gunicorn} workers, {'with' if preload else 'without'} --preload")
+                for key, value in gunicorn_workers(database, args.gunicorn, preload).items():
+                    print(f"  {key:22} {value:.3f}" if isinstance(value, float) else f"  {key:22} {value}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+import json
+from datetime import datetime
+
+import click
+
+from app import app
+
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Create the database tables and the default roles and admin user."""
+    from app import init_db
+
+    init_db()
+    click.echo('Database initialized.')
+
+
+@app.cli.command('close-day')
+@click.option('--date', 'report_date', help='Day to close (YYYY-MM-DD), yesterday by default.')
+@click.option('--force', is_flag=True, help='Rebuild reports that are already stored.')
+def close_day_command(report_date, force):
+    """Prebuild the sales and inventory reports of a finished day."""
+    from day_close import close_day
+
+    if report_date:
+        try:
+            report_date = datetime.strptime(report_date, '%Y-%m-%d').date()
+        except ValueError:
+            raise click.BadParameter('Use the YYYY-MM-DD format.', param_hint='--date')
+    click.echo(json.dumps(close_day(report_date, force=force), indent=2))
+
+
+@app.cli.command('refresh-recommendations')
+@click.option('--full', is_flag=True, help='Rescore every customer, not only those with changed orders.')
+def refresh_recommendations_command(full):
+    """Recompute the stored product recommendations of customers."""
+    from jobs import refresh_recommendations
+
+    click.echo(json.dumps(refresh_recommendations(full=full), indent=2))
+
+
+@app.cli.command('purge-expired')
+@click.option('--retention-hours', default=None, type=int, help='Keep rows this long after they expire.')
+@click.option('--batch-size', default=1000, show_default=True, help='Rows deleted per transaction.')
+@click.option('--pause', default=0.0, show_default=True, help='Seconds to wait between batches.')
+def purge_expired_command(retention_hours, batch_size, pause):
+    """Delete expired sessions, verification codes and password reset tokens."""
+    from purge import purge_expired
+
+    if retention_hours is None:
+        retention_hours = app.config['EXPIRED_ROW_RETENTION_HOURS']
+    click.echo(json.dumps(purge_expired(retention_hours, batch_size=batch_size, pause=pause), indent=2))
+
+
+@app.cli.command('send-mail')
+def send_mail_command():
+    """Send the messages that are due in the outbound mail queue."""
+    from mail_queue import mail_queue
+
+    try:
+        click.echo(json.dumps(mail_queue.drain(), indent=2))
+    finally:
+        mail_queue.reset_transports()
@@ -0,0 +1,127 @@
+import logging
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+VERSION_ROW_ID = 1
+
+
+def current_configuration_version(session):
+    from models import ConfigurationVersion
+
+    version = session.query(ConfigurationVersion.version).filter(ConfigurationVersion.id == VERSION_ROW_ID).scalar()
+    return version or 0
+
+
+def bump_configuration_version(session):
+    """
+    Increment the stored configuration version in the session's transaction,
+    once per transaction; every process reloads its cache when it sees it.
+    """
+    from models import ConfigurationVersion
+
+    if session.info.get('configuration_changed'):
+        return
+    session.info['configuration_changed'] = True
+    table = ConfigurationVersion.__table__
+    # On the connection, since this also runs inside a flush
+    connection = session.connection()
+    result = connection.execute(
+        table.update().where(table.c.id == VERSION_ROW_ID)
+        .values(version=table.c.version + 1, updated_at=datetime.utcnow())
+    )
+    if result.rowcount == 0:
+        connection.execute(table.insert().values(id=VERSION_ROW_ID, version=1, updated_at=datetime.utcnow()))
+
+
+class ConfigurationCache:
+    """
+    Every configuration value, converted to its type, held in memory.
+
+    The values are loaded in one query on first use. After that a read costs
+    no query, except that at most once every check_interval seconds the
+    stored configuration version is read, and everything is reloaded if
+    another process changed it. Changes committed by this process are seen
+    immediately. Values are always read outside the caller's transaction,
+    so changes that are not committed yet are never cached.
+    """
+
+    def __init__(self, check_interval=5):
+        self.check_interval = check_interval
+        self.version = None
+        self._values = None
+        self._checked_at = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.check_interval = app.config.get('CONFIG_VERSION_CHECK_INTERVAL', self.check_interval)
+        app.extensions['configuration_cache'] = self
+
+    def _load(self, session):
+        from models import Configuration
+
+        version = current_configuration_version(session)
+        values = {}
+        for config in session.query(Configuration).all():
+            try:
+                values[config.key] = config.get_typed_value()
+            except (ValueError, TypeError):
+                logging.warning(f"Configuration {config.key} is not a valid {config.data_type}; using it as text")
+                values[config.key] = config.value
+        self._values = values
+        self.version = version
+
+    def _refresh(self):
+        from models import db
+
+        with self._lock:
+            now = time.monotonic()
+            if self._values is not None and now - self._checked_at < self.check_interval:
+                return self._values
+            # In a session of its own: the caller's transaction may hold changes that are not committed yet
+            with Session(db.engine) as session:
+                if self._values is None or current_configuration_version(session) != self.version:
+                    self._load(session)
+            self._checked_at = now
+            return self._values
+
+    def get(self, key, default=None):
+        return self._refresh().get(key, default)
+
+    def values(self, keys=None):
+        """A copy of all values, or of the given keys that are set"""
+        values = self._refresh()
+        if keys is None:
+            return dict(values)
+        return {key: values[key] for key in keys if key in values}
+
+    def invalidate(self):
+        """Reload on next use"""
+        with self._lock:
+            self._values = None
+
+
+configuration_cache = ConfigurationCache()
+
+
+@event.listens_for(Session, 'after_flush')
+def _bump_version_on_configuration_change(session, flush_context):
+    from models import Configuration
+
+    if any(isinstance(obj, Configuration) for obj in (*session.new, *session.dirty, *session.deleted)):
+        bump_configuration_version(session)
+
+
+@event.listens_for(Session, 'after_commit')
+def _reload_changed_configuration(session):
+    if session.info.pop('configuration_changed', False):
+        configuration_cache.invalidate()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_configuration_change(session):
+    if session.info.pop('configuration_changed', False):
+        configuration_cache.invalidate()
@@ -0,0 +1,11 @@
+import pytest
+
+from app import app, db, init_db
+
+
+@pytest.fixture(scope='session', autouse=True)
+def database():
+    """Loading the app no longer creates the schema, so create it before the tests"""
+    with app.app_context():
+        init_db()
+    yield db
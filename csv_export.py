@@ -0,0 +1,237 @@
+import csv
+import io
+import zlib
+from datetime import datetime, time, timedelta
+
+from flask import current_app, stream_with_context
+from sqlalchemy.orm import aliased
+
+from models import (
+    Order, OrderItem, OrderStatus, OrderType, Product, Role, ScheduleModification, StaffSchedule, User
+)
+
+# Rows fetched per round trip and written per yielded chunk
+EXPORT_CHUNK_SIZE = 1000
+
+
+def stream_csv(header, rows, compress=False, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield a CSV document chunk by chunk.
+
+    Only chunk_size rows are formatted at a time, so the size of the export is
+    bounded by the client rather than by the worker's memory. With compress the
+    output is a gzip stream, compressed as it is produced.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # wbits=31 writes a gzip header and trailer around the deflate stream
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+
+    def take():
+        data = buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+        return compressor.compress(data) if compressor else data
+
+    # Send the header straight away so the client sees the download start
+    writer.writerow(header)
+    yield take()
+
+    pending = 0
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= chunk_size:
+            pending = 0
+            chunk = take()
+            if chunk:
+                yield chunk
+
+    chunk = take()
+    if compressor:
+        chunk += compressor.flush()
+    if chunk:
+        yield chunk
+
+
+def csv_response(filename, header, rows, compress=False):
+    """Streamed attachment response for stream_csv()"""
+    if compress:
+        filename += '.gz'
+    response = current_app.response_class(
+        stream_with_context(stream_csv(header, rows, compress=compress)),
+        mimetype='application/gzip' if compress else 'text/csv'
+    )
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
+
+
+def _format(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, (OrderStatus, OrderType)):
+        return value.value
+    return value
+
+
+def _parse_enums(enum_class, raw):
+    values = []
+    for name in raw.split(','):
+        name = name.strip().upper()
+        if not name:
+            continue
+        try:
+            values.append(enum_class[name])
+        except KeyError:
+            raise ValueError(f"Unknown {enum_class.__name__} '{name}'")
+    return values
+
+
+def order_filters(args):
+    """
+    Filter criteria on Order from the start, end, status and type query
+    arguments. Dates are YYYY-MM-DD and inclusive; status and type take a
+    comma-separated list. Raises ValueError on malformed input.
+    """
+    criteria = []
+    start = args.get('start')
+    end = args.get('end')
+    try:
+        if start:
+            criteria.append(Order.created_at >= datetime.combine(datetime.strptime(start, '%Y-%m-%d').date(), time.min))
+        if end:
+            criteria.append(Order.created_at <= datetime.combine(datetime.strptime(end, '%Y-%m-%d').date(), time.max))
+    except ValueError:
+        raise ValueError('Dates must be in YYYY-MM-DD format')
+
+    if args.get('status'):
+        criteria.append(Order.status.in_(_parse_enums(OrderStatus, args['status'])))
+    if args.get('type'):
+        criteria.append(Order.order_type.in_(_parse_enums(OrderType, args['type'])))
+    return criteria
+
+
+ORDER_EXPORT_HEADER = [
+    'Order Number', 'Created At', 'Type', 'Status', 'Customer Email', 'Customer Name',
+    'Total', 'Tax', 'Discount', 'Delivery Date'
+]
+
+ORDER_ITEM_EXPORT_HEADER = [
+    'Order Number', 'Order Created At', 'Order Type', 'Order Status',
+    'SKU', 'Product', 'Quantity', 'Unit Price', 'Line Total'
+]
+
+
+def order_rows(criteria, chunk_size=EXPORT_CHUNK_SIZE):
+    """One CSV row per order, fetched as a projection chunk_size rows at a time"""
+    query = Order.query.with_entities(
+        Order.order_number, Order.created_at, Order.order_type, Order.status,
+        User.email, User.first_name, User.last_name,
+        Order.total_amount, Order.tax_amount, Order.discount_amount, Order.delivery_date
+    ).join(User, Order.customer_id == User.id).filter(*criteria).order_by(Order.id).yield_per(chunk_size)
+
+    for (order_number, created_at, order_type, status, email, first_name, last_name,
+         total, tax, discount, delivery_date) in query:
+        yield [
+            order_number, _format(created_at), _format(order_type), _format(status),
+            email, f"{first_name} {last_name}",
+            total, tax if tax is not None else 0, discount if discount is not None else 0,
+            _format(delivery_date)
+        ]
+
+
+def order_item_rows(criteria, chunk_size=EXPORT_CHUNK_SIZE):
+    """One CSV row per order line, fetched as a projection chunk_size rows at a time"""
+    query = OrderItem.query.with_entities(
+        Order.order_number, Order.created_at, Order.order_type, Order.status,
+        Product.sku, Product.name, OrderItem.quantity, OrderItem.unit_price, OrderItem.total_price
+    ).join(Order, OrderItem.order_id == Order.id).join(Product, OrderItem.product_id == Product.id).filter(
+        *criteria
+    ).order_by(Order.id, OrderItem.id).yield_per(chunk_size)
+
+    for row in query:
+        yield [_format(value) for value in row]
+
+
+MODIFICATION_EXPORT_HEADER = [
+    'Date', 'Time', 'Staff Member', 'Schedule Date', 'Modification Type',
+    'Old Start Time', 'Old End Time', 'Old Position', 'Old Notes',
+    'New Start Time', 'New End Time', 'New Position', 'New Notes',
+    'Reason', 'Modified By', 'Modifier Role'
+]
+
+
+def modification_filters(args):
+    """
+    Filter criteria on ScheduleModification from the staff_id, type, date_from
+    and date_to arguments of a request.args MultiDict. Raises ValueError on
+    malformed input.
+    """
+    criteria = []
+    staff_id = args.get('staff_id', type=int)
+    if staff_id:
+        criteria.append(StaffSchedule.staff_id == staff_id)
+    if args.get('type'):
+        criteria.append(ScheduleModification.modification_type == args['type'])
+    try:
+        if args.get('date_from'):
+            criteria.append(ScheduleModification.modified_at >= datetime.strptime(args['date_from'], '%Y-%m-%d'))
+        if args.get('date_to'):
+            criteria.append(
+                ScheduleModification.modified_at <= datetime.strptime(args['date_to'], '%Y-%m-%d') + timedelta(days=1)
+            )
+    except ValueError:
+        raise ValueError('Dates must be in YYYY-MM-DD format')
+    return criteria
+
+
+def _clock(value):
+    return value.strftime('%H:%M') if value else ''
+
+
+def modification_rows(criteria, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    One CSV row per schedule modification.
+
+    The staff member, the modifier and the modifier's role come from a single
+    joined projection instead of being loaded per modification.
+    """
+    staff = aliased(User)
+    modifier = aliased(User)
+    query = ScheduleModification.query.with_entities(
+        ScheduleModification.modified_at, staff.first_name, staff.last_name, StaffSchedule.date,
+        ScheduleModification.modification_type,
+        ScheduleModification.old_start_time, ScheduleModification.old_end_time,
+        ScheduleModification.old_position, ScheduleModification.old_notes,
+        ScheduleModification.new_start_time, ScheduleModification.new_end_time,
+        ScheduleModification.new_position, ScheduleModification.new_notes,
+        ScheduleModification.reason, modifier.first_name, modifier.last_name, Role.name
+    ).join(
+        StaffSchedule, ScheduleModification.schedule_id == StaffSchedule.id
+    ).join(
+        staff, StaffSchedule.staff_id == staff.id
+    ).join(
+        modifier, ScheduleModification.modified_by == modifier.id
+    ).outerjoin(
+        Role, modifier.role_id == Role.id
+    ).filter(*criteria).order_by(
+        ScheduleModification.modified_at.desc(), ScheduleModification.id.desc()
+    ).yield_per(chunk_size)
+
+    for (modified_at, staff_first, staff_last, schedule_date, modification_type,
+         old_start, old_end, old_position, old_notes, new_start, new_end, new_position, new_notes,
+         reason, modifier_first, modifier_last, role_name) in query:
+        yield [
+            modified_at.strftime('%Y-%m-%d'),
+            modified_at.strftime('%H:%M:%S'),
+            f"{staff_first} {staff_last}",
+            schedule_date.strftime('%Y-%m-%d'),
+            modification_type.title(),
+            _clock(old_start), _clock(old_end), old_position or '', old_notes or '',
+            _clock(new_start), _clock(new_end), new_position or '', new_notes or '',
+            reason or '',
+            f"{modifier_first} {modifier_last}",
+            role_name.title() if role_name else ''
+        ]
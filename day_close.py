@@ -0,0 +1,222 @@
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Order, ReportArtifact
+from pdf_cache import PDFCache, get_report_cache
+from db_routing import reads_from_replica
+
+DAILY_SALES = 'daily_sales'
+INVENTORY = 'inventory'
+
+
+def utc_today():
+    """Today's date in UTC, the calendar orders are stamped in"""
+    return datetime.utcnow().date()
+
+
+@reads_from_replica
+def sales_watermark(report_date):
+    """
+    Fingerprint of the orders created on report_date.
+
+    Any edit to one of the day's orders moves its updated_at, and adding or
+    deleting one changes the count, so a stored report whose watermark still
+    matches is current. It is read from the same database as the report.
+    """
+    day_start = datetime.combine(report_date, datetime.min.time())
+    count, last_update = db.session.query(
+        db.func.count(Order.id), db.func.max(Order.updated_at)
+    ).filter(
+        Order.created_at >= day_start,
+        Order.created_at < day_start + timedelta(days=1)
+    ).one()
+    return f"{count}:{last_update.isoformat() if last_update else ''}"
+
+
+def _store(kind, report_date, watermark, render):
+    """Render a report, put it in the report cache and record it as an artifact"""
+    started = time.perf_counter()
+    pdf = render().getvalue()
+    generation_ms = (time.perf_counter() - started) * 1000
+
+    key = PDFCache.make_key(kind, report_date, watermark)
+    path = get_report_cache().put(key, pdf)
+    if path is None:
+        return None, None
+
+    artifact = ReportArtifact.query.filter_by(kind=kind, report_date=report_date).first()
+    if artifact is None:
+        artifact = ReportArtifact(kind=kind, report_date=report_date)
+        db.session.add(artifact)
+    artifact.watermark = watermark
+    artifact.cache_key = key
+    artifact.size_bytes = len(pdf)
+    artifact.generation_ms = generation_ms
+    artifact.generated_at = datetime.utcnow()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another worker closed the same day at the same moment; its row is as good as ours
+        db.session.rollback()
+        artifact = ReportArtifact.query.filter_by(kind=kind, report_date=report_date).first()
+    return artifact, path
+
+
+def _stored(kind, report_date, watermark=None):
+    """The stored artifact and its file, if it exists and matches watermark"""
+    artifact = ReportArtifact.query.filter_by(kind=kind, report_date=report_date).first()
+    if artifact is None or (watermark is not None and artifact.watermark != watermark):
+        return None, None
+    path = get_report_cache().get(artifact.cache_key)
+    if path is None:
+        return None, None
+    return artifact, path
+
+
+def build_daily_sales_report(report_date, force=False):
+    """Prebuild the sales report of a day unless a current one is stored; returns (artifact, path, built)"""
+    from pdf_generator import SmartBillGenerator
+
+    watermark = sales_watermark(report_date)
+    if not force:
+        artifact, path = _stored(DAILY_SALES, report_date, watermark)
+        if artifact is not None:
+            return artifact, path, False
+
+    artifact, path = _store(
+        DAILY_SALES, report_date, watermark,
+        lambda: SmartBillGenerator().generate_daily_sales_report(report_date)
+    )
+    return artifact, path, True
+
+
+def build_inventory_snapshot(report_date, force=False):
+    """
+    Store the inventory report as it stands now as the snapshot of report_date.
+
+    Inventory has no history, so a snapshot can only be taken, never rebuilt
+    later: an existing one is kept unless force is set.
+    """
+    from pdf_generator import SmartBillGenerator
+
+    if not force:
+        artifact, path = _stored(INVENTORY, report_date)
+        if artifact is not None:
+            return artifact, path, False
+
+    artifact, path = _store(
+        INVENTORY, report_date, datetime.utcnow().isoformat(),
+        lambda: SmartBillGenerator().generate_inventory_report()
+    )
+    return artifact, path, True
+
+
+def close_day(report_date=None, force=False):
+    """
+    Prebuild the reports of a finished UTC day, yesterday by default.
+
+    Managers pull these at opening, so the work is done once ahead of time
+    instead of on the first busy requests of the morning.
+    """
+    report_date = report_date or utc_today() - timedelta(days=1)
+    results = {}
+    for kind, build in ((DAILY_SALES, build_daily_sales_report), (INVENTORY, build_inventory_snapshot)):
+        artifact, path, built = build(report_date, force=force)
+        results[kind] = {
+            'built': built,
+            'stored': artifact is not None,
+            'size_bytes': artifact.size_bytes if artifact else None,
+            'generation_ms': round(artifact.generation_ms, 1) if artifact and artifact.generation_ms else None,
+            'generated_at': artifact.generated_at.isoformat() if artifact else None
+        }
+    return {'date': report_date.isoformat(), 'reports': results}
+
+
+def daily_sales_report(report_date):
+    """
+    The sales report of a closed day as (artifact, path).
+
+    The stored report is served as long as none of the day's orders changed
+    since it was built; otherwise it is rebuilt and stored again. Returns
+    (None, None) for a day close_day never closed, so that day is rendered
+    live rather than stored, and if the report could not be stored.
+    """
+    if _stored(DAILY_SALES, report_date)[0] is None:
+        return None, None
+    artifact, path, _ = build_daily_sales_report(report_date)
+    return artifact, path
+
+
+def inventory_snapshot(report_date):
+    """The inventory snapshot taken when report_date was closed, as (artifact, path)"""
+    return _stored(INVENTORY, report_date)
+
+
+class DayCloseScheduler:
+    """
+    Close the previous UTC day once a day at a fixed UTC time, and purge
+    expired sessions and tokens while at it.
+
+    The thread is started on the first request rather than at import, so a
+    worker forked from a preloaded app starts its own. Every worker of a
+    deployment may run one; closing a day that another worker already closed
+    finds current artifacts and builds nothing.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.run_at = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        run_at = app.config.get('DAY_CLOSE_AT')
+        self.run_at = datetime.strptime(run_at, '%H:%M').time() if run_at else None
+        app.extensions['day_close_scheduler'] = self
+        if self.run_at is not None:
+            app.before_request(self.start)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name='day-close', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def next_run(self, now=None):
+        now = now or datetime.utcnow()
+        run = datetime.combine(now.date(), self.run_at)
+        return run if run > now else run + timedelta(days=1)
+
+    def _loop(self):
+        from jobs import job_runner
+        from purge import purge_expired
+
+        while True:
+            delay = (self.next_run() - datetime.utcnow()).total_seconds()
+            if self._stop.wait(delay):
+                return
+            report_date = utc_today() - timedelta(days=1)
+            try:
+                job_runner.submit(f'day-close:{report_date.isoformat()}', close_day, report_date)
+                job_runner.submit(
+                    'purge-expired', purge_expired,
+                    self.app.config['EXPIRED_ROW_RETENTION_HOURS']
+                )
+            except Exception:
+                logging.exception(f"Could not schedule the close of {report_date}")
+
+
+day_close_scheduler = DayCloseScheduler()
@@ -0,0 +1,134 @@
+import functools
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import sqlalchemy as sa
+from flask import current_app
+from flask_sqlalchemy.session import Session
+
+from cache import TTLCache
+
+REPLICA_BIND = 'replica'
+
+_replica_reads = ContextVar('replica_reads', default=False)
+# Last measured lag of each replica engine, refreshed at most every REPLICA_LAG_CHECK_INTERVAL
+_lag_cache = TTLCache(maxsize=8)
+
+
+class RoutingSession(Session):
+    """
+    Session that sends reads made inside replica_reads() to the replica bind.
+
+    Only SELECT statements are routed; flushes and explicit INSERT, UPDATE or
+    DELETE statements always go to the primary, so a replica block may still
+    write. Without a replica configured, or while the replica lags by more
+    than REPLICA_MAX_LAG seconds, everything goes to the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and _replica_reads.get() and not self._flushing
+                and isinstance(clause, (sa.Select, sa.CompoundSelect))):
+            engine = self._db.engines.get(REPLICA_BIND)
+            if engine is not None and replica_is_usable(engine):
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@contextmanager
+def replica_reads():
+    """Route the SELECTs of the block to the read replica"""
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def reads_from_replica(f):
+    """Decorator form of replica_reads()"""
+    @functools.wraps(f)
+    def decorated_function(*args, **kwargs):
+        with replica_reads():
+            return f(*args, **kwargs)
+    return decorated_function
+
+
+def replica_engine():
+    """The replica engine of the current app, or None if no replica is configured"""
+    from models import db
+    return db.engines.get(REPLICA_BIND)
+
+
+def measure_replica_lag(replica, primary):
+    """
+    How many seconds the replica is behind the primary.
+
+    A PostgreSQL standby reports the age of the last transaction it replayed,
+    or 0 when it has replayed everything it received. Other databases are
+    compared on the newest order update, which is how far behind the reports
+    would be.
+    """
+    if replica.dialect.name == 'postgresql':
+        with replica.connect() as conn:
+            lag = conn.execute(sa.text(
+                "SELECT CASE WHEN pg_is_in_recovery() AND pg_last_wal_receive_lsn() <> pg_last_wal_replay_lsn() "
+                "THEN EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) ELSE 0 END"
+            )).scalar()
+        return float(lag or 0)
+
+    from models import Order
+    query = sa.select(sa.func.max(Order.updated_at))
+    with primary.connect() as conn:
+        primary_latest = conn.execute(query).scalar()
+    with replica.connect() as conn:
+        replica_latest = conn.execute(query).scalar()
+    if primary_latest is None:
+        return 0.0
+    if replica_latest is None:
+        return float('inf')
+    return max((primary_latest - replica_latest).total_seconds(), 0.0)
+
+
+def replica_lag(engine=None, force=False):
+    """
+    Cached lag of the replica in seconds, None without a replica.
+
+    An unreachable replica counts as infinitely stale.
+    """
+    from models import db
+
+    engine = engine or replica_engine()
+    if engine is None:
+        return None
+
+    key = str(engine.url)
+    lag = None if force else _lag_cache.get(key)
+    if lag is None:
+        try:
+            lag = measure_replica_lag(engine, db.engines[None])
+        except sa.exc.SQLAlchemyError:
+            logging.exception("Could not measure the replica lag")
+            lag = float('inf')
+        _lag_cache.set(key, lag, ttl=current_app.config['REPLICA_LAG_CHECK_INTERVAL'])
+    return lag
+
+
+def replica_is_usable(engine=None):
+    lag = replica_lag(engine)
+    return lag is not None and lag <= current_app.config['REPLICA_MAX_LAG']
+
+
+def replica_status():
+    """Replica configuration and staleness, for the status endpoint"""
+    engine = replica_engine()
+    started = time.perf_counter()
+    lag = replica_lag(engine, force=True)
+    return {
+        'configured': engine is not None,
+        'lag_seconds': None if lag is None or lag == float('inf') else round(lag, 3),
+        'max_lag_seconds': current_app.config['REPLICA_MAX_LAG'],
+        'serving_reads': engine is not None and lag <= current_app.config['REPLICA_MAX_LAG'],
+        'check_ms': round((time.perf_counter() - started) * 1000, 2)
+    }
@@ -135,6 +135,7 @@ class RawProductForm(FlaskForm):
     cost_per_unit = DecimalField('Cost per Unit', validators=[DataRequired(), NumberRange(min=0)])
     supplier = StringField('Supplier', validators=[Optional(), Length(max=128)])
     supplier_contact = StringField('Supplier Contact', validators=[Optional(), Length(max=128)])
+    lead_time_days = IntegerField('Supplier Lead Time (days)', validators=[Optional(), NumberRange(min=0, max=365)], default=3)
     location = StringField('Storage Location', validators=[Optional(), Length(max=128)])
     current_stock = DecimalField('Current Stock', validators=[DataRequired(), NumberRange(min=0)])
     min_stock_level = DecimalField('Minimum Stock Level', validators=[DataRequired(), NumberRange(min=0)])
@@ -0,0 +1,45 @@
+"""
+Gunicorn settings for production:
+
+    gunicorn -c gunicorn.conf.py main:app
+
+Before forking the workers, the master runs `flask --app main init-db` once,
+so a fresh deployment gets its schema and admin user and an existing one
+gets the tables added since. Set GUNICORN_INIT_DB=0 to run it yourself.
+
+The app is loaded once in the master and the workers are forked from it, so
+they share its memory copy-on-write and start without importing anything.
+Set GUNICORN_PRELOAD_MODULES (e.g. "numpy,sklearn,scipy.sparse,reportlab")
+to also import the analytics and PDF libraries in the master, trading a
+slower master start for sharing them instead of each worker loading its
+own copy on first use.
+"""
+import gc
+import importlib
+import os
+import subprocess
+import sys
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+# Threaded workers, so open notification streams do not occupy a whole worker
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 32))
+# Code loaded in the master is not reloaded, so preloading is off by default with --reload
+_reload = '--reload' in sys.argv or '--reload' in os.environ.get('GUNICORN_CMD_ARGS', '')
+preload_app = os.environ.get('GUNICORN_PRELOAD', '0' if _reload else '1') == '1'
+
+
+def on_starting(server):
+    # In a separate process, so the master holds no database connections and, without
+    # preloading, does not import the app the workers are meant to load themselves
+    if os.environ.get('GUNICORN_INIT_DB', '1') == '1':
+        subprocess.run([sys.executable, '-m', 'flask', '--app', 'main', 'init-db'],
+                       cwd=server.cfg.chdir, check=True)
+
+
+def when_ready(server):
+    for module in filter(None, os.environ.get('GUNICORN_PRELOAD_MODULES', '').split(',')):
+        importlib.import_module(module.strip())
+    # Keep the garbage collector from touching, and so copying, the objects shared with the workers
+    gc.freeze()
@@ -0,0 +1,119 @@
+import multiprocessing
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, time
+
+from sqlalchemy.orm import joinedload, selectinload
+
+from models import Order, OrderItem
+from pdf_generator import invoice_data, invoice_cache_key, get_invoice_context, render_invoice_pdf
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_render_pool(workers):
+    """
+    Process pool shared by every invoice export of this worker.
+
+    ReportLab rendering is CPU-bound, so it runs in separate processes. The pool
+    is started lazily with the spawn method, which keeps a forked copy of the
+    web server's threads and connections out of the render processes.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def _discard_render_pool(pool):
+    """Drop a pool whose processes died so the next export starts a fresh one"""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+class _ZipStream:
+    """Write-only file object that hands written bytes back to a generator"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def export_orders(start_date, end_date):
+    """(id, order_number, updated_at) of every order created in the date range"""
+    return Order.query.with_entities(Order.id, Order.order_number, Order.updated_at).filter(
+        Order.created_at >= datetime.combine(start_date, time.min),
+        Order.created_at <= datetime.combine(end_date, time.max)
+    ).order_by(Order.created_at, Order.id).all()
+
+
+def stream_invoice_zip(start_date, end_date, cache, workers=2, chunk_size=100):
+    """
+    Yield a ZIP archive of the invoices of every order created in the date range.
+
+    Orders are handled chunk_size at a time: cached PDFs are copied straight into
+    the archive, the rest are rendered on the process pool, written as each one
+    finishes and stored in the cache. Only one chunk of PDFs is ever held in
+    memory, and the archive is streamed as it is built.
+    """
+    config = get_invoice_context().config
+    orders = export_orders(start_date, end_date)
+    pool = get_render_pool(workers) if orders else None
+    stream = _ZipStream()
+
+    with zipfile.ZipFile(stream, mode='w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for offset in range(0, len(orders), chunk_size):
+            chunk = orders[offset:offset + chunk_size]
+            misses = {}
+
+            for order_id, order_number, updated_at in chunk:
+                key = invoice_cache_key(order_id, updated_at, config)
+                path = cache.get(key)
+                if path:
+                    archive.write(path, f'invoice_{order_number}.pdf')
+                    yield stream.drain()
+                else:
+                    misses[order_id] = (key, order_number)
+
+            if not misses:
+                continue
+
+            full_orders = Order.query.options(
+                joinedload(Order.customer),
+                selectinload(Order.items).joinedload(OrderItem.product)
+            ).filter(Order.id.in_(misses)).all()
+            futures = {
+                pool.submit(render_invoice_pdf, invoice_data(order), config): order.id
+                for order in full_orders
+            }
+
+            for future in as_completed(futures):
+                key, order_number = misses[futures[future]]
+                try:
+                    pdf = future.result()
+                except BrokenProcessPool:
+                    _discard_render_pool(pool)
+                    raise
+                cache.put(key, pdf)
+                archive.writestr(f'invoice_{order_number}.pdf', pdf)
+                yield stream.drain()
+
+    yield stream.drain()
@@ -0,0 +1,271 @@
+import logging
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from itertools import chain
+
+from flask import has_request_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+class Job:
+    """A unit of background work tracked by the job runner"""
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+
+    def __init__(self, key):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.status = Job.QUEUED
+        self.created_at = datetime.utcnow()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+
+    @property
+    def is_active(self):
+        return self.status in (Job.QUEUED, Job.RUNNING)
+
+    @classmethod
+    def from_record(cls, record):
+        job = cls(record.key)
+        job.id = record.id
+        job.status = record.status
+        job.created_at = record.created_at
+        job.started_at = record.started_at
+        job.finished_at = record.finished_at
+        job.result = record.result
+        job.error = record.error
+        return job
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'key': self.key,
+            'status': self.status,
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'result': self.result,
+            'error': self.error
+        }
+
+
+class JobRunner:
+    """
+    Run long jobs on a thread pool instead of inside the request handler.
+
+    Jobs are identified by a key: submitting a key that already has a queued or
+    running job returns that job instead of starting a second one, and a key that
+    finished successfully within the cooldown window is not run again. That only
+    covers the jobs this worker process started, but the state of every job is
+    also recorded in the background_job table once it starts, so any worker
+    can report it.
+    """
+
+    def __init__(self, app=None, max_workers=1, history_size=100):
+        self.app = None
+        self.max_workers = max_workers
+        self.history_size = history_size
+        self._executor = None
+        self._jobs = OrderedDict()
+        self._latest = {}
+        self._deferred = {}
+        self._timers = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.max_workers = app.config.get('JOB_WORKERS', self.max_workers)
+        app.extensions['job_runner'] = self
+
+    def _get_executor(self):
+        # Created lazily so a forked worker never inherits the parent's threads
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='bakery-job')
+        return self._executor
+
+    def submit(self, key, func, *args, cooldown=0, trailing=False, **kwargs):
+        """
+        Queue func under key, returning (job, created).
+
+        With trailing, a submission turned away because the key's job is still
+        running or in its cooldown is not dropped: the job runs once more when
+        that has passed, however many submissions were turned away.
+        """
+        with self._lock:
+            latest = self._latest.get(key)
+            if latest is not None:
+                if latest.is_active:
+                    if trailing:
+                        # Started by _run once the running job has finished
+                        self._deferred[key] = (func, args, kwargs, cooldown)
+                    return latest, False
+                if (cooldown and latest.status == Job.SUCCEEDED
+                        and latest.finished_at >= datetime.utcnow() - timedelta(seconds=cooldown)):
+                    if trailing:
+                        self._deferred[key] = (func, args, kwargs, cooldown)
+                        if key not in self._timers:
+                            remaining = latest.finished_at + timedelta(seconds=cooldown) - datetime.utcnow()
+                            self._start_timer(key, remaining.total_seconds())
+                    return latest, False
+
+            job = Job(key)
+            self._jobs[job.id] = job
+            self._latest[key] = job
+            while len(self._jobs) > self.history_size:
+                old_id, old_job = next(iter(self._jobs.items()))
+                if old_job.is_active:
+                    break
+                self._jobs.pop(old_id)
+            executor = self._get_executor()
+
+        executor.submit(self._run, job, func, args, kwargs)
+        return job, True
+
+    def _run(self, job, func, args, kwargs):
+        job.status = Job.RUNNING
+        job.started_at = datetime.utcnow()
+        self._record(job)
+        try:
+            with self.app.app_context():
+                job.result = func(*args, **kwargs)
+            job.status = Job.SUCCEEDED
+        except Exception as e:
+            logging.exception(f"Background job {job.key} failed")
+            job.error = str(e)
+            job.status = Job.FAILED
+        finally:
+            job.finished_at = datetime.utcnow()
+            self._record(job)
+            with self._lock:
+                if job.key in self._deferred and job.key not in self._timers:
+                    cooldown = self._deferred[job.key][3]
+                    self._start_timer(job.key, cooldown if job.status == Job.SUCCEEDED else 0)
+
+    def _start_timer(self, key, delay):
+        # Called with the lock held; a little late rather than inside the cooldown
+        timer = threading.Timer(max(delay, 0) + 0.01, self._run_deferred, args=(key,))
+        timer.daemon = True
+        self._timers[key] = timer
+        timer.start()
+
+    def _run_deferred(self, key):
+        with self._lock:
+            self._timers.pop(key, None)
+            deferred = self._deferred.pop(key, None)
+        if deferred is not None:
+            func, args, kwargs, cooldown = deferred
+            self.submit(key, func, *args, cooldown=cooldown, trailing=True, **kwargs)
+
+    def _record(self, job):
+        """Store the job's state, on its own connection so no caller's transaction is involved"""
+        from models import db, BackgroundJob
+
+        table = BackgroundJob.__table__
+        values = {
+            'key': job.key, 'status': job.status, 'created_at': job.created_at, 'started_at': job.started_at,
+            'finished_at': job.finished_at, 'result': job.result, 'error': job.error
+        }
+        try:
+            with self.app.app_context(), db.engine.begin() as connection:
+                if connection.execute(table.update().where(table.c.id == job.id).values(values)).rowcount == 0:
+                    connection.execute(table.insert().values(id=job.id, **values))
+        except Exception:
+            logging.exception(f"Could not record the state of background job {job.key}")
+
+    def get(self, job_id):
+        """A job started by this process, or else the recorded state of one started by another"""
+        from models import db, BackgroundJob
+
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+        record = db.session.get(BackgroundJob, job_id)
+        return Job.from_record(record) if record is not None else None
+
+    def latest(self, key):
+        with self._lock:
+            return self._latest.get(key)
+
+
+job_runner = JobRunner()
+
+
+def refresh_insights():
+    """Refresh the rule-based insights"""
+    from flask import current_app
+    from utils import generate_ai_insights
+    import profiling
+
+    with profiling.profile_run('insights:refresh', track_memory=current_app.config['INSIGHT_PROFILE_MEMORY']) as run:
+        insights = generate_ai_insights()
+    return {'insight_count': len(insights), 'run_id': run.record.id if run.record else None}
+
+
+def regenerate_insights(force=False):
+    """Regenerate rule-based and machine learning insights with fresh data"""
+    from flask import current_app
+    from utils import generate_ai_insights
+    from ai_engine import SmartBakeryAI
+    import profiling
+
+    with profiling.profile_run('insights:regenerate', track_memory=current_app.config['INSIGHT_PROFILE_MEMORY']) as run:
+        insights = generate_ai_insights()
+        ai_engine = SmartBakeryAI()
+        ml_insights = ai_engine.generate_all_insights(force=force)
+    return {
+        'insight_count': len(insights) + len(ml_insights),
+        'analyses': ai_engine.last_run,
+        'run_id': run.record.id if run.record else None
+    }
+
+
+def refresh_recommendations(full=False):
+    """Rescore the stored product recommendations of customers whose orders changed"""
+    from flask import current_app
+    from recommendations import refresh_recommendations as refresh
+    import profiling
+
+    with profiling.profile_run('recommendations:refresh', track_memory=current_app.config['INSIGHT_PROFILE_MEMORY']) as run:
+        result = refresh(full=full)
+    result['run_id'] = run.record.id if run.record else None
+    return result
+
+
+@event.listens_for(Session, 'after_flush')
+def _note_order_changes(session, flush_context):
+    from models import Order, OrderItem
+
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, (Order, OrderItem)):
+            session.info['orders_changed'] = True
+            return
+
+
+@event.listens_for(Session, 'after_commit')
+def _refresh_recommendations_after_order_changes(session):
+    # New or changed orders move the recommendations; the job only rescores the customers concerned.
+    # Only orders changed through the web app queue it: scripts and CLI commands refresh themselves.
+    if session.info.pop('orders_changed', False) and job_runner.app is not None and has_request_context():
+        job_runner.submit(
+            'recommendations:refresh', refresh_recommendations,
+            cooldown=job_runner.app.config['RECOMMENDATION_REFRESH_COOLDOWN'], trailing=True
+        )
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _forget_order_changes(session, previous_transaction):
+    # A rolled back savepoint leaves the rest of the transaction to be committed
+    if previous_transaction.parent is None:
+        session.info.pop('orders_changed', None)
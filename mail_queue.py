@@ -0,0 +1,343 @@
+import atexit
+import logging
+import random
+import smtplib
+import threading
+import time
+from datetime import datetime, timedelta
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+import requests
+from sqlalchemy import event, update
+from sqlalchemy.orm import Session
+
+
+class PermanentMailError(Exception):
+    """The provider rejected the message for good; it is not retried"""
+
+
+class SMTPTransport:
+    """
+    Sends over one SMTP connection that is kept open between messages.
+
+    The connection is opened on the first send, reopened once if the server
+    dropped it, and closed after it has been idle for idle_timeout seconds.
+    """
+
+    name = 'smtp'
+
+    def __init__(self, host, port=587, username=None, password=None, starttls=True, sender=None,
+                 timeout=10, idle_timeout=60):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.sender = sender or username
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.connections_opened = 0
+        self._connection = None
+        self._last_used = 0
+
+    def _connect(self):
+        connection = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            connection.starttls()
+        if self.username and self.password:
+            connection.login(self.username, self.password)
+        self.connections_opened += 1
+        return connection
+
+    def send(self, recipient, subject, html_body):
+        msg = MIMEMultipart()
+        msg['From'] = self.sender
+        msg['To'] = recipient
+        msg['Subject'] = subject
+        msg.attach(MIMEText(html_body, 'html'))
+
+        for reconnect in (False, True):
+            if self._connection is None:
+                self._connection = self._connect()
+            try:
+                self._connection.sendmail(self.sender, [recipient], msg.as_string())
+                self._last_used = time.monotonic()
+                return
+            except smtplib.SMTPRecipientsRefused as e:
+                raise PermanentMailError(str(e.recipients)) from e
+            except smtplib.SMTPResponseException as e:
+                if e.smtp_code >= 500:
+                    raise PermanentMailError(f'{e.smtp_code} {e.smtp_error!r}') from e
+                raise
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                # The server closed the pooled connection; open a new one once
+                self.close()
+                if reconnect:
+                    raise
+
+    def close_if_idle(self):
+        if self._connection is not None and time.monotonic() - self._last_used > self.idle_timeout:
+            self.close()
+
+    def close(self):
+        connection, self._connection = self._connection, None
+        if connection is not None:
+            try:
+                connection.quit()
+            except (smtplib.SMTPException, OSError):
+                connection.close()
+
+
+class MailgunTransport:
+    """
+    Sends through the Mailgun HTTP API, reusing one HTTP session.
+
+    Only a rejected recipient address is a permanent failure. Other errors,
+    including a wrong API key or domain, raise so the next transport is tried
+    and the message is retried later.
+    """
+
+    name = 'mailgun'
+
+    def __init__(self, api_key, domain, timeout=10, api_url='https://api.mailgun.net/v3'):
+        self.domain = domain
+        self.timeout = timeout
+        self.api_url = api_url.rstrip('/')
+        self._http = requests.Session()
+        self._http.auth = ('api', api_key)
+
+    def send(self, recipient, subject, html_body):
+        response = self._http.post(f"{self.api_url}/{self.domain}/messages", timeout=self.timeout, data={
+            'from': f"BakeBrain <noreply@{self.domain}>",
+            'to': recipient,
+            'subject': subject,
+            'html': html_body
+        })
+        if response.status_code in (400, 422) and self._rejects_recipient(response):
+            raise PermanentMailError(f'Mailgun returned {response.status_code}: {response.text[:200]}')
+        response.raise_for_status()
+
+    @staticmethod
+    def _rejects_recipient(response):
+        try:
+            message = str(response.json().get('message', ''))
+        except ValueError:
+            message = response.text
+        return "'to'" in message or 'recipient' in message.lower()
+
+    def close_if_idle(self):
+        pass
+
+    def close(self):
+        self._http.close()
+
+
+class LogTransport:
+    """
+    Used when no provider is configured: the message is only logged, body
+    included, so one-time codes and reset links can still be read off the
+    log in development.
+    """
+
+    name = 'log'
+
+    def send(self, recipient, subject, html_body):
+        logging.warning(f"No mail transport configured; not sending '{subject}' to {recipient}")
+        logging.info(f"Unsent message to {recipient}:\n{html_body}")
+
+    def close_if_idle(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def build_transports(config):
+    """The configured providers in the order they are tried: Mailgun, then SMTP"""
+    transports = []
+    if config.get('MAILGUN_API_KEY') and config.get('MAILGUN_DOMAIN'):
+        transports.append(MailgunTransport(config['MAILGUN_API_KEY'], config['MAILGUN_DOMAIN'],
+                                           timeout=config.get('MAIL_TIMEOUT', 10),
+                                           api_url=config.get('MAILGUN_API_URL', 'https://api.mailgun.net/v3')))
+    if config.get('MAIL_SMTP_HOST'):
+        transports.append(SMTPTransport(
+            config['MAIL_SMTP_HOST'], config.get('MAIL_SMTP_PORT', 587),
+            username=config.get('MAIL_SMTP_USERNAME'), password=config.get('MAIL_SMTP_PASSWORD'),
+            starttls=config.get('MAIL_SMTP_STARTTLS', True), sender=config.get('MAIL_FROM'),
+            timeout=config.get('MAIL_TIMEOUT', 10), idle_timeout=config.get('MAIL_SMTP_IDLE_TIMEOUT', 60)
+        ))
+    return transports or [LogTransport()]
+
+
+class MailQueue:
+    """
+    Outbound mail, written to the outbound_email table by requests and sent
+    by a background thread.
+
+    Requests only insert a row. The worker wakes when a queued message is
+    committed, and otherwise checks for due messages every poll interval. It
+    claims each message by pushing its next attempt past a lease, so workers
+    of the same deployment never send a message twice and a message claimed
+    by a worker that died is picked up again once the lease runs out. Failed
+    sends are retried with exponential backoff until MAIL_MAX_ATTEMPTS.
+    """
+
+    def __init__(self, app=None, batch_size=50):
+        self.app = None
+        self.batch_size = batch_size
+        self._transports = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['mail_queue'] = self
+        app.before_request(self.start)
+        atexit.register(self.stop)
+
+    @property
+    def transports(self):
+        if self._transports is None:
+            self._transports = build_transports(self.app.config)
+        return self._transports
+
+    def reset_transports(self):
+        """Close the provider connections so they are rebuilt from the current config"""
+        transports, self._transports = self._transports, None
+        for transport in transports or ():
+            transport.close()
+
+    def enqueue(self, recipient, subject, html_body):
+        """Queue a message; it is sent by the worker once the session is committed"""
+        from models import db, OutboundEmail
+        from unit_of_work import unit_of_work
+
+        message = OutboundEmail(recipient=recipient, subject=subject, html_body=html_body)
+        db.session.add(message)
+        db.session.info['mail_queued'] = True
+        unit_of_work.commit()
+        return message
+
+    def wake(self):
+        self._wake.set()
+        self.start()
+
+    def _backoff(self, attempts):
+        config = self.app.config
+        delay = min(config['MAIL_RETRY_BASE_SECONDS'] * 2 ** (attempts - 1), config['MAIL_RETRY_MAX_SECONDS'])
+        return timedelta(seconds=delay + random.uniform(0, config['MAIL_RETRY_BASE_SECONDS']))
+
+    def _claim(self, now):
+        from models import db, OutboundEmail
+
+        due = db.session.query(OutboundEmail.id).filter(
+            OutboundEmail.status == 'pending', OutboundEmail.next_attempt_at <= now
+        ).order_by(OutboundEmail.next_attempt_at, OutboundEmail.id).limit(self.batch_size).all()
+        lease_until = now + timedelta(seconds=self.app.config['MAIL_CLAIM_LEASE_SECONDS'])
+        claimed = []
+        for (message_id,) in due:
+            result = db.session.execute(
+                update(OutboundEmail)
+                .where(OutboundEmail.id == message_id, OutboundEmail.status == 'pending',
+                       OutboundEmail.next_attempt_at <= now)
+                .values(next_attempt_at=lease_until, attempts=OutboundEmail.attempts + 1)
+            )
+            if result.rowcount == 1:
+                claimed.append(message_id)
+        db.session.commit()
+        return db.session.query(OutboundEmail).filter(OutboundEmail.id.in_(claimed)).order_by(OutboundEmail.id).all()
+
+    def _deliver(self, message):
+        errors = []
+        for transport in self.transports:
+            try:
+                transport.send(message.recipient, message.subject, message.html_body)
+                return None, False
+            except PermanentMailError as e:
+                return f'{transport.name}: {e}', True
+            except Exception as e:
+                errors.append(f'{transport.name}: {e}')
+        return '; '.join(errors), False
+
+    def drain(self):
+        """Send every due message; returns how many were sent, rescheduled and given up on"""
+        from models import db
+
+        stats = {'sent': 0, 'retried': 0, 'failed': 0}
+        with self._send_lock:
+            while True:
+                messages = self._claim(datetime.utcnow())
+                if not messages:
+                    break
+                for message in messages:
+                    error, permanent = self._deliver(message)
+                    if error is None:
+                        message.status = 'sent'
+                        message.sent_at = datetime.utcnow()
+                        message.last_error = None
+                        stats['sent'] += 1
+                    elif permanent or message.attempts >= self.app.config['MAIL_MAX_ATTEMPTS']:
+                        message.status = 'failed'
+                        message.last_error = error
+                        stats['failed'] += 1
+                        logging.error(f"Giving up on mail {message.id} to {message.recipient}: {error}")
+                    else:
+                        message.next_attempt_at = datetime.utcnow() + self._backoff(message.attempts)
+                        message.last_error = error
+                        stats['retried'] += 1
+                        logging.warning(f"Mail {message.id} to {message.recipient} failed, retrying: {error}")
+                    db.session.commit()
+        return stats
+
+    def start(self):
+        # With MAIL_QUEUE_WORKER off, mail is only sent by `flask send-mail`, e.g. from cron
+        if self._thread is not None or self.app is None or not self.app.config['MAIL_QUEUE_WORKER']:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name='mail-queue', daemon=True)
+                self._thread.start()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.app.config['MAIL_QUEUE_POLL_INTERVAL'])
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            try:
+                with self.app.app_context():
+                    self.drain()
+            except Exception:
+                logging.exception("Could not drain the mail queue")
+            with self._send_lock:
+                for transport in self.transports:
+                    transport.close_if_idle()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._transports is not None:
+            with self._send_lock:
+                self.reset_transports()
+
+
+mail_queue = MailQueue()
+
+
+@event.listens_for(Session, 'after_commit')
+def _wake_mail_queue(session):
+    if session.info.pop('mail_queued', False):
+        mail_queue.wake()
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _forget_queued_mail(session, previous_transaction):
+    # A rolled back savepoint leaves the rest of the transaction to be committed
+    if previous_transaction.parent is None:
+        session.info.pop('mail_queued', None)
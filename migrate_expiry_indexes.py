@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Migration script to index the expiry columns of sessions, OTPs and reset tokens
+"""
+
+import sqlite3
+import os
+
+def migrate_database():
+    """Add the indexes used by the expiry purge and the OTP lookup"""
+    
+    # Check if database exists
+    db_path = 'instance/bakery.db'
+    if not os.path.exists(db_path):
+        print("Database not found. Please run the application first to create the database.")
+        return
+    
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    
+    try:
+        print("Starting database migration...")
+        
+        tables = {row[0] for row in cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+        indexes = [
+            ('user_session', 'ix_user_session_expires_at', 'expires_at'),
+            ('email_verification', 'ix_email_verification_expires_at', 'expires_at'),
+            ('email_verification', 'ix_email_verification_email', 'email'),
+            ('password_reset', 'ix_password_reset_expires_at', 'expires_at'),
+        ]
+        
+        print("Creating indexes...")
+        for table, index, column in indexes:
+            if table not in tables:
+                # Created with its indexes when the application starts
+                print(f"  - Skipped {index}: table {table} does not exist yet")
+                continue
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {index} ON {table}({column})")
+            print(f"  - Created {index}")
+        
+        # Commit changes
+        conn.commit()
+        print("Migration completed successfully!")
+        
+    except Exception as e:
+        print(f"Error during migration: {e}")
+        conn.rollback()
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    migrate_database()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Migration script to add incremental AI insight recomputation
+"""
+
+import sqlite3
+import os
+
+def migrate_database():
+    """Add the watermark table and indexes on the columns analyses read"""
+    
+    # Check if database exists
+    db_path = 'instance/bakery.db'
+    if not os.path.exists(db_path):
+        print("Database not found. Please run the application first to create the database.")
+        return
+    
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    
+    try:
+        print("Starting database migration...")
+        
+        # Create insight_watermark table
+        print("Creating insight_watermark table...")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS insight_watermark (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                analysis VARCHAR(64) NOT NULL UNIQUE,
+                watermark VARCHAR(255) NOT NULL,
+                computed_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        print("  - Created insight_watermark table")
+        
+        # Indexes keep the MAX() watermark queries cheap
+        print("Creating indexes...")
+        cursor.execute('CREATE INDEX IF NOT EXISTS ix_order_updated_at ON "order"(updated_at)')
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_inventory_last_updated ON inventory(last_updated)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_raw_product_last_updated ON raw_product(last_updated)")
+        print("  - Created indexes")
+        
+        # Commit changes
+        conn.commit()
+        print("Migration completed successfully!")
+        
+    except Exception as e:
+        print(f"Error during migration: {e}")
+        conn.rollback()
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    migrate_database()
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Migration script to add supplier lead times to raw products
+"""
+
+import sqlite3
+import os
+
+def migrate_database():
+    """Add the lead_time_days column to raw_product"""
+    
+    # Check if database exists
+    db_path = 'instance/bakery.db'
+    if not os.path.exists(db_path):
+        print("Database not found. Please run the application first to create the database.")
+        return
+    
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    
+    try:
+        print("Starting database migration...")
+        
+        # Check if column already exists
+        cursor.execute("PRAGMA table_info(raw_product)")
+        columns = [column[1] for column in cursor.fetchall()]
+        
+        if 'lead_time_days' not in columns:
+            cursor.execute("ALTER TABLE raw_product ADD COLUMN lead_time_days INTEGER DEFAULT 3")
+            print("  - Added lead_time_days column")
+        
+        # Commit changes
+        conn.commit()
+        print("Migration completed successfully!")
+        
+    except Exception as e:
+        print(f"Error during migration: {e}")
+        conn.rollback()
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    migrate_database()
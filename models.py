@@ -7,16 +7,22 @@ import enum
 import secrets
 import string
 
+from db_routing import RoutingSession
+
 # Create a new SQLAlchemy instance
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+
+class InsufficientStock(Exception):
+    """A raw material has too little stock for the quantity being produced"""
 
 class EmailVerification(db.Model):
     __tablename__ = 'email_verification'
     id = db.Column(db.Integer, primary_key=True)
-    email = db.Column(db.String(120), nullable=False)
+    email = db.Column(db.String(120), nullable=False, index=True)
     otp = db.Column(db.String(6), nullable=False)
     is_used = db.Column(db.Boolean, default=False)
-    expires_at = db.Column(db.DateTime, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     @staticmethod
@@ -32,7 +38,7 @@ class PasswordReset(db.Model):
     email = db.Column(db.String(120), nullable=False)
     token = db.Column(db.String(64), nullable=False, unique=True)
     is_used = db.Column(db.Boolean, default=False)
-    expires_at = db.Column(db.DateTime, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     @staticmethod
@@ -43,9 +49,6 @@ class PasswordReset(db.Model):
         return datetime.utcnow() > self.expires_at
 
 
-# Create a new SQLAlchemy instance
-db = SQLAlchemy()
-
 class Role(db.Model):
     __tablename__ = 'role'
     id = db.Column(db.Integer, primary_key=True)
@@ -95,12 +98,55 @@ class Notification(db.Model):
 
     @staticmethod
     def create(user_id, message):
-        from app import db
+        from unit_of_work import unit_of_work
         notif = Notification(user_id=user_id, message=message)
         db.session.add(notif)
-        db.session.commit()
+        unit_of_work.commit()
         return notif
 
+    @staticmethod
+    def broadcast(message, role=None, user_ids=None):
+        """
+        Send the same notification to every active user with the given role
+        name (or list of role names), and/or to the given user ids.
+
+        Recipients are resolved with one query and all rows are written with
+        one bulk INSERT in a single transaction, then pushed to any open
+        notification streams after the commit. Returns the number sent.
+        """
+        from sqlalchemy import insert
+        from notifications import notification_payload
+        from unit_of_work import unit_of_work
+
+        if role is None and user_ids is None:
+            raise ValueError('broadcast needs a role or a list of user ids')
+        roles = [role] if isinstance(role, str) else role
+
+        criteria = []
+        if roles:
+            criteria.append(User.role_id.in_(db.session.query(Role.id).filter(Role.name.in_(roles))))
+        if user_ids:
+            criteria.append(User.id.in_(user_ids))
+        if not criteria:
+            return 0
+        recipients = [user_id for (user_id,) in db.session.query(User.id).filter(
+            User.active == True, db.or_(*criteria)
+        ).order_by(User.id)]
+        if not recipients:
+            return 0
+
+        now = datetime.utcnow()
+        created = db.session.scalars(
+            insert(Notification).returning(Notification),
+            [{'user_id': user_id, 'message': message, 'is_read': False, 'created_at': now} for user_id in recipients]
+        ).all()
+        # Bulk inserts skip the flush events, so queue the rows for publishing directly
+        db.session.info.setdefault('new_notifications', []).extend(
+            (db.session().get_nested_transaction(), notification_payload(n)) for n in created
+        )
+        unit_of_work.commit()
+        return len(created)
+
 
 class Category(db.Model):
     __tablename__ = 'category'
@@ -206,43 +252,48 @@ class Product(db.Model):
         return True
     
     def consume_raw_materials(self, quantity):
-        """Consume raw materials for the specified product quantity"""
+        """
+        Consume raw materials for the specified product quantity. Nothing is
+        consumed if any of them is short; returns whether it succeeded.
+        """
+        from unit_of_work import unit_of_work
+
         if not self.recipes:
             return True
         
         try:
-            for recipe in self.recipes:
-                required_raw_quantity = recipe.quantity_required * quantity
-                if recipe.raw_product.current_stock < required_raw_quantity:
-                    return False
-                
-                # Reduce raw material stock
-                recipe.raw_product.current_stock -= required_raw_quantity
-                recipe.raw_product.last_updated = datetime.utcnow()
-            
-            db.session.commit()
+            with unit_of_work.savepoint():
+                for recipe in self.recipes:
+                    required_raw_quantity = recipe.quantity_required * quantity
+                    if recipe.raw_product.current_stock < required_raw_quantity:
+                        raise InsufficientStock(recipe.raw_product.name)
+                    
+                    # Reduce raw material stock
+                    recipe.raw_product.current_stock -= required_raw_quantity
+                    recipe.raw_product.last_updated = datetime.utcnow()
+            unit_of_work.commit()
             return True
         except Exception as e:
-            db.session.rollback()
             return False
     
     def restore_raw_materials(self, quantity):
         """Restore raw materials for the specified product quantity (used when order is cancelled)"""
+        from unit_of_work import unit_of_work
+
         if not self.recipes:
             return True
         
         try:
-            for recipe in self.recipes:
-                required_raw_quantity = recipe.quantity_required * quantity
-                
-                # Restore raw material stock
-                recipe.raw_product.current_stock += required_raw_quantity
-                recipe.raw_product.last_updated = datetime.utcnow()
-            
-            db.session.commit()
+            with unit_of_work.savepoint():
+                for recipe in self.recipes:
+                    required_raw_quantity = recipe.quantity_required * quantity
+                    
+                    # Restore raw material stock
+                    recipe.raw_product.current_stock += required_raw_quantity
+                    recipe.raw_product.last_updated = datetime.utcnow()
+            unit_of_work.commit()
             return True
         except Exception as e:
-            db.session.rollback()
             return False
 
 
@@ -255,6 +306,7 @@ class RawProduct(db.Model):
     cost_per_unit = db.Column(db.Numeric(10, 2), nullable=False)
     supplier = db.Column(db.String(128))
     supplier_contact = db.Column(db.String(128))
+    lead_time_days = db.Column(db.Integer, default=3)  # Days between ordering and delivery
     location = db.Column(db.String(128), default='Storage')  # Storage location
     current_stock = db.Column(db.Numeric(10, 3), nullable=False, default=0)  # Allow decimal for precise measurements
     min_stock_level = db.Column(db.Numeric(10, 3), default=10)
@@ -262,7 +314,7 @@ class RawProduct(db.Model):
     expiry_date = db.Column(db.Date)
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    last_updated = db.Column(db.DateTime, default=datetime.utcnow)
+    last_updated = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     last_restocked = db.Column(db.DateTime)
     
     def is_low_stock(self):
@@ -310,7 +362,7 @@ class Inventory(db.Model):
     quantity = db.Column(db.Integer, nullable=False, default=0)
     min_stock_level = db.Column(db.Integer, default=10)
     max_stock_level = db.Column(db.Integer, default=100)
-    last_updated = db.Column(db.DateTime, default=datetime.utcnow)
+    last_updated = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     last_restocked = db.Column(db.DateTime)
     
     def is_low_stock(self):
@@ -346,7 +398,7 @@ class Order(db.Model):
     delivery_address = db.Column(db.Text)
     special_instructions = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
     # Catering specific fields
     event_date = db.Column(db.DateTime)
@@ -423,6 +475,134 @@ class AIInsight(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 
+class BackgroundJob(db.Model):
+    """State of a background job, so every worker process can report it"""
+    __tablename__ = 'background_job'
+    id = db.Column(db.String(32), primary_key=True)
+    key = db.Column(db.String(64), nullable=False, index=True)
+    status = db.Column(db.String(20), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime, index=True)
+    result = db.Column(db.JSON)
+    error = db.Column(db.Text)
+
+
+class InsightWatermark(db.Model):
+    """Newest input timestamps consumed by the last run of an AI analysis"""
+    __tablename__ = 'insight_watermark'
+    id = db.Column(db.Integer, primary_key=True)
+    analysis = db.Column(db.String(64), unique=True, nullable=False)
+    watermark = db.Column(db.String(255), nullable=False)
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class AnalysisRun(db.Model):
+    """Profile of one AI insight regeneration run"""
+    __tablename__ = 'analysis_run'
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(64), nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+    started_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    wall_ms = db.Column(db.Float)
+    cpu_ms = db.Column(db.Float)
+    sql_count = db.Column(db.Integer)
+    rows_read = db.Column(db.Integer)
+    peak_memory_kb = db.Column(db.Float)
+    error = db.Column(db.Text)
+    
+    # Relationships
+    stages = db.relationship('AnalysisStageMetric', backref='run', lazy=True,
+                             cascade='all, delete-orphan', order_by='AnalysisStageMetric.id')
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'status': self.status,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'wall_ms': self.wall_ms,
+            'cpu_ms': self.cpu_ms,
+            'sql_count': self.sql_count,
+            'rows_read': self.rows_read,
+            'peak_memory_kb': self.peak_memory_kb,
+            'error': self.error,
+            'stages': [stage.to_dict() for stage in self.stages]
+        }
+
+
+class AnalysisStageMetric(db.Model):
+    """Resource usage of one stage of an AnalysisRun"""
+    __tablename__ = 'analysis_stage_metric'
+    id = db.Column(db.Integer, primary_key=True)
+    run_id = db.Column(db.Integer, db.ForeignKey('analysis_run.id'), nullable=False, index=True)
+    stage = db.Column(db.String(64), nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+    wall_ms = db.Column(db.Float)
+    cpu_ms = db.Column(db.Float)
+    sql_count = db.Column(db.Integer)
+    rows_read = db.Column(db.Integer)
+    peak_memory_kb = db.Column(db.Float)
+    error = db.Column(db.Text)
+    
+    def to_dict(self):
+        return {
+            'stage': self.stage,
+            'status': self.status,
+            'wall_ms': self.wall_ms,
+            'cpu_ms': self.cpu_ms,
+            'sql_count': self.sql_count,
+            'rows_read': self.rows_read,
+            'peak_memory_kb': self.peak_memory_kb,
+            'error': self.error
+        }
+
+
+class ReportArtifact(db.Model):
+    """A report PDF prebuilt when a day was closed"""
+    __tablename__ = 'report_artifact'
+    __table_args__ = (db.UniqueConstraint('kind', 'report_date'),)
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(32), nullable=False)  # daily_sales, inventory
+    report_date = db.Column(db.Date, nullable=False)
+    watermark = db.Column(db.String(255), nullable=False)
+    cache_key = db.Column(db.String(64), nullable=False)
+    size_bytes = db.Column(db.Integer)
+    generation_ms = db.Column(db.Float)
+    generated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class CustomerRecommendation(db.Model):
+    """A product recommended to a customer, precomputed by the recommendation job"""
+    __tablename__ = 'customer_recommendation'
+    __table_args__ = (db.UniqueConstraint('customer_id', 'product_id'),)
+    id = db.Column(db.Integer, primary_key=True)
+    customer_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    rank = db.Column(db.Integer, nullable=False)
+    score = db.Column(db.Float, nullable=False)
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    product = db.relationship('Product')
+
+
+class OutboundEmail(db.Model):
+    """A message waiting in, or sent from, the outbound mail queue"""
+    __tablename__ = 'outbound_email'
+    __table_args__ = (db.Index('ix_outbound_email_status_next_attempt_at', 'status', 'next_attempt_at'),)
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    html_body = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(16), nullable=False, default='pending')  # pending, sent, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+
+
 class UserSession(db.Model):
     __tablename__ = 'user_session'
     id = db.Column(db.Integer, primary_key=True)
@@ -434,7 +614,7 @@ class UserSession(db.Model):
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     last_activity = db.Column(db.DateTime, default=datetime.utcnow)
-    expires_at = db.Column(db.DateTime)
+    expires_at = db.Column(db.DateTime, index=True)
     
     # Relationships
     user = db.relationship('User', backref=db.backref('sessions', lazy=True))
@@ -449,8 +629,17 @@ class UserSession(db.Model):
         return False
     
     def update_activity(self):
-        self.last_activity = datetime.utcnow()
-        db.session.commit()
+        """Record activity on this session; it is written by the next batched flush"""
+        from session_activity import session_activity
+        session_activity.touch(self.session_token)
+
+
+class ConfigurationVersion(db.Model):
+    """Single row counting configuration changes, so each process knows when to reload its cache"""
+    __tablename__ = 'configuration_version'
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 
 class Configuration(db.Model):
@@ -467,15 +656,15 @@ class Configuration(db.Model):
     
     @classmethod
     def get_value(cls, key, default=None):
-        """Get configuration value by key"""
-        config = cls.query.filter_by(key=key).first()
-        if config:
-            return config.get_typed_value()
-        return default
+        """Get configuration value by key, from this process's configuration cache"""
+        from config_cache import configuration_cache
+        return configuration_cache.get(key, default)
     
     @classmethod
     def set_value(cls, key, value, description=None, category='system', data_type='string'):
         """Set configuration value by key"""
+        from unit_of_work import unit_of_work
+
         config = cls.query.filter_by(key=key).first()
         if config:
             config.value = str(value)
@@ -492,8 +681,37 @@ class Configuration(db.Model):
                 data_type=data_type
             )
             db.session.add(config)
-        db.session.commit()
+        unit_of_work.commit()
         return config
+
+    @classmethod
+    def bulk_update(cls, values):
+        """
+        Set the values of existing, editable keys with one UPDATE and bump
+        the configuration version once. Returns the number of rows updated.
+
+        This is an update, not an upsert: keys without a row are skipped
+        without an error, as are read-only keys, so a caller sending keys
+        the form does not know cannot create configuration. Use set_value to
+        add a key.
+        """
+        from sqlalchemy import update
+        from config_cache import bump_configuration_version
+        from unit_of_work import unit_of_work
+
+        values = {key: str(value) for key, value in values.items()}
+        if not values:
+            return 0
+        result = db.session.execute(
+            update(cls)
+            .where(cls.key.in_(values), cls.is_editable == True)
+            .values(value=db.case(values, value=cls.key), updated_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount:
+            bump_configuration_version(db.session)
+        unit_of_work.commit()
+        return result.rowcount
     
     def get_typed_value(self):
         """Get value with proper type conversion"""
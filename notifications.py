@@ -0,0 +1,143 @@
+import queue
+import threading
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from cache import TTLCache
+
+
+def notification_payload(notification):
+    """The JSON shape of a notification, as returned by /api/notifications"""
+    return {
+        'id': notification.id,
+        'user_id': notification.user_id,
+        'message': notification.message,
+        'is_read': bool(notification.is_read),
+        'created_at': notification.created_at.strftime('%Y-%m-%d %H:%M')
+    }
+
+
+class NotificationHub:
+    """
+    In-process publish/subscribe of new notifications, plus unread counts.
+
+    Every open notification stream subscribes a queue for its user, and
+    committed notifications are put on the queues of their recipient. The
+    unread count pushed along with them is the one last counted in the
+    database for that user, kept up to date as notifications are published and
+    marked read. Both only cover this process: with several workers, a stream
+    hears about notifications written by its own worker, and a pushed count
+    can be stale until the browser next asks /api/notifications, which always
+    counts in the database.
+    """
+
+    def __init__(self, unread_ttl=300, maxsize=4096):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._unread = TTLCache(maxsize=maxsize, ttl=unread_ttl)
+
+    def init_app(self, app):
+        self._unread.ttl = app.config.get('NOTIFICATION_UNREAD_TTL', self._unread.ttl)
+        app.extensions['notification_hub'] = self
+
+    def subscribe(self, user_id, limit=None):
+        """A queue of the user's events, or None if this process already has `limit` listeners"""
+        listener = queue.Queue()
+        with self._lock:
+            if limit is not None and sum(len(listeners) for listeners in self._subscribers.values()) >= limit:
+                return None
+            self._subscribers.setdefault(user_id, set()).add(listener)
+        return listener
+
+    def unsubscribe(self, user_id, listener):
+        with self._lock:
+            listeners = self._subscribers.get(user_id)
+            if listeners is not None:
+                listeners.discard(listener)
+                if not listeners:
+                    del self._subscribers[user_id]
+
+    def listener_count(self, user_id=None):
+        with self._lock:
+            if user_id is not None:
+                return len(self._subscribers.get(user_id, ()))
+            return sum(len(listeners) for listeners in self._subscribers.values())
+
+    def _send(self, user_id, event_name, data):
+        with self._lock:
+            listeners = list(self._subscribers.get(user_id, ()))
+        for listener in listeners:
+            listener.put((event_name, data))
+
+    def publish(self, payloads):
+        """Count committed notifications as unread and push them to their recipients' streams"""
+        for payload in payloads:
+            user_id = payload['user_id']
+            with self._lock:
+                count = self._unread.get(user_id)
+                if count is not None and not payload['is_read']:
+                    count += 1
+                    self._unread.set(user_id, count)
+            self._send(user_id, 'notification', payload)
+            if count is not None:
+                self._send(user_id, 'unread', {'unread_count': count})
+
+    def unread_count(self, user_id):
+        """The user's unread notification count, counted in the database and kept for later pushes"""
+        from models import Notification
+        count = Notification.query.filter_by(user_id=user_id, is_read=False).count()
+        self._unread.set(user_id, count)
+        return count
+
+    def mark_all_read(self, user_id):
+        """Reset the count after the user's notifications were marked read, and tell their other tabs"""
+        self._unread.set(user_id, 0)
+        self._send(user_id, 'unread', {'unread_count': 0})
+
+    def forget(self, user_id=None):
+        """Drop cached counts, so no count is pushed until the next recount"""
+        if user_id is None:
+            self._unread.clear()
+        else:
+            self._unread.pop(user_id)
+
+
+notification_hub = NotificationHub()
+
+
+def _within(transaction, ancestor):
+    while transaction is not None:
+        if transaction is ancestor:
+            return True
+        transaction = transaction.parent
+    return False
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_new_notifications(session, flush_context):
+    from models import Notification
+    # Built here because the rows are expired and cannot be loaded once committed.
+    # Each is kept with the savepoint it was written in, in case that is rolled back.
+    transaction = session.get_nested_transaction()
+    payloads = [(transaction, notification_payload(obj)) for obj in session.new if isinstance(obj, Notification)]
+    if payloads:
+        session.info.setdefault('new_notifications', []).extend(payloads)
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_new_notifications(session):
+    payloads = session.info.pop('new_notifications', None)
+    if payloads:
+        notification_hub.publish([payload for _, payload in payloads])
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _forget_new_notifications(session, previous_transaction):
+    if previous_transaction.parent is None:
+        session.info.pop('new_notifications', None)
+    elif session.info.get('new_notifications'):
+        session.info['new_notifications'] = [
+            (transaction, payload) for transaction, payload in session.info['new_notifications']
+            if not _within(transaction, previous_transaction)
+        ]
@@ -0,0 +1,130 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+
+
+class PDFCache:
+    """
+    Content-addressed on-disk cache for generated PDFs.
+
+    Files are named after the hash of whatever determines their content, so a
+    changed order or configuration simply produces a new key and stale files age
+    out. The total size is bounded by evicting the least recently used files;
+    a hit refreshes the file's mtime, which is what the eviction orders by.
+    Writes go through a temporary file and an atomic rename, so several worker
+    processes can share one directory.
+    """
+
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # Running estimate of the directory size, so most writes skip the scan
+        self._size = None
+
+    @staticmethod
+    def make_key(*parts):
+        """Hash the values that determine a document's content into a cache key"""
+        material = json.dumps(parts, sort_keys=True, default=str)
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    def path_for(self, key):
+        return os.path.join(self.directory, key[:2], f'{key}.pdf')
+
+    def get(self, key):
+        """Return the path of a cached file, or None on a miss"""
+        path = self.path_for(key)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def put(self, key, data):
+        """Store data under key and return its path, or None if it could not be written"""
+        path = self.path_for(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            logging.exception(f"Could not write {path} to the PDF cache")
+            return None
+
+        with self._lock:
+            if self._size is not None:
+                self._size += len(data)
+            needs_scan = self._size is None or self._size > self.max_bytes
+        if needs_scan:
+            self.evict()
+        return path
+
+    def evict(self):
+        """Delete least recently used files until the cache fits in max_bytes"""
+        with self._lock:
+            entries = []
+            total = 0
+            for shard in _scandir(self.directory):
+                if not shard.is_dir():
+                    continue
+                for entry in _scandir(shard.path):
+                    if not entry.name.endswith('.pdf'):
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+
+            if total <= self.max_bytes:
+                self._size = total
+                return 0
+
+            removed = 0
+            for mtime, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    # Another worker evicted it first
+                    pass
+                total -= size
+                removed += 1
+            self._size = total
+            return removed
+
+
+def _scandir(path):
+    try:
+        return list(os.scandir(path))
+    except OSError:
+        return []
+
+
+def get_invoice_cache():
+    """The invoice cache configured on the current app"""
+    from flask import current_app
+
+    cache = current_app.extensions.get('invoice_cache')
+    if cache is None:
+        cache = PDFCache(current_app.config['INVOICE_CACHE_DIR'], current_app.config['INVOICE_CACHE_MAX_BYTES'])
+        current_app.extensions['invoice_cache'] = cache
+    return cache
+
+
+def get_report_cache():
+    """The cache of prebuilt report PDFs configured on the current app"""
+    from flask import current_app
+
+    cache = current_app.extensions.get('report_cache')
+    if cache is None:
+        cache = PDFCache(current_app.config['REPORT_CACHE_DIR'], current_app.config['REPORT_CACHE_MAX_BYTES'])
+        current_app.extensions['report_cache'] = cache
+    return cache
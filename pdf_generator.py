@@ -3,65 +3,309 @@ from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph,
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib import colors
 from reportlab.lib.units import inch
-from reportlab.graphics.shapes import Drawing, Rect
+from reportlab.lib.utils import simpleSplit
+from reportlab.graphics.shapes import Drawing, Rect, String
 from reportlab.graphics import renderPDF
 from datetime import datetime
 import io
 import os
+import threading
 from models import Order, OrderItem, User, Product, Configuration
+from pdf_cache import PDFCache
+from db_routing import reads_from_replica
+from config_cache import configuration_cache
 
-class SmartBillGenerator:
-    """Advanced PDF bill generation with professional formatting"""
+# Configuration keys printed on invoices, with the defaults used when unset
+INVOICE_CONFIG_DEFAULTS = {
+    'company_name': 'Smart Bakery Manager',
+    'company_tagline': 'Premium Artisan Bakery',
+    'company_address': '123 Baker Street, Bakery District',
+    'company_phone': '(555) 123-BAKE',
+    'company_email': 'orders@smartbakery.com',
+    'invoice_prefix': 'INV',
+    'currency_symbol': '$',
+    'invoice_footer': 'Thank you for choosing Smart Bakery Manager!',
+}
+
+
+def load_invoice_config():
+    """Every invoice-related configuration value, from the configuration cache"""
+    return {**INVOICE_CONFIG_DEFAULTS, **configuration_cache.values(INVOICE_CONFIG_DEFAULTS)}
+
+
+def invoice_data(order):
+    """Plain, picklable snapshot of everything printed on an order's invoice"""
+    return {
+        'order_number': order.order_number,
+        'created_at': order.created_at,
+        'order_type': order.order_type.value,
+        'status': order.status.value,
+        'customer_name': f"{order.customer.first_name} {order.customer.last_name}",
+        'delivery_date': order.delivery_date,
+        'delivery_address': order.delivery_address,
+        'total_amount': order.total_amount,
+        'tax_amount': order.tax_amount,
+        'discount_amount': order.discount_amount,
+        'event_date': order.event_date,
+        'guest_count': order.guest_count,
+        'setup_requirements': order.setup_requirements,
+        'items': [{
+            'product_name': item.product.name,
+            'quantity': item.quantity,
+            'unit_price': item.unit_price,
+            'total_price': item.total_price,
+            'special_instructions': item.special_instructions
+        } for item in order.items]
+    }
+
+
+def invoice_cache_key(order_id, updated_at, config):
+    """Cache key of an invoice, covering everything that changes its content"""
+    return PDFCache.make_key('invoice', order_id, updated_at, config)
+
+
+def render_invoice_pdf(invoice, config):
+    """
+    Render invoice data to PDF bytes.
+
+    This is what the export process pool runs, so it only takes plain data and
+    renders with the process's long-lived context.
+    """
+    return get_invoice_context().render(invoice, config).getvalue()
+
+
+def get_cached_invoice(order, cache):
+    """
+    Return (etag, file) for an order's invoice, rendering it only on a cache miss.
+
+    The cache key covers the order, its last update and the invoice configuration,
+    so any change to them produces a fresh render. file is a path on disk, or an
+    in-memory buffer if the cache could not be written.
+    """
+    context = get_invoice_context()
+    config = context.config
+    key = invoice_cache_key(order.id, order.updated_at, config)
+    path = cache.get(key)
+    if path:
+        return key, path
+    
+    buffer = context.render(invoice_data(order), config)
+    return key, cache.put(key, buffer.getvalue()) or buffer
+
+
+def add_custom_styles(styles):
+    """Create custom styles for professional invoices"""
+    styles.add(ParagraphStyle(
+        name='CompanyHeader',
+        parent=styles['Heading1'],
+        fontSize=24,
+        textColor=colors.HexColor('#2563eb'),
+        spaceAfter=10,
+        alignment=1  # Center
+    ))
+    
+    styles.add(ParagraphStyle(
+        name='InvoiceTitle',
+        parent=styles['Heading2'],
+        fontSize=18,
+        textColor=colors.HexColor('#1f2937'),
+        spaceAfter=20
+    ))
+    
+    styles.add(ParagraphStyle(
+        name='SectionHeader',
+        parent=styles['Normal'],
+        fontSize=12,
+        textColor=colors.HexColor('#374151'),
+        fontName='Helvetica-Bold',
+        spaceAfter=8
+    ))
+    
+    styles.add(ParagraphStyle(
+        name='DetailText',
+        parent=styles['Normal'],
+        fontSize=10,
+        textColor=colors.HexColor('#6b7280'),
+        spaceAfter=4
+    ))
+
+
+# Invoice table styles never change, so they are compiled once per process
+DETAILS_TABLE_STYLE = TableStyle([
+    ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+    ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
+    ('FONTSIZE', (0, 0), (-1, -1), 10),
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+])
+
+ITEMS_TABLE_STYLE = TableStyle([
+    # Header styling
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#f3f4f6')),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.HexColor('#111827')),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 11),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    
+    # Content styling
+    ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+    ('FONTSIZE', (0, 1), (-1, -1), 10),
+    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f9fafb')]),
+    
+    # Alignment
+    ('ALIGN', (1, 1), (-1, -1), 'RIGHT'),
+    ('ALIGN', (0, 0), (0, -1), 'LEFT'),
+    
+    # Borders
+    ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#e5e7eb')),
+    ('LINEBELOW', (0, 0), (-1, 0), 2, colors.HexColor('#d1d5db')),
+    
+    # Padding
+    ('TOPPADDING', (0, 1), (-1, -1), 8),
+    ('BOTTOMPADDING', (0, 1), (-1, -1), 8),
+    ('LEFTPADDING', (0, 0), (-1, -1), 10),
+    ('RIGHTPADDING', (0, 0), (-1, -1), 10),
+])
+
+SUMMARY_TABLE_STYLE = TableStyle([
+    ('FONTNAME', (0, 0), (-1, -2), 'Helvetica'),
+    ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -2), 10),
+    ('FONTSIZE', (0, -1), (-1, -1), 14),
+    ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
+    ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#dbeafe')),
+    ('TEXTCOLOR', (0, -1), (-1, -1), colors.HexColor('#1e40af')),
+    ('LINEABOVE', (0, -1), (-1, -1), 2, colors.HexColor('#3b82f6')),
+    ('TOPPADDING', (0, -1), (-1, -1), 12),
+    ('BOTTOMPADDING', (0, -1), (-1, -1), 12),
+])
+
+
+REPORT_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#f3f4f6')),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.HexColor('#111827')),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 10),
+    ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+    ('FONTSIZE', (0, 1), (-1, -1), 9),
+    ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#e5e7eb')),
+    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f9fafb')]),
+    ('ALIGN', (1, 0), (-1, -1), 'RIGHT'),
+])
+
+INVENTORY_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#f3f4f6')),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.HexColor('#111827')),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 10),
+    ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+    ('FONTSIZE', (0, 1), (-1, -1), 9),
+    ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#e5e7eb')),
+    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f9fafb')]),
+    ('ALIGN', (1, 1), (-1, -1), 'CENTER'),
+    ('ALIGN', (-1, 1), (-1, -1), 'RIGHT'),
+])
+
+
+class LazyStory(list):
+    """
+    Flowable list that pulls more flowables from an iterator as it is consumed.
+
+    A document build only ever looks at the front of its flowable list, so
+    topping it up a couple of flowables at a time keeps large reports from
+    materialising every table before layout starts.
+    """
+    
+    def __init__(self, flowables, more=()):
+        super().__init__(flowables)
+        self._more = iter(more)
+
+    # This relies on how ReportLab's BaseDocTemplate.build walks the story: it
+    # loops on `while len(flowables):` and handle_flowable pops flowables[0],
+    # putting the rest of a split table back at the front. Topping up in
+    # __len__ therefore refills the list before every step. Were build to
+    # iterate over or copy the list instead, only the flowables pulled in so
+    # far would be laid out; test_inventory_report.py checks every table lands.
+    def __len__(self):
+        while self._more is not None and list.__len__(self) < 2:
+            try:
+                self.append(next(self._more))
+            except StopIteration:
+                self._more = None
+        return list.__len__(self)
+
+
+def _text_block(width, rows):
+    """
+    Lay out lines of text once as a Drawing that many invoices can reuse.
+
+    rows are (text, font, size, color, centered, space_after); text is wrapped to
+    the given width up front because a Drawing does not wrap on its own.
+    """
+    lines = []
+    height = 0
+    for text, font, size, color, centered, space_after in rows:
+        for line in simpleSplit(str(text), font, size, width):
+            height += size * 1.2
+            lines.append((height, line, font, size, color, centered))
+        height += space_after
+    
+    drawing = Drawing(width, height)
+    for offset, line, font, size, color, centered in lines:
+        drawing.add(String(
+            width / 2 if centered else 0, height - offset + size * 0.2, line,
+            fontName=font, fontSize=size, fillColor=color,
+            textAnchor='middle' if centered else 'start'
+        ))
+    return drawing
+
+
+class InvoiceRenderContext:
+    """
+    Long-lived invoice renderer, kept once per process.
+
+    It holds the compiled styles and the company header and footer prebuilt as
+    drawings, so an invoice render only has to lay out the order's own tables.
+    The invoice configuration is read from the configuration cache, and the
+    drawings are rebuilt when it changes.
+    """
     
     def __init__(self):
         self.styles = getSampleStyleSheet()
-        self.setup_custom_styles()
+        add_custom_styles(self.styles)
+        self.frame_width = A4[0] - 144
+        self._chrome_config = None
+        self._header = None
+        self._footer = None
+        self._lock = threading.Lock()
     
-    def setup_custom_styles(self):
-        """Create custom styles for professional invoices"""
-        self.styles.add(ParagraphStyle(
-            name='CompanyHeader',
-            parent=self.styles['Heading1'],
-            fontSize=24,
-            textColor=colors.HexColor('#2563eb'),
-            spaceAfter=10,
-            alignment=1  # Center
-        ))
-        
-        self.styles.add(ParagraphStyle(
-            name='InvoiceTitle',
-            parent=self.styles['Heading2'],
-            fontSize=18,
-            textColor=colors.HexColor('#1f2937'),
-            spaceAfter=20
-        ))
-        
-        self.styles.add(ParagraphStyle(
-            name='SectionHeader',
-            parent=self.styles['Normal'],
-            fontSize=12,
-            textColor=colors.HexColor('#374151'),
-            fontName='Helvetica-Bold',
-            spaceAfter=8
-        ))
-        
-        self.styles.add(ParagraphStyle(
-            name='DetailText',
-            parent=self.styles['Normal'],
-            fontSize=10,
-            textColor=colors.HexColor('#6b7280'),
-            spaceAfter=4
-        ))
+    @property
+    def config(self):
+        """The current invoice configuration"""
+        return load_invoice_config()
     
-    def get_config_value(self, key, default=None):
-        """Get configuration value from database"""
-        return Configuration.get_value(key, default)
+    def _chrome(self, config):
+        """Header and footer drawings for config, rebuilt only when it changes"""
+        with self._lock:
+            if self._chrome_config != config:
+                detail_color = colors.HexColor('#6b7280')
+                self._header = _text_block(self.frame_width, [
+                    (config['company_name'], 'Helvetica-Bold', 24, colors.HexColor('#2563eb'), True, 10),
+                    (config['company_tagline'], 'Helvetica', 10, detail_color, False, 4),
+                    (config['company_address'], 'Helvetica', 10, detail_color, False, 4),
+                    (f"Phone: {config['company_phone']} | Email: {config['company_email']}", 'Helvetica', 10, detail_color, False, 4),
+                ])
+                self._footer = _text_block(self.frame_width, [
+                    (config['invoice_footer'], 'Helvetica', 10, detail_color, False, 4),
+                    (f"Questions? Contact us at {config['company_email']}", 'Helvetica', 10, detail_color, False, 4),
+                ])
+                self._chrome_config = dict(config)
+            return self._header, self._footer
     
-    def generate_invoice_pdf(self, order_id):
-        """Generate a professional invoice PDF"""
-        order = Order.query.get(order_id)
-        if not order:
-            return None
+    def render(self, invoice, config=None):
+        """Render an invoice from invoice_data(), using the snapshot unless config is given"""
+        config = self.config if config is None else config
+        header, footer = self._chrome(config)
         
         # Create PDF buffer
         buffer = io.BytesIO()
@@ -72,45 +316,29 @@ class SmartBillGenerator:
         # Build the invoice content
         story = []
         
-        # Header with company info from configuration
-        company_name = self.get_config_value('company_name', 'Smart Bakery Manager')
-        company_tagline = self.get_config_value('company_tagline', 'Premium Artisan Bakery')
-        company_address = self.get_config_value('company_address', '123 Baker Street, Bakery District')
-        company_phone = self.get_config_value('company_phone', '(555) 123-BAKE')
-        company_email = self.get_config_value('company_email', 'orders@smartbakery.com')
-        
-        story.append(Paragraph(company_name, self.styles['CompanyHeader']))
-        story.append(Paragraph(company_tagline, self.styles['DetailText']))
-        story.append(Paragraph(company_address, self.styles['DetailText']))
-        story.append(Paragraph(f"Phone: {company_phone} | Email: {company_email}", self.styles['DetailText']))
+        # Prebuilt company header
+        story.append(header)
         story.append(Spacer(1, 20))
         
-        # Invoice header with configurable prefix
-        invoice_prefix = self.get_config_value('invoice_prefix', 'INV')
-        story.append(Paragraph(f"INVOICE #{order.order_number}", self.styles['InvoiceTitle']))
+        # Invoice header
+        story.append(Paragraph(f"INVOICE #{invoice['order_number']}", self.styles['InvoiceTitle']))
         
         # Invoice details table
         invoice_details = [
-            ['Invoice Date:', order.created_at.strftime('%B %d, %Y')],
-            ['Order Type:', order.order_type.value.title()],
-            ['Status:', order.status.value.replace('_', ' ').title()],
-            ['Customer:', f"{order.customer.first_name} {order.customer.last_name}"]
+            ['Invoice Date:', invoice['created_at'].strftime('%B %d, %Y')],
+            ['Order Type:', invoice['order_type'].title()],
+            ['Status:', invoice['status'].replace('_', ' ').title()],
+            ['Customer:', invoice['customer_name']]
         ]
         
-        if order.delivery_date:
-            invoice_details.append(['Delivery Date:', order.delivery_date.strftime('%B %d, %Y')])
+        if invoice['delivery_date']:
+            invoice_details.append(['Delivery Date:', invoice['delivery_date'].strftime('%B %d, %Y')])
         
-        if order.delivery_address:
-            invoice_details.append(['Delivery Address:', order.delivery_address])
+        if invoice['delivery_address']:
+            invoice_details.append(['Delivery Address:', invoice['delivery_address']])
         
         details_table = Table(invoice_details, colWidths=[2*inch, 3*inch])
-        details_table.setStyle(TableStyle([
-            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-            ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-        ]))
+        details_table.setStyle(DETAILS_TABLE_STYLE)
         
         story.append(details_table)
         story.append(Spacer(1, 30))
@@ -119,157 +347,214 @@ class SmartBillGenerator:
         story.append(Paragraph("Order Items", self.styles['SectionHeader']))
         
         # Get currency symbol from configuration
-        currency_symbol = self.get_config_value('currency_symbol', '$')
+        currency_symbol = config['currency_symbol']
         
         # Prepare items data
         items_data = [['Description', 'Qty', 'Unit Price', 'Total']]
         
-        for item in order.items:
+        for item in invoice['items']:
             items_data.append([
-                item.product.name,
-                str(item.quantity),
-                f"{currency_symbol}{item.unit_price:.2f}",
-                f"{currency_symbol}{item.total_price:.2f}"
+                item['product_name'],
+                str(item['quantity']),
+                f"{currency_symbol}{item['unit_price']:.2f}",
+                f"{currency_symbol}{item['total_price']:.2f}"
             ])
         
         # Add special instructions if any
-        for item in order.items:
-            if item.special_instructions:
+        for item in invoice['items']:
+            if item['special_instructions']:
                 items_data.append([
-                    f"  → {item.special_instructions}",
+                    f"  → {item['special_instructions']}",
                     '', '', ''
                 ])
         
         # Create items table
         items_table = Table(items_data, colWidths=[3*inch, 0.8*inch, 1*inch, 1*inch])
-        items_table.setStyle(TableStyle([
-            # Header styling
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#f3f4f6')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.HexColor('#111827')),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 11),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            
-            # Content styling
-            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 1), (-1, -1), 10),
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f9fafb')]),
-            
-            # Alignment
-            ('ALIGN', (1, 1), (-1, -1), 'RIGHT'),
-            ('ALIGN', (0, 0), (0, -1), 'LEFT'),
-            
-            # Borders
-            ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#e5e7eb')),
-            ('LINEBELOW', (0, 0), (-1, 0), 2, colors.HexColor('#d1d5db')),
-            
-            # Padding
-            ('TOPPADDING', (0, 1), (-1, -1), 8),
-            ('BOTTOMPADDING', (0, 1), (-1, -1), 8),
-            ('LEFTPADDING', (0, 0), (-1, -1), 10),
-            ('RIGHTPADDING', (0, 0), (-1, -1), 10),
-        ]))
+        items_table.setStyle(ITEMS_TABLE_STYLE)
         
         story.append(items_table)
         story.append(Spacer(1, 20))
         
         # Calculations
-        subtotal = order.total_amount - order.tax_amount + order.discount_amount
+        total_amount = invoice['total_amount']
+        tax_amount = invoice['tax_amount']
+        discount_amount = invoice['discount_amount']
+        subtotal = total_amount - tax_amount + discount_amount
         
         # Summary table
         summary_data = [
             ['Subtotal:', f"{currency_symbol}{subtotal:.2f}"],
         ]
         
-        if order.discount_amount > 0:
-            summary_data.append(['Discount:', f"-{currency_symbol}{order.discount_amount:.2f}"])
+        if discount_amount > 0:
+            summary_data.append(['Discount:', f"-{currency_symbol}{discount_amount:.2f}"])
         
         summary_data.extend([
-            ['Tax:', f"{currency_symbol}{order.tax_amount:.2f}"],
+            ['Tax:', f"{currency_symbol}{tax_amount:.2f}"],
             ['', ''],  # Spacer row
-            ['TOTAL:', f"{currency_symbol}{order.total_amount:.2f}"]
+            ['TOTAL:', f"{currency_symbol}{total_amount:.2f}"]
         ])
         
         summary_table = Table(summary_data, colWidths=[4*inch, 1.2*inch])
-        summary_table.setStyle(TableStyle([
-            ('FONTNAME', (0, 0), (-1, -2), 'Helvetica'),
-            ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -2), 10),
-            ('FONTSIZE', (0, -1), (-1, -1), 14),
-            ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
-            ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#dbeafe')),
-            ('TEXTCOLOR', (0, -1), (-1, -1), colors.HexColor('#1e40af')),
-            ('LINEABOVE', (0, -1), (-1, -1), 2, colors.HexColor('#3b82f6')),
-            ('TOPPADDING', (0, -1), (-1, -1), 12),
-            ('BOTTOMPADDING', (0, -1), (-1, -1), 12),
-        ]))
+        summary_table.setStyle(SUMMARY_TABLE_STYLE)
         
         story.append(summary_table)
         story.append(Spacer(1, 30))
         
         # Special notes for catering orders
-        if order.order_type.value == 'catering':
+        if invoice['order_type'] == 'catering':
             story.append(Paragraph("Event Details", self.styles['SectionHeader']))
-            if order.event_date:
-                story.append(Paragraph(f"Event Date: {order.event_date.strftime('%B %d, %Y at %I:%M %p')}", self.styles['DetailText']))
-            if order.guest_count:
-                story.append(Paragraph(f"Guest Count: {order.guest_count}", self.styles['DetailText']))
-            if order.setup_requirements:
-                story.append(Paragraph(f"Setup Requirements: {order.setup_requirements}", self.styles['DetailText']))
+            if invoice['event_date']:
+                story.append(Paragraph(f"Event Date: {invoice['event_date'].strftime('%B %d, %Y at %I:%M %p')}", self.styles['DetailText']))
+            if invoice['guest_count']:
+                story.append(Paragraph(f"Guest Count: {invoice['guest_count']}", self.styles['DetailText']))
+            if invoice['setup_requirements']:
+                story.append(Paragraph(f"Setup Requirements: {invoice['setup_requirements']}", self.styles['DetailText']))
             story.append(Spacer(1, 20))
         
-        # Footer with configurable text
-        invoice_footer = self.get_config_value('invoice_footer', 'Thank you for choosing Smart Bakery Manager!')
-        support_email = self.get_config_value('company_email', 'support@smartbakery.com')
-        
+        # Prebuilt footer with configurable text
         story.append(Spacer(1, 20))
-        story.append(Paragraph(invoice_footer, self.styles['DetailText']))
-        story.append(Paragraph(f"Questions? Contact us at {support_email}", self.styles['DetailText']))
+        story.append(footer)
         
         # Build PDF
         doc.build(story)
         buffer.seek(0)
         return buffer
+
+
+_context = None
+_context_lock = threading.Lock()
+
+
+def get_invoice_context():
+    """The invoice render context of this process"""
+    global _context
+    with _context_lock:
+        if _context is None:
+            _context = InvoiceRenderContext()
+        return _context
+
+
+class SmartBillGenerator:
+    """Advanced PDF bill generation with professional formatting"""
+    
+    def __init__(self):
+        self.styles = getSampleStyleSheet()
+        self.setup_custom_styles()
+    
+    def setup_custom_styles(self):
+        """Create custom styles for professional invoices"""
+        add_custom_styles(self.styles)
+    
+    def get_config_value(self, key, default=None):
+        """Get configuration value from database"""
+        return Configuration.get_value(key, default)
+    
+    def generate_invoice_pdf(self, order_id):
+        """Generate a professional invoice PDF"""
+        order = Order.query.get(order_id)
+        if not order:
+            return None
+        
+        return get_invoice_context().render(invoice_data(order))
     
     def generate_daily_sales_report(self, date):
         """Generate daily sales report PDF"""
-        buffer = io.BytesIO()
+        return self.generate_sales_report(date, date, f"Daily Sales Report - {date.strftime('%B %d, %Y')}")
+    
+    @staticmethod
+    def _sales_report_criteria(start_date, end_date):
+        """Filters for the orders of an inclusive date range, and for those of them that were not cancelled"""
+        from models import OrderStatus
+        
+        in_range = (
+            Order.created_at >= datetime.combine(start_date, datetime.min.time()),
+            Order.created_at <= datetime.combine(end_date, datetime.max.time())
+        )
+        return in_range, in_range + (Order.status != OrderStatus.CANCELLED,)
+    
+    @reads_from_replica
+    def sales_report_figures(self, start_date, end_date):
+        """
+        The summary figures of a sales report: order counts per status, totals,
+        and, for a range of several days, the orders and revenue of each day.
+        """
+        from models import db, OrderStatus
+        
+        in_range, sold = self._sales_report_criteria(start_date, end_date)
+        status_rows = db.session.query(
+            Order.status,
+            db.func.count(Order.id),
+            db.func.coalesce(db.func.sum(Order.total_amount), 0)
+        ).filter(*in_range).group_by(Order.status).all()
+        
+        total_orders = sum(count for status, count, amount in status_rows)
+        cancelled_orders = sum(count for status, count, amount in status_rows if status == OrderStatus.CANCELLED)
+        sold_orders = total_orders - cancelled_orders
+        total_revenue = sum(float(amount) for status, count, amount in status_rows if status != OrderStatus.CANCELLED)
+        
+        daily_rows = []
+        if start_date != end_date:
+            day = db.func.date(Order.created_at)
+            daily_rows = [(str(order_day), count, float(revenue)) for order_day, count, revenue in db.session.query(
+                day,
+                db.func.count(Order.id),
+                db.func.coalesce(db.func.sum(Order.total_amount), 0)
+            ).filter(*sold).group_by(day).order_by(day).all()]
+        
+        return {
+            'status_rows': status_rows,
+            'total_orders': total_orders,
+            'cancelled_orders': cancelled_orders,
+            'sold_orders': sold_orders,
+            'total_revenue': total_revenue,
+            'avg_order_value': total_revenue / sold_orders if sold_orders > 0 else 0,
+            'daily_rows': daily_rows
+        }
+    
+    @reads_from_replica
+    def generate_sales_report(self, start_date, end_date, title=None, output=None):
+        """
+        Generate a sales report PDF for an inclusive date range.
+
+        Every section comes from a grouped aggregate query, so the cost follows the
+        number of days, products and categories in the range rather than the
+        number of orders. Single-day reports also list that day's orders.
+        Revenue figures exclude cancelled orders.
+        """
+        from models import db, Category
+        
+        buffer = output if output is not None else io.BytesIO()
         doc = SimpleDocTemplate(buffer, pagesize=A4,
                               rightMargin=72, leftMargin=72,
                               topMargin=72, bottomMargin=18)
         
+        if title is None:
+            title = f"Sales Report - {start_date.strftime('%B %d, %Y')} to {end_date.strftime('%B %d, %Y')}"
+        
         story = []
         
         # Header with company info from configuration
         company_name = self.get_config_value('company_name', 'Smart Bakery Manager')
         story.append(Paragraph(company_name, self.styles['CompanyHeader']))
-        story.append(Paragraph(f"Daily Sales Report - {date.strftime('%B %d, %Y')}", self.styles['InvoiceTitle']))
+        story.append(Paragraph(title, self.styles['InvoiceTitle']))
         story.append(Spacer(1, 20))
         
-        # Get orders for the day
-        from datetime import datetime, time
-        start_of_day = datetime.combine(date, time.min)
-        end_of_day = datetime.combine(date, time.max)
+        in_range, sold = self._sales_report_criteria(start_date, end_date)
+        figures = self.sales_report_figures(start_date, end_date)
+        status_rows = figures['status_rows']
         
-        orders = Order.query.filter(
-            Order.created_at >= start_of_day,
-            Order.created_at <= end_of_day
-        ).all()
-        
-        if not orders:
-            story.append(Paragraph("No orders found for this date.", self.styles['Normal']))
+        if not status_rows:
+            story.append(Paragraph("No orders found for this period.", self.styles['Normal']))
         else:
-            # Summary statistics
-            total_revenue = sum(order.total_amount for order in orders)
-            total_orders = len(orders)
-            avg_order_value = total_revenue / total_orders if total_orders > 0 else 0
-            
             currency_symbol = self.get_config_value('currency_symbol', '$')
             
+            # Summary statistics
             summary_data = [
-                ['Total Orders:', str(total_orders)],
-                ['Total Revenue:', f"{currency_symbol}{total_revenue:.2f}"],
-                ['Average Order Value:', f"{currency_symbol}{avg_order_value:.2f}"],
+                ['Total Orders:', str(figures['total_orders'])],
+                ['Cancelled Orders:', str(figures['cancelled_orders'])],
+                ['Total Revenue:', f"{currency_symbol}{figures['total_revenue']:.2f}"],
+                ['Average Order Value:', f"{currency_symbol}{figures['avg_order_value']:.2f}"],
             ]
             
             summary_table = Table(summary_data, colWidths=[2*inch, 2*inch])
@@ -285,45 +570,123 @@ class SmartBillGenerator:
             story.append(summary_table)
             story.append(Spacer(1, 20))
             
-            # Orders breakdown
-            story.append(Paragraph("Orders Breakdown", self.styles['SectionHeader']))
+            # Status breakdown
+            story.append(Paragraph("Status Breakdown", self.styles['SectionHeader']))
+            status_data = [['Status', 'Orders', 'Amount']]
+            for status, count, amount in sorted(status_rows, key=lambda row: -row[1]):
+                status_data.append([
+                    status.value.replace('_', ' ').title(),
+                    str(count),
+                    f"{currency_symbol}{float(amount):.2f}"
+                ])
+            story.append(self._report_table(status_data, [2.5*inch, 1*inch, 1.5*inch]))
+            story.append(Spacer(1, 20))
             
-            orders_data = [['Order #', 'Customer', 'Type', 'Amount', 'Status']]
+            # Per-day totals
+            if start_date != end_date:
+                story.append(Paragraph("Daily Totals", self.styles['SectionHeader']))
+                daily_data = [['Date', 'Orders', 'Revenue']]
+                for order_day, count, revenue in figures['daily_rows']:
+                    daily_data.append([str(order_day), str(count), f"{currency_symbol}{revenue:.2f}"])
+                story.append(self._report_table(daily_data, [2.5*inch, 1*inch, 1.5*inch]))
+                story.append(Spacer(1, 20))
             
-            for order in orders:
-                orders_data.append([
-                    order.order_number,
-                    f"{order.customer.first_name} {order.customer.last_name}",
-                    order.order_type.value.title(),
-                    f"{currency_symbol}{order.total_amount:.2f}",
-                    order.status.value.replace('_', ' ').title()
-                ])
+            # Top products
+            quantity = db.func.sum(OrderItem.quantity)
+            revenue = db.func.sum(OrderItem.total_price)
+            product_rows = db.session.query(Product.name, quantity, revenue)\
+                .join(OrderItem, OrderItem.product_id == Product.id)\
+                .join(Order, OrderItem.order_id == Order.id)\
+                .filter(*sold)\
+                .group_by(Product.id, Product.name)\
+                .order_by(revenue.desc())\
+                .limit(10).all()
             
-            orders_table = Table(orders_data, colWidths=[1.2*inch, 1.5*inch, 1*inch, 1*inch, 1.3*inch])
-            orders_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#f3f4f6')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.HexColor('#111827')),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 10),
-                ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-                ('FONTSIZE', (0, 1), (-1, -1), 9),
-                ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#e5e7eb')),
-                ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f9fafb')]),
-                ('ALIGN', (3, 1), (3, -1), 'RIGHT'),
-            ]))
+            if product_rows:
+                story.append(Paragraph("Top Products", self.styles['SectionHeader']))
+                product_data = [['Product', 'Quantity', 'Revenue']]
+                for name, qty, amount in product_rows:
+                    product_data.append([name, str(qty), f"{currency_symbol}{float(amount):.2f}"])
+                story.append(self._report_table(product_data, [2.5*inch, 1*inch, 1.5*inch]))
+                story.append(Spacer(1, 20))
+            
+            # Category mix
+            category_rows = db.session.query(Category.name, quantity, revenue)\
+                .join(Product, Product.category_id == Category.id)\
+                .join(OrderItem, OrderItem.product_id == Product.id)\
+                .join(Order, OrderItem.order_id == Order.id)\
+                .filter(*sold)\
+                .group_by(Category.id, Category.name)\
+                .order_by(revenue.desc()).all()
+            
+            if category_rows:
+                category_total = sum(float(amount) for name, qty, amount in category_rows) or 1
+                story.append(Paragraph("Category Mix", self.styles['SectionHeader']))
+                category_data = [['Category', 'Quantity', 'Revenue', 'Share']]
+                for name, qty, amount in category_rows:
+                    category_data.append([
+                        name,
+                        str(qty),
+                        f"{currency_symbol}{float(amount):.2f}",
+                        f"{float(amount) / category_total * 100:.1f}%"
+                    ])
+                story.append(self._report_table(category_data, [2*inch, 1*inch, 1.5*inch, 1*inch]))
+                story.append(Spacer(1, 20))
             
-            story.append(orders_table)
+            # Orders breakdown for a single day
+            if start_date == end_date:
+                order_rows = db.session.query(
+                    Order.order_number,
+                    User.first_name,
+                    User.last_name,
+                    Order.order_type,
+                    Order.total_amount,
+                    Order.status
+                ).join(User, Order.customer_id == User.id)\
+                 .filter(*in_range)\
+                 .order_by(Order.created_at).all()
+                
+                story.append(Paragraph("Orders Breakdown", self.styles['SectionHeader']))
+                orders_data = [['Order #', 'Customer', 'Type', 'Amount', 'Status']]
+                for order_number, first_name, last_name, order_type, amount, status in order_rows:
+                    orders_data.append([
+                        order_number,
+                        f"{first_name} {last_name}",
+                        order_type.value.title(),
+                        f"{currency_symbol}{float(amount):.2f}",
+                        status.value.replace('_', ' ').title()
+                    ])
+                orders_table = self._report_table(orders_data, [1.2*inch, 1.5*inch, 1*inch, 1*inch, 1.3*inch])
+                orders_table.setStyle(TableStyle([
+                    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+                    ('ALIGN', (3, 1), (3, -1), 'RIGHT'),
+                ]))
+                story.append(orders_table)
         
         # Build PDF
         doc.build(story)
         buffer.seek(0)
         return buffer
     
-    def generate_inventory_report(self):
-        """Generate comprehensive inventory report"""
-        from models import Inventory, Product
-        
-        buffer = io.BytesIO()
+    def _report_table(self, data, col_widths):
+        """Table in the standard report style with a repeating header row"""
+        table = Table(data, colWidths=col_widths, repeatRows=1)
+        table.setStyle(REPORT_TABLE_STYLE)
+        return table
+    
+    @reads_from_replica
+    def generate_inventory_report(self, output=None, chunk_size=1000, rows_per_table=40):
+        """
+        Generate comprehensive inventory report.
+
+        Rows are streamed from a projected query and laid out as one table per
+        rows_per_table rows, fed to the document as it consumes them, so only the
+        current page's rows are held in memory. The PDF is written to output
+        (a new BytesIO by default), which is returned rewound.
+        """
+        from models import db, Inventory, Product
+        
+        buffer = output if output is not None else io.BytesIO()
         doc = SimpleDocTemplate(buffer, pagesize=A4,
                               rightMargin=72, leftMargin=72,
                               topMargin=72, bottomMargin=18)
@@ -336,24 +699,25 @@ class SmartBillGenerator:
         story.append(Paragraph(f"Inventory Report - {datetime.now().strftime('%B %d, %Y')}", self.styles['InvoiceTitle']))
         story.append(Spacer(1, 20))
         
-        # Get inventory data
-        inventory_items = Inventory.query.join(Product).all()
+        # Totals straight from the database
+        stock_value = Inventory.quantity * db.func.coalesce(Product.cost, 0)
+        total_items, low_stock_items, total_value = db.session.query(
+            db.func.count(Inventory.id),
+            db.func.coalesce(db.func.sum(db.case((Inventory.quantity <= Inventory.min_stock_level, 1), else_=0)), 0),
+            db.func.coalesce(db.func.sum(stock_value), 0)
+        ).join(Product, Inventory.product_id == Product.id).one()
         
-        if not inventory_items:
+        more = ()
+        if not total_items:
             story.append(Paragraph("No inventory data available.", self.styles['Normal']))
         else:
-            # Calculate totals
-            total_items = len(inventory_items)
-            low_stock_items = len([item for item in inventory_items if item.is_low_stock()])
-            total_value = sum(item.quantity * float(item.product.cost or 0) for item in inventory_items)
-            
             currency_symbol = self.get_config_value('currency_symbol', '$')
             
             # Summary
             summary_data = [
                 ['Total Products:', str(total_items)],
                 ['Low Stock Items:', str(low_stock_items)],
-                ['Total Inventory Value:', f"{currency_symbol}{total_value:.2f}"],
+                ['Total Inventory Value:', f"{currency_symbol}{float(total_value):.2f}"],
             ]
             
             summary_table = Table(summary_data, colWidths=[2*inch, 2*inch])
@@ -370,38 +734,48 @@ class SmartBillGenerator:
             # Detailed inventory
             story.append(Paragraph("Detailed Inventory", self.styles['SectionHeader']))
             
-            inventory_data = [['Product', 'Current Stock', 'Min Level', 'Max Level', 'Status', 'Value']]
-            
-            for item in inventory_items:
-                status = "LOW STOCK" if item.is_low_stock() else "OK"
-                value = item.quantity * float(item.product.cost or 0)
-                
-                inventory_data.append([
-                    item.product.name,
-                    str(item.quantity),
-                    str(item.min_stock_level),
-                    str(item.max_stock_level),
-                    status,
-                    f"{currency_symbol}{value:.2f}"
-                ])
-            
-            inventory_table = Table(inventory_data, colWidths=[2*inch, 0.8*inch, 0.8*inch, 0.8*inch, 0.8*inch, 0.8*inch])
-            inventory_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#f3f4f6')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.HexColor('#111827')),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 10),
-                ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-                ('FONTSIZE', (0, 1), (-1, -1), 9),
-                ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#e5e7eb')),
-                ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f9fafb')]),
-                ('ALIGN', (1, 1), (-1, -1), 'CENTER'),
-                ('ALIGN', (-1, 1), (-1, -1), 'RIGHT'),
-            ]))
-            
-            story.append(inventory_table)
+            rows = db.session.query(
+                Product.name,
+                Inventory.quantity,
+                Inventory.min_stock_level,
+                Inventory.max_stock_level,
+                Product.cost
+            ).join(Product, Inventory.product_id == Product.id)\
+             .order_by(Product.name, Inventory.id)\
+             .yield_per(chunk_size)
+            more = self._inventory_tables(rows, currency_symbol, rows_per_table)
         
         # Build PDF
-        doc.build(story)
+        doc.build(LazyStory(story, more))
         buffer.seek(0)
-        return buffer
\ No newline at end of file
+        return buffer
+    
+    def _inventory_tables(self, rows, currency_symbol, rows_per_table):
+        """Yield the detailed inventory as a sequence of page-sized tables"""
+        header = ['Product', 'Current Stock', 'Min Level', 'Max Level', 'Status', 'Value']
+        inventory_data = [header]
+        
+        for name, quantity, min_level, max_level, cost in rows:
+            status = "LOW STOCK" if quantity <= min_level else "OK"
+            value = quantity * float(cost or 0)
+            
+            inventory_data.append([
+                name,
+                str(quantity),
+                str(min_level),
+                str(max_level),
+                status,
+                f"{currency_symbol}{value:.2f}"
+            ])
+            
+            if len(inventory_data) > rows_per_table:
+                yield self._inventory_table(inventory_data)
+                inventory_data = [header]
+        
+        if len(inventory_data) > 1:
+            yield self._inventory_table(inventory_data)
+    
+    def _inventory_table(self, inventory_data):
+        inventory_table = Table(inventory_data, colWidths=[2*inch, 0.8*inch, 0.8*inch, 0.8*inch, 0.8*inch, 0.8*inch], repeatRows=1)
+        inventory_table.setStyle(INVENTORY_TABLE_STYLE)
+        return inventory_table
@@ -0,0 +1,78 @@
+from collections import namedtuple
+
+from flask_login import UserMixin
+
+from cache import TTLCache
+
+RoleRef = namedtuple('RoleRef', ['id', 'name'])
+
+# Columns copied into the cached principal; anything else is loaded from the User row on demand
+PRINCIPAL_FIELDS = ('username', 'email', 'first_name', 'last_name', 'phone', 'role_id', 'active',
+                    'email_verified', 'created_at', 'last_login')
+
+principal_cache = TTLCache(maxsize=1024, ttl=60)
+
+
+class UserPrincipal(UserMixin):
+    """
+    The logged-in user as seen by login, role checks and templates.
+
+    Built from a cached snapshot of the user's row and role name, so the usual
+    current_user.id, current_user.role.name and display fields cost no query.
+    Any other attribute, such as current_user.orders, loads the User row once
+    per request and reads it from there. Code that changes the user must load
+    the User itself and call invalidate_principal() after committing.
+    """
+
+    def __init__(self, id, role_name, **fields):
+        self.id = id
+        self.role = RoleRef(fields.get('role_id'), role_name)
+        self._user = None
+        for name in PRINCIPAL_FIELDS:
+            setattr(self, name, fields.get(name))
+
+    @property
+    def is_active(self):
+        return self.active
+
+    @property
+    def user(self):
+        """The User row behind this principal, loaded on first use"""
+        if self._user is None:
+            from models import db, User
+            self._user = db.session.get(User, self.id)
+        return self._user
+
+    def __getattr__(self, name):
+        # Only reached for attributes that are not part of the snapshot
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.user, name)
+
+
+def _snapshot(user_id):
+    from models import db, User, Role
+
+    row = db.session.query(User, Role.name).outerjoin(Role, User.role_id == Role.id).filter(User.id == user_id).first()
+    if row is None:
+        return None
+    user, role_name = row
+    return {'id': user.id, 'role_name': role_name, **{name: getattr(user, name) for name in PRINCIPAL_FIELDS}}
+
+
+def load_principal(user_id):
+    """The principal of an active user, or None so that Flask-Login treats the session as logged out"""
+    snapshot = principal_cache.get(user_id)
+    if snapshot is None:
+        snapshot = _snapshot(user_id)
+        if snapshot is None:
+            return None
+        principal_cache.set(user_id, snapshot)
+    if not snapshot['active']:
+        return None
+    return UserPrincipal(**snapshot)
+
+
+def invalidate_principal(user_id):
+    """Forget the cached principal of a user whose row, role or active flag changed"""
+    principal_cache.pop(user_id)
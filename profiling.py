@@ -0,0 +1,211 @@
+import functools
+import logging
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+_local = threading.local()
+# tracemalloc is process-wide, so only one run at a time may use it: another run
+# stopping it or resetting its peak would corrupt the first run's numbers
+_tracing_lock = threading.Lock()
+
+
+class StageMetrics:
+    """Resource usage of one profiled stage"""
+
+    def __init__(self, name, track_memory=False):
+        self.name = name
+        self.status = 'completed'
+        self.track_memory = track_memory
+        self.sql_count = 0
+        self.rows_read = 0
+        self.wall_ms = 0.0
+        self.cpu_ms = 0.0
+        self.peak_memory_kb = None
+        self.error = None
+        self.stages = []
+        self._wall_start = None
+        self._cpu_start = None
+        self._memory_base = 0
+        self._memory_peak = 0
+
+    def start(self):
+        if self.track_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            # Resetting the peak would hide the enclosing stage's peak, so hand it up first
+            parent = _stack()[-1] if _stack() else None
+            if parent is not None and parent.track_memory:
+                parent._memory_peak = max(parent._memory_peak, peak)
+            tracemalloc.reset_peak()
+            self._memory_base = current
+            self._memory_peak = current
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.thread_time()
+
+    def stop(self):
+        self.wall_ms = (time.perf_counter() - self._wall_start) * 1000
+        self.cpu_ms = (time.thread_time() - self._cpu_start) * 1000
+        if self.track_memory:
+            self._memory_peak = max(self._memory_peak, tracemalloc.get_traced_memory()[1])
+            self.peak_memory_kb = (self._memory_peak - self._memory_base) / 1024
+            parent = _stack()[-1] if _stack() else None
+            if parent is not None and parent.track_memory:
+                parent._memory_peak = max(parent._memory_peak, self._memory_peak)
+
+    def to_dict(self):
+        return {
+            'stage': self.name,
+            'status': self.status,
+            'wall_ms': round(self.wall_ms, 2),
+            'cpu_ms': round(self.cpu_ms, 2),
+            'sql_count': self.sql_count,
+            'rows_read': self.rows_read,
+            'peak_memory_kb': round(self.peak_memory_kb, 1) if self.peak_memory_kb is not None else None,
+            'error': self.error
+        }
+
+
+def _stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+
+def current_run():
+    """The run being profiled on this thread, if any"""
+    stack = _stack()
+    return stack[0] if stack else None
+
+
+@contextmanager
+def profile_run(name, track_memory=True):
+    """
+    Profile a whole regeneration run on the current thread.
+
+    Stages entered inside the block are attached to the run, and the run is
+    persisted as an AnalysisRun when the block exits, whether or not it failed.
+    Memory is measured with tracemalloc, which slows every thread while it is
+    tracing, so it can be switched off with track_memory=False. Only one run
+    in the process measures memory at a time; a run that starts while another
+    one is measuring records no peak memory.
+    """
+    track_memory = track_memory and _tracing_lock.acquire(blocking=False)
+    started_tracing = track_memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+
+    run = StageMetrics(name, track_memory=track_memory)
+    run.started_at = datetime.utcnow()
+    run.record = None
+    run.start()
+    _stack().append(run)
+    try:
+        yield run
+    except Exception as e:
+        run.status = 'failed'
+        run.error = str(e)
+        raise
+    finally:
+        _stack().pop()
+        run.stop()
+        if started_tracing:
+            tracemalloc.stop()
+        if track_memory:
+            _tracing_lock.release()
+        try:
+            run.record = _save_run(run)
+        except Exception:
+            logging.exception(f"Could not save profile of run {name}")
+
+
+@contextmanager
+def stage(name):
+    """Profile one stage of the current run; a no-op outside of a run"""
+    run = current_run()
+    if run is None:
+        yield None
+        return
+
+    metrics = StageMetrics(name, track_memory=run.track_memory)
+    metrics.start()
+    _stack().append(metrics)
+    try:
+        yield metrics
+    except Exception as e:
+        metrics.status = 'failed'
+        metrics.error = str(e)
+        raise
+    finally:
+        _stack().pop()
+        metrics.stop()
+        run.stages.append(metrics)
+
+
+def profiled(name):
+    """Decorator form of stage()"""
+    def decorator(f):
+        @functools.wraps(f)
+        def decorated_function(*args, **kwargs):
+            with stage(name):
+                return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+
+def _save_run(run):
+    from models import db, AnalysisRun, AnalysisStageMetric
+
+    # The profiled work may have failed half way through; start from a clean session
+    db.session.rollback()
+    record = AnalysisRun(
+        name=run.name,
+        status=run.status,
+        started_at=run.started_at,
+        wall_ms=run.wall_ms,
+        cpu_ms=run.cpu_ms,
+        sql_count=run.sql_count,
+        rows_read=run.rows_read,
+        peak_memory_kb=run.peak_memory_kb,
+        error=run.error
+    )
+    for metrics in run.stages:
+        record.stages.append(AnalysisStageMetric(
+            stage=metrics.name,
+            status=metrics.status,
+            wall_ms=metrics.wall_ms,
+            cpu_ms=metrics.cpu_ms,
+            sql_count=metrics.sql_count,
+            rows_read=metrics.rows_read,
+            peak_memory_kb=metrics.peak_memory_kb,
+            error=metrics.error
+        ))
+    db.session.add(record)
+    db.session.commit()
+    return record
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    for metrics in _stack():
+        metrics.sql_count += 1
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _count_rows(orm_execute_state):
+    stack = _stack()
+    if not stack or not orm_execute_state.is_select:
+        return None
+    if orm_execute_state.execution_options.get('yield_per'):
+        # Buffering would defeat a streamed query
+        return None
+
+    frozen = orm_execute_state.invoke_statement().freeze()
+    for metrics in stack:
+        metrics.rows_read += len(frozen.data)
+    return frozen()
@@ -0,0 +1,66 @@
+import logging
+import time
+from datetime import datetime, timedelta
+
+from models import db, UserSession, EmailVerification, PasswordReset, BackgroundJob
+
+
+def _expired_criteria(cutoff):
+    """Per model, the rows that can no longer be used and are past the retention period"""
+    return (
+        (UserSession, db.or_(
+            UserSession.expires_at < cutoff,
+            db.and_(UserSession.is_active == False, UserSession.last_activity < cutoff)
+        )),
+        (EmailVerification, EmailVerification.expires_at < cutoff),
+        (PasswordReset, PasswordReset.expires_at < cutoff),
+        (BackgroundJob, BackgroundJob.finished_at < cutoff),
+    )
+
+
+def _purge_model(model, criterion, batch_size, pause):
+    """Delete matching rows batch_size at a time, committing after each batch"""
+    removed = 0
+    batches = 0
+    while True:
+        ids = [row_id for (row_id,) in db.session.query(model.id).filter(criterion).limit(batch_size)]
+        if not ids:
+            break
+        db.session.query(model).filter(model.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        removed += len(ids)
+        batches += 1
+        if len(ids) < batch_size:
+            break
+        if pause:
+            # Give writers waiting on the table a turn between batches
+            time.sleep(pause)
+    return removed, batches
+
+
+def purge_expired(retention_hours=24, batch_size=1000, pause=0.0):
+    """
+    Delete expired sessions, email verification codes and password reset
+    tokens that expired more than retention_hours ago, plus sessions that
+    were logged out and background jobs that finished that long ago.
+
+    Rows are deleted in short transactions of batch_size rows, so the tables
+    are never locked for long. Returns the number of rows removed per table.
+    """
+    cutoff = datetime.utcnow() - timedelta(hours=retention_hours)
+    started = time.perf_counter()
+    stats = {'cutoff': cutoff.isoformat(), 'tables': {}}
+
+    for model, criterion in _expired_criteria(cutoff):
+        table_started = time.perf_counter()
+        removed, batches = _purge_model(model, criterion, batch_size, pause)
+        stats['tables'][model.__tablename__] = {
+            'removed': removed,
+            'batches': batches,
+            'duration_ms': round((time.perf_counter() - table_started) * 1000, 1)
+        }
+
+    stats['removed'] = sum(table['removed'] for table in stats['tables'].values())
+    stats['duration_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    logging.info(f"Purged {stats['removed']} expired rows: {stats['tables']}")
+    return stats
@@ -0,0 +1,179 @@
+import logging
+from datetime import datetime
+
+import numpy as np
+from flask import current_app
+from scipy import sparse
+from sklearn.preprocessing import normalize
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Order, OrderItem, OrderStatus, Product, InsightWatermark, CustomerRecommendation
+from db_routing import replica_reads
+import profiling
+
+WATERMARK_KEY = 'customer_recommendations'
+
+
+class InteractionMatrix:
+    """Sparse customer x product matrix of what each customer bought"""
+
+    def __init__(self, matrix, customer_ids, product_ids):
+        self.matrix = matrix
+        self.customer_ids = customer_ids
+        self.product_ids = product_ids
+        self._customer_index = {customer_id: i for i, customer_id in enumerate(customer_ids)}
+
+    @classmethod
+    def load(cls):
+        """
+        Build the matrix from one grouped query over the non-cancelled order
+        lines. Quantities are log-scaled so a single catering order does not
+        outweigh a habit.
+        """
+        rows = db.session.query(
+            Order.customer_id, OrderItem.product_id, db.func.sum(OrderItem.quantity)
+        ).join(Order, OrderItem.order_id == Order.id).filter(
+            Order.status != OrderStatus.CANCELLED
+        ).group_by(Order.customer_id, OrderItem.product_id).all()
+
+        if not rows:
+            return cls(sparse.csr_matrix((0, 0)), np.array([], dtype=int), np.array([], dtype=int))
+
+        customers, products, quantities = (np.array(column) for column in zip(*rows))
+        customer_ids, customer_rows = np.unique(customers, return_inverse=True)
+        product_ids, product_columns = np.unique(products, return_inverse=True)
+        matrix = sparse.csr_matrix(
+            (np.log1p(quantities.astype(float)), (customer_rows, product_columns)),
+            shape=(len(customer_ids), len(product_ids))
+        )
+        return cls(matrix, customer_ids, product_ids)
+
+    def rows_for(self, customer_ids):
+        return [self._customer_index[customer_id] for customer_id in customer_ids if customer_id in self._customer_index]
+
+
+def item_similarity(matrix):
+    """Cosine similarity between the product columns, without self-similarity"""
+    if matrix.shape[0] == 0:
+        return sparse.csr_matrix((matrix.shape[1], matrix.shape[1]))
+    columns = normalize(matrix.tocsc(), axis=0)
+    similarity = (columns.T @ columns).tocsr()
+    similarity.setdiag(0)
+    similarity.eliminate_zeros()
+    return similarity
+
+
+def score_customers(interactions, similarity, rows, recommendable, count):
+    """
+    Yield (customer_id, [(product_id, score), ...]) for the given matrix rows.
+
+    A customer's score for a product is the similarity of that product to
+    everything they bought, weighted by how much they bought. Products they
+    already buy and products that are not recommendable are left out.
+    """
+    bought = interactions.matrix[rows]
+    scores = (bought @ similarity).toarray()
+    scores[bought.nonzero()] = 0
+    scores[:, ~recommendable] = 0
+
+    top = min(count, scores.shape[1])
+    for offset, row in enumerate(rows):
+        row_scores = scores[offset]
+        if top == 0:
+            yield interactions.customer_ids[row], []
+            continue
+        candidates = np.argpartition(-row_scores, top - 1)[:top]
+        candidates = candidates[np.argsort(-row_scores[candidates])]
+        yield interactions.customer_ids[row], [
+            (int(interactions.product_ids[column]), float(row_scores[column]))
+            for column in candidates if row_scores[column] > 0
+        ]
+
+
+def _changed_customers(since):
+    return {customer_id for (customer_id,) in db.session.query(Order.customer_id).filter(
+        Order.updated_at > since
+    ).distinct()}
+
+
+def refresh_recommendations(full=False, count=None, chunk_size=500):
+    """
+    Recompute the stored top products of customers.
+
+    The similarity matrix is always rebuilt from the current order lines, but
+    only customers with orders changed since the last refresh are rescored
+    and rewritten, unless full is set or no refresh has run yet.
+    """
+    count = count or current_app.config['RECOMMENDATION_COUNT']
+    record = InsightWatermark.query.filter_by(analysis=WATERMARK_KEY).first()
+    full = full or record is None
+
+    with replica_reads():
+        latest = db.session.query(db.func.max(Order.updated_at)).scalar()
+        with profiling.stage('load_interactions'):
+            interactions = InteractionMatrix.load()
+            recommendable = np.isin(interactions.product_ids, [
+                product_id for (product_id,) in
+                db.session.query(Product.id).filter(Product.is_active == True)
+            ])
+        if full:
+            customers = list(interactions.customer_ids)
+        else:
+            customers = sorted(_changed_customers(datetime.fromisoformat(record.watermark)))
+
+    with profiling.stage('similarity'):
+        similarity = item_similarity(interactions.matrix)
+
+    stored = 0
+    with profiling.stage('score'):
+        now = datetime.utcnow()
+        for offset in range(0, len(customers), chunk_size):
+            chunk = customers[offset:offset + chunk_size]
+            # Includes customers whose only orders were cancelled; they get no rows back
+            CustomerRecommendation.query.filter(
+                CustomerRecommendation.customer_id.in_([int(customer_id) for customer_id in chunk])
+            ).delete(synchronize_session=False)
+
+            values = []
+            rows = interactions.rows_for(chunk)
+            if rows:
+                for customer_id, products in score_customers(interactions, similarity, rows, recommendable, count):
+                    values.extend({
+                        'customer_id': int(customer_id),
+                        'product_id': product_id,
+                        'rank': rank,
+                        'score': score,
+                        'computed_at': now
+                    } for rank, (product_id, score) in enumerate(products, start=1))
+            try:
+                if values:
+                    db.session.execute(insert(CustomerRecommendation), values)
+                db.session.commit()
+                stored += len(values)
+            except IntegrityError:
+                # A concurrent refresh in another worker rescored the same customers
+                db.session.rollback()
+                logging.warning(f"Skipped {len(chunk)} customers already rescored by another refresh")
+
+        if full:
+            # Customers who no longer have any order lines
+            CustomerRecommendation.query.filter(
+                CustomerRecommendation.computed_at < now
+            ).delete(synchronize_session=False)
+
+    if latest is not None:
+        if record is None:
+            record = InsightWatermark(analysis=WATERMARK_KEY)
+            db.session.add(record)
+        record.watermark = latest.isoformat()
+        record.computed_at = datetime.utcnow()
+    db.session.commit()
+
+    return {
+        'mode': 'full' if full else 'incremental',
+        'customers': len(customers),
+        'products': len(interactions.product_ids),
+        'recommendations': stored
+    }
+
@@ -1,12 +1,28 @@
 # --- All imports must be at the top ---
-from flask import render_template, redirect, url_for, flash, request, jsonify, send_file, make_response, session, current_app
+from flask import render_template, redirect, url_for, flash, request, jsonify, send_file, make_response, session, current_app, stream_with_context
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import check_password_hash, generate_password_hash
 from datetime import datetime, timedelta, date, time
 from app import app, db
-from models import User, Product, Inventory, Order, OrderItem, Category, Role, StaffSchedule, ScheduleModification, AIInsight, OrderStatus, OrderType, Configuration, RawProduct, Notification, ProductRecipe, PurchaseOrder, EmailVerification, PasswordReset, UserSession
+from models import User, Product, Inventory, Order, OrderItem, Category, Role, StaffSchedule, ScheduleModification, AIInsight, OrderStatus, OrderType, Configuration, RawProduct, Notification, ProductRecipe, PurchaseOrder, EmailVerification, PasswordReset, UserSession, AnalysisRun, CustomerRecommendation
 from forms import LoginForm, UserForm, ProductForm, InventoryForm, OrderForm, CategoryForm, ConfigurationForm, RawProductForm, ProductRecipeForm, SignupForm, EmailVerificationForm, ResendOTPForm, ForgotPasswordForm, ResetPasswordForm
-from utils import generate_order_number, generate_ai_insights, requires_role, send_email_otp, send_password_reset_email, check_password_strength
+from utils import generate_order_number, requires_role, send_email_otp, send_password_reset_email, check_password_strength
+from jobs import job_runner
+from cache import TTLCache
+from principals import invalidate_principal
+from notifications import notification_hub, notification_payload
+from unit_of_work import unit_of_work
+from db_routing import reads_from_replica, replica_status
+from csv_export import (
+    csv_response, order_filters, order_rows, order_item_rows, modification_filters, modification_rows,
+    ORDER_EXPORT_HEADER, ORDER_ITEM_EXPORT_HEADER, MODIFICATION_EXPORT_HEADER
+)
+import jobs
+import hashlib
+import json
+import queue
+import tempfile
+import time as time_module
 
 # --- Detailed Analytics Page ---
 @app.route('/detailed-analytics')
@@ -55,28 +71,105 @@ def staff_details_api(staff_id):
 @login_required
 def get_notifications():
     notifications = Notification.query.filter_by(user_id=current_user.id).order_by(Notification.created_at.desc()).limit(10).all()
-    unread_count = Notification.query.filter_by(user_id=current_user.id, is_read=False).count()
-    notif_list = [
-        {
-            'id': n.id,
-            'message': n.message,
-            'is_read': n.is_read,
-            'created_at': n.created_at.strftime('%Y-%m-%d %H:%M')
-        } for n in notifications
-    ]
-    return jsonify({'notifications': notif_list, 'unread_count': unread_count})
+    notif_list = [notification_payload(n) for n in notifications]
+    return jsonify({'notifications': notif_list, 'unread_count': notification_hub.unread_count(current_user.id)})
 
 @app.route('/api/notifications/mark_read', methods=['POST'])
 @login_required
 def mark_notifications_read():
     Notification.query.filter_by(user_id=current_user.id, is_read=False).update({'is_read': True})
     db.session.commit()
+    notification_hub.mark_all_read(current_user.id)
     return jsonify({'success': True})
+
+@app.route('/api/notifications/broadcast', methods=['POST'])
+@login_required
+@requires_role(['admin', 'manager'])
+def broadcast_notification():
+    """Send one message to every active user of a role and/or to a list of users"""
+    data = request.get_json(silent=True) or {}
+    message = (data.get('message') or '').strip()
+    role = data.get('role')
+    user_ids = data.get('user_ids')
+    if not message or len(message) > 255:
+        return jsonify({'success': False, 'message': 'A message of at most 255 characters is required'}), 400
+    if not role and not user_ids:
+        return jsonify({'success': False, 'message': 'Give a role or a list of user_ids'}), 400
+    if user_ids is not None and not (isinstance(user_ids, list) and all(isinstance(i, int) for i in user_ids)):
+        return jsonify({'success': False, 'message': 'user_ids must be a list of integers'}), 400
+
+    sent = Notification.broadcast(message, role=role, user_ids=user_ids)
+    return jsonify({'success': True, 'sent': sent})
+
+def _sse(event_name, data, event_id=None):
+    message = f"event: {event_name}\ndata: {json.dumps(data)}\n\n"
+    return f"id: {event_id}\n{message}" if event_id is not None else message
+
+@app.route('/api/notifications/stream')
+@login_required
+def notification_stream():
+    """
+    Server-Sent Events stream of the current user's new notifications and
+    unread count. A reconnecting browser sends Last-Event-ID and is sent the
+    notifications it missed. Roles without a stream, and browsers over the
+    per-worker limit, get 204 No Content, which stops EventSource from
+    reconnecting; the header then polls /api/notifications instead.
+    """
+    if current_user.role.name not in current_app.config['NOTIFICATION_STREAM_ROLES']:
+        return '', 204
+    user_id = current_user.id
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    heartbeat = current_app.config['NOTIFICATION_STREAM_HEARTBEAT']
+    # Subscribe before reading the backlog so nothing committed in between is lost
+    listener = notification_hub.subscribe(user_id, limit=current_app.config['NOTIFICATION_STREAM_MAX'])
+    if listener is None:
+        return '', 204
+
+    missed = []
+    if last_event_id is not None:
+        missed = [notification_payload(n) for n in Notification.query.filter(
+            Notification.user_id == user_id, Notification.id > last_event_id
+        ).order_by(Notification.id).all()]
+    unread_count = notification_hub.unread_count(user_id)
+    # The generator runs outside the request context, so an idle stream holds no database connection
+    db.session.remove()
+
+    def events():
+        try:
+            yield f"retry: {heartbeat * 1000}\n"
+            sent = last_event_id or 0
+            for payload in missed:
+                sent = payload['id']
+                yield _sse('notification', payload, payload['id'])
+            yield _sse('unread', {'unread_count': unread_count})
+            while True:
+                try:
+                    event_name, data = listener.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                if event_name == 'notification':
+                    if data['id'] <= sent:
+                        continue
+                    sent = data['id']
+                    yield _sse(event_name, data, data['id'])
+                else:
+                    yield _sse(event_name, data)
+        finally:
+            notification_hub.unsubscribe(user_id, listener)
+
+    response = current_app.response_class(events(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 import logging
 
 def track_schedule_modification(schedule, modification_type, old_data=None, reason=None):
     """Track schedule modifications for audit trail"""
     try:
+        if schedule.id is None:
+            db.session.flush()  # Get the ID of a new schedule
         modification = ScheduleModification(
             schedule_id=schedule.id,
             modification_type=modification_type,
@@ -104,12 +197,13 @@ def track_schedule_modification(schedule, modification_type, old_data=None, reas
             modification.old_position = schedule.position
             modification.old_notes = schedule.notes
         
-        db.session.add(modification)
-        db.session.commit()
+        # A failed audit row is rolled back alone, leaving the schedule change staged
+        with unit_of_work.savepoint():
+            db.session.add(modification)
+        unit_of_work.commit()
         
     except Exception as e:
         logging.error(f"Error tracking schedule modification: {e}")
-        db.session.rollback()
 
 
 @app.route('/')
@@ -187,6 +281,7 @@ def login():
             
             db.session.add(user_session)
             db.session.commit()
+            invalidate_principal(user.id)
             
             # Set session token in response
             next_page = request.args.get('next')
@@ -578,6 +673,7 @@ def new_raw_product():
             cost_per_unit=form.cost_per_unit.data,
             supplier=form.supplier.data,
             supplier_contact=form.supplier_contact.data,
+            lead_time_days=form.lead_time_days.data if form.lead_time_days.data is not None else 3,
             location=form.location.data or 'Storage',
             current_stock=form.current_stock.data,
             min_stock_level=form.min_stock_level.data,
@@ -918,6 +1014,7 @@ def edit_customer(customer_id):
             return redirect(url_for('edit_customer', customer_id=customer.id))
         
         db.session.commit()
+        invalidate_principal(customer.id)
         flash('Customer updated successfully!', 'success')
         return redirect(url_for('customers'))
     
@@ -1015,6 +1112,7 @@ def edit_staff(staff_id):
             return redirect(url_for('edit_staff', staff_id=staff_member.id))
         
         db.session.commit()
+        invalidate_principal(staff_member.id)
         flash('Staff member updated successfully!', 'success')
         return redirect(url_for('staff'))
     
@@ -1281,6 +1379,7 @@ def modifications():
 @app.route('/reports')
 @login_required
 @requires_role(['admin', 'manager'])
+@reads_from_replica
 def reports():
     # Generate various reports
     reports_data = {
@@ -1310,15 +1409,18 @@ def reports():
 @app.route('/profile', methods=['GET', 'POST'])
 @login_required
 def profile():
-    form = UserForm(obj=current_user)
+    # current_user is a cached principal; edits go to the User row itself
+    user = User.query.get(current_user.id)
+    form = UserForm(obj=user)
     
     if form.validate_on_submit():
         # Don't allow users to change their own role
-        role_id = current_user.role_id
-        form.populate_obj(current_user)
-        current_user.role_id = role_id
+        role_id = user.role_id
+        form.populate_obj(user)
+        user.role_id = role_id
         
         db.session.commit()
+        invalidate_principal(user.id)
         flash('Profile updated successfully!', 'success')
         return redirect(url_for('profile'))
     
@@ -1462,9 +1564,42 @@ def get_order_details(order_id):
 @login_required
 @requires_role(['admin', 'manager'])
 def refresh_insights():
-    generate_ai_insights()
-    flash('AI insights refreshed successfully!', 'success')
-    return jsonify({'success': True})
+    """Queue a refresh of the rule-based insights"""
+    job, created = job_runner.submit(
+        'insights:refresh', jobs.refresh_insights,
+        cooldown=app.config['INSIGHT_REFRESH_COOLDOWN']
+    )
+    return jsonify({'success': True, 'queued': created, 'job': job.to_dict()}), 202
+
+
+@app.route('/api/insights/jobs/<job_id>')
+@login_required
+@requires_role(['admin', 'manager'])
+def insight_job_status(job_id):
+    """Poll the status of an insight generation job"""
+    job = job_runner.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+
+@app.route('/api/insights/runs')
+@login_required
+@requires_role(['admin'])
+def insight_run_profiles():
+    """Per-stage timings of the most recent insight regeneration runs"""
+    limit = min(request.args.get('limit', 20, type=int), 200)
+    runs = AnalysisRun.query.order_by(AnalysisRun.started_at.desc()).limit(limit).all()
+    return jsonify({'runs': [run.to_dict() for run in runs]})
+
+
+@app.route('/api/insights/runs/<int:run_id>')
+@login_required
+@requires_role(['admin'])
+def insight_run_profile(run_id):
+    """Per-stage timings of one insight regeneration run"""
+    run = AnalysisRun.query.get_or_404(run_id)
+    return jsonify(run.to_dict())
 
 
 # PDF Generation Routes
@@ -1479,17 +1614,22 @@ def download_invoice(order_id):
             flash('You do not have permission to download this invoice.', 'error')
             return redirect(url_for('orders'))
         
-        from pdf_generator import SmartBillGenerator
-        pdf_generator = SmartBillGenerator()
-        pdf_buffer = pdf_generator.generate_invoice_pdf(order_id)
+        from pdf_generator import get_cached_invoice
+        from pdf_cache import get_invoice_cache
+        etag, pdf_file = get_cached_invoice(order, get_invoice_cache())
         
-        if pdf_buffer:
-            return send_file(
-                pdf_buffer,
+        if pdf_file:
+            response = send_file(
+                pdf_file,
                 as_attachment=True,
                 download_name=f'invoice_{order.order_number}.pdf',
-                mimetype='application/pdf'
+                mimetype='application/pdf',
+                conditional=True,
+                etag=etag
             )
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            return response
         else:
             flash('Error generating invoice PDF.', 'error')
             return redirect(url_for('orders'))
@@ -1498,20 +1638,71 @@ def download_invoice(order_id):
         return redirect(url_for('orders'))
 
 
+@app.route('/download/invoices')
+@login_required
+@requires_role(['admin', 'manager'])
+def download_invoices():
+    """Stream a ZIP of every invoice for orders created in a date range"""
+    try:
+        start_date = datetime.strptime(request.args.get('start', ''), '%Y-%m-%d').date()
+        end_date = datetime.strptime(request.args.get('end', ''), '%Y-%m-%d').date()
+    except ValueError:
+        flash('Please choose a valid start and end date for the invoice export.', 'error')
+        return redirect(url_for('reports'))
+    
+    if end_date < start_date:
+        flash('The end date must not be before the start date.', 'error')
+        return redirect(url_for('reports'))
+    
+    from invoice_export import stream_invoice_zip
+    from pdf_cache import get_invoice_cache
+    archive = stream_invoice_zip(
+        start_date, end_date, get_invoice_cache(),
+        workers=app.config['INVOICE_EXPORT_WORKERS']
+    )
+    filename = f'invoices_{start_date.strftime("%Y%m%d")}_{end_date.strftime("%Y%m%d")}.zip'
+    return app.response_class(
+        stream_with_context(archive),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+
 @app.route('/download/daily-report')
 @login_required
 @requires_role(['admin', 'manager'])
 def download_daily_report():
     try:
+        from day_close import daily_sales_report, utc_today
+        # Orders are stamped in UTC, so report days are UTC days
+        today = utc_today()
         report_date = request.args.get('date')
         if report_date:
             try:
                 report_date = datetime.strptime(report_date, '%Y-%m-%d').date()
             except ValueError:
-                report_date = date.today()
+                report_date = today
         else:
-            report_date = date.today()
-        
+            report_date = today
+        
+        download_name = f'daily_sales_report_{report_date.strftime("%Y%m%d")}.pdf'
+        if report_date < today:
+            # A closed day: serve the report stored at day close, rebuilt only if its orders changed
+            artifact, path = daily_sales_report(report_date)
+            if path:
+                response = send_file(
+                    path,
+                    as_attachment=True,
+                    download_name=download_name,
+                    mimetype='application/pdf',
+                    conditional=True,
+                    etag=artifact.cache_key,
+                    last_modified=artifact.generated_at
+                )
+                response.cache_control.private = True
+                response.cache_control.no_cache = True
+                return response
+
         from pdf_generator import SmartBillGenerator
         pdf_generator = SmartBillGenerator()
         pdf_buffer = pdf_generator.generate_daily_sales_report(report_date)
@@ -1519,7 +1710,7 @@ def download_daily_report():
         return send_file(
             pdf_buffer,
             as_attachment=True,
-            download_name=f'daily_sales_report_{report_date.strftime("%Y%m%d")}.pdf',
+            download_name=download_name,
             mimetype='application/pdf'
         )
     except Exception as e:
@@ -1532,12 +1723,35 @@ def download_daily_report():
 @requires_role(['admin', 'manager'])
 def download_inventory_report():
     try:
+        if request.args.get('date'):
+            # The snapshot taken when that day was closed
+            from day_close import inventory_snapshot
+            try:
+                snapshot_date = datetime.strptime(request.args['date'], '%Y-%m-%d').date()
+            except ValueError:
+                flash('Invalid date format. Use YYYY-MM-DD.', 'error')
+                return redirect(url_for('reports'))
+            artifact, path = inventory_snapshot(snapshot_date)
+            if path is None:
+                flash(f'No inventory snapshot was taken on {snapshot_date.strftime("%B %d, %Y")}.', 'warning')
+                return redirect(url_for('reports'))
+            return send_file(
+                path,
+                as_attachment=True,
+                download_name=f'inventory_report_{snapshot_date.strftime("%Y%m%d")}.pdf',
+                mimetype='application/pdf',
+                conditional=True,
+                etag=artifact.cache_key,
+                last_modified=artifact.generated_at
+            )
+
         from pdf_generator import SmartBillGenerator
         pdf_generator = SmartBillGenerator()
-        pdf_buffer = pdf_generator.generate_inventory_report()
+        report = tempfile.SpooledTemporaryFile(max_size=app.config['REPORT_SPOOL_MAX_BYTES'])
+        pdf_generator.generate_inventory_report(report)
         
         return send_file(
-            pdf_buffer,
+            report,
             as_attachment=True,
             download_name=f'inventory_report_{datetime.now().strftime("%Y%m%d")}.pdf',
             mimetype='application/pdf'
@@ -1547,28 +1761,67 @@ def download_inventory_report():
         return redirect(url_for('reports'))
 
 
+def _sales_report_range(args):
+    """
+    Resolve the date range of a sales report from request arguments.
+
+    Explicit start/end dates win; otherwise period selects day (the date
+    argument, default today), week, month, ytd, the last 7d/30d/90d, or all.
+    Days are UTC days, like the order timestamps. Returns (start_date,
+    end_date, title).
+    """
+    from day_close import utc_today
+    today = utc_today()
+    if args.get('start') and args.get('end'):
+        start_date = datetime.strptime(args['start'], '%Y-%m-%d').date()
+        end_date = datetime.strptime(args['end'], '%Y-%m-%d').date()
+        if end_date < start_date:
+            raise ValueError('The end date must not be before the start date.')
+        return start_date, end_date, None
+    
+    period = args.get('period', 'day')
+    if period == 'week':
+        start_date = today - timedelta(days=today.weekday())
+        return start_date, today, f"Weekly Sales Report - Week of {start_date.strftime('%B %d, %Y')}"
+    if period == 'month':
+        return today.replace(day=1), today, f"Monthly Sales Report - {today.strftime('%B %Y')}"
+    if period == 'ytd':
+        return today.replace(month=1, day=1), today, f"Year-to-Date Sales Report - {today.year}"
+    if period in ('7d', '30d', '90d'):
+        days = int(period[:-1])
+        return today - timedelta(days=days - 1), today, f"Sales Report - Last {days} Days"
+    if period == 'all':
+        first_order = db.session.query(db.func.min(Order.created_at)).scalar()
+        return (first_order.date() if first_order else today), today, "Sales Report - All Time"
+    
+    report_date = args.get('date')
+    report_date = datetime.strptime(report_date, '%Y-%m-%d').date() if report_date else today
+    return report_date, report_date, None
+
+
 @app.route('/download/sales-summary')
 @login_required
 @requires_role(['admin', 'manager'])
 def download_sales_summary():
+    """Sales report for a day, week, month, year to date or custom range"""
+    try:
+        start_date, end_date, title = _sales_report_range(request.args)
+    except ValueError as e:
+        flash(f'Invalid report range: {str(e)}', 'error')
+        return redirect(url_for('reports'))
+    
     try:
-        report_date = request.args.get('date')
-        if report_date:
-            try:
-                report_date = datetime.strptime(report_date, '%Y-%m-%d').date()
-            except ValueError:
-                report_date = date.today()
-        else:
-            report_date = date.today()
-        
         from pdf_generator import SmartBillGenerator
         pdf_generator = SmartBillGenerator()
-        pdf_buffer = pdf_generator.generate_daily_sales_report(report_date)
+        if start_date == end_date and title is None:
+            pdf_buffer = pdf_generator.generate_daily_sales_report(start_date)
+        else:
+            pdf_buffer = pdf_generator.generate_sales_report(start_date, end_date, title)
         
         return send_file(
             pdf_buffer,
             as_attachment=True,
-            download_name=f'sales_summary_{report_date.strftime("%Y%m%d")}.pdf',
+            download_name=f'sales_summary_{start_date.strftime("%Y%m%d")}_{end_date.strftime("%Y%m%d")}.pdf',
             mimetype='application/pdf'
         )
     except Exception as e:
@@ -1602,25 +1855,11 @@ def get_ai_insights_api(insight_type):
 @login_required
 @requires_role(['admin', 'manager'])
 def regenerate_insights():
-    """Regenerate all AI insights with fresh data"""
-    try:
-        # Clear existing insights
-        AIInsight.query.filter_by(is_active=True).update({'is_active': False})
-        db.session.commit()
-        
-        # Generate new insights
-        generate_ai_insights()
-        
-        # Also generate advanced ML insights
-        from ai_engine import SmartBakeryAI
-        ai_engine = SmartBakeryAI()
-        ml_insights = ai_engine.generate_all_insights()
-        
-        flash('AI insights regenerated successfully!', 'success')
-        return jsonify({'success': True, 'message': 'Insights regenerated successfully'})
-    except Exception as e:
-        flash(f'Error regenerating insights: {str(e)}', 'error')
-        return jsonify({'success': False, 'message': str(e)}), 500
+    """Queue a regeneration of all AI insights with fresh data"""
+    data = request.get_json(silent=True) or {}
+    job, created = job_runner.submit('insights:regenerate', jobs.regenerate_insights, force=bool(data.get('force')))
+    message = 'Insight regeneration started' if created else 'Insight regeneration already in progress'
+    return jsonify({'success': True, 'message': message, 'queued': created, 'job': job.to_dict()}), 202
 
 @app.route('/api/ai-insights/<int:insight_id>/dismiss', methods=['POST'])
 @login_required
@@ -1655,6 +1894,7 @@ def implement_insight(insight_id):
                     if inventory:
                         forecast_demand = data.get('predicted_daily_demand', 0)
                         inventory.quantity = max(inventory.quantity, int(forecast_demand * 3))  # 3 days buffer
+                        inventory.last_updated = datetime.utcnow()
                         db.session.commit()
                         return jsonify({'success': True, 'message': f'Inventory updated for {product.name} based on forecast'})
         
@@ -1668,6 +1908,7 @@ def implement_insight(insight_id):
                         inventory = Inventory.query.filter_by(product_id=product.id).first()
                         if inventory and inventory.quantity < inventory.min_stock_level:
                             inventory.quantity = inventory.min_stock_level * 2
+                            inventory.last_updated = datetime.utcnow()
                 db.session.commit()
                 return jsonify({'success': True, 'message': 'Inventory levels optimized'})
         
@@ -1689,9 +1930,18 @@ def implement_insight(insight_id):
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
+@app.route('/api/replica/status')
+@login_required
+@requires_role(['admin'])
+def replica_status_api():
+    """Whether reports read from the replica, and how far behind it is"""
+    return jsonify(replica_status())
+
+
 @app.route('/api/analytics/customers')
 @login_required
 @requires_role(['admin', 'manager'])
+@reads_from_replica
 def customer_analytics():
     """Get customer analytics data"""
     try:
@@ -1729,6 +1979,7 @@ def customer_analytics():
 @app.route('/api/analytics/products')
 @login_required
 @requires_role(['admin', 'manager'])
+@reads_from_replica
 def product_analytics():
     """Get product analytics data"""
     try:
@@ -1760,53 +2011,103 @@ def product_analytics():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Forecast artifact shared by every request served from this worker
+_forecast_cache = TTLCache(maxsize=1)
+
+
+def _sales_trend_direction(days=30):
+    """Compare revenue of the two halves of the window with one grouped aggregate"""
+    now = datetime.now()
+    midpoint = now - timedelta(days=days / 2)
+    half = db.case((Order.created_at < midpoint, 'first'), else_='second')
+    rows = db.session.query(
+        half.label('half'),
+        db.func.count(Order.id),
+        db.func.coalesce(db.func.sum(Order.total_amount), 0)
+    ).filter(
+        Order.created_at >= now - timedelta(days=days),
+        Order.status != OrderStatus.CANCELLED
+    ).group_by(half).all()
+    
+    totals = {name: float(total) for name, count, total in rows}
+    if sum(count for name, count, total in rows) < 2:
+        return "→ Insufficient Data"
+    
+    first_half = totals.get('first', 0)
+    second_half = totals.get('second', 0)
+    if second_half > first_half:
+        return "↗️ Increasing"
+    elif second_half < first_half:
+        return "↘️ Decreasing"
+    return "→ Stable"
+
+
+def _build_demand_forecast(ai_engine, watermark):
+    """Read the stored ML forecast when it is current, training only on a miss"""
+    if ai_engine.is_fresh('demand_forecasting_ml', watermark):
+        ml_insights = AIInsight.query.filter_by(insight_type='ml_demand_forecast', is_active=True).all()
+    else:
+        ml_insights = ai_engine.demand_forecasting_ml()
+    
+    forecasts = []
+    for insight in ml_insights:
+        if insight.insight_type == 'ml_demand_forecast':
+            forecasts.append(insight.data if isinstance(insight.data, dict) else json.loads(insight.data))
+    
+    product_ids = {data.get('product_id') for data in forecasts}
+    names = dict(db.session.query(Product.id, Product.name).filter(Product.id.in_(product_ids)).all())
+    return [{
+        'product': names[data.get('product_id')],
+        'predicted_demand': round(data.get('predicted_daily_demand', 0), 1)
+    } for data in forecasts if data.get('product_id') in names]
+
+
+def _predictive_artifact():
+    """
+    Return the cached forecast artifact, rebuilding it only when orders moved.
+
+    Within PREDICTIVE_CACHE_TTL seconds the artifact is served without touching
+    the database; after that the order watermark is re-read and the artifact is
+    only recomputed if it changed.
+    """
+    artifact = _forecast_cache.get('predictive')
+    now = time_module.monotonic()
+    if artifact and now - artifact['checked_at'] < app.config['PREDICTIVE_CACHE_TTL']:
+        return artifact
+    
+    from ai_engine import SmartBakeryAI
+    ai_engine = SmartBakeryAI()
+    watermark = ai_engine.current_watermark('demand_forecasting_ml')
+    if artifact and artifact['watermark'] == watermark:
+        artifact['checked_at'] = now
+        return artifact
+    
+    artifact = {
+        'watermark': watermark,
+        'etag': hashlib.sha1(watermark.encode()).hexdigest(),
+        'checked_at': now,
+        'payload': {
+            'demand_forecast': _build_demand_forecast(ai_engine, watermark),
+            'trend_direction': _sales_trend_direction()
+        }
+    }
+    _forecast_cache.set('predictive', artifact)
+    return artifact
+
+
 @app.route('/api/analytics/predictive')
 @login_required
 @requires_role(['admin', 'manager'])
+@reads_from_replica
 def predictive_analytics():
     """Get predictive analytics data"""
     try:
-        # Generate demand forecast using AI engine
-        from ai_engine import SmartBakeryAI
-        ai_engine = SmartBakeryAI()
-        ml_insights = ai_engine.demand_forecasting_ml()
-        
-        # Extract demand forecast data
-        demand_forecast = []
-        for insight in ml_insights:
-            if insight.insight_type == 'ml_demand_forecast':
-                data = insight.data if isinstance(insight.data, dict) else json.loads(insight.data)
-                product = Product.query.get(data.get('product_id'))
-                if product:
-                    demand_forecast.append({
-                        'product': product.name,
-                        'predicted_demand': round(data.get('predicted_daily_demand', 0), 1)
-                    })
-        
-        # Determine trend direction based on recent sales
-        recent_orders = Order.query.filter(
-            Order.created_at >= datetime.now() - timedelta(days=30),
-            Order.status != OrderStatus.CANCELLED
-        ).all()
-        
-        if len(recent_orders) >= 2:
-            # Simple trend analysis
-            first_half = sum([o.total_amount for o in recent_orders[:len(recent_orders)//2]])
-            second_half = sum([o.total_amount for o in recent_orders[len(recent_orders)//2:]])
-            
-            if second_half > first_half:
-                trend_direction = "↗️ Increasing"
-            elif second_half < first_half:
-                trend_direction = "↘️ Decreasing"
-            else:
-                trend_direction = "→ Stable"
-        else:
-            trend_direction = "→ Insufficient Data"
-        
-        return jsonify({
-            'demand_forecast': demand_forecast,
-            'trend_direction': trend_direction
-        })
+        artifact = _predictive_artifact()
+        response = jsonify(artifact['payload'])
+        response.set_etag(artifact['etag'])
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -1814,6 +2115,7 @@ def predictive_analytics():
 @app.route('/api/chart-data')
 @login_required
 @requires_role(['admin', 'manager'])
+@reads_from_replica
 def get_chart_data():
     """Get dynamic chart data based on time period"""
     period = request.args.get('period', '7d')  # 7d, 30d, 90d, 1y
@@ -2120,14 +2422,8 @@ def bulk_update_configuration():
     """Bulk update configuration values"""
     try:
         updates = request.get_json()
-        for key, value in updates.items():
-            config = Configuration.query.filter_by(key=key).first()
-            if config and config.is_editable:
-                config.value = str(value)
-                config.updated_at = datetime.utcnow()
-        
-        db.session.commit()
-        return jsonify({'success': True, 'message': 'Configuration updated successfully!'})
+        updated = Configuration.bulk_update(updates)
+        return jsonify({'success': True, 'message': 'Configuration updated successfully!', 'updated': updated})
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'message': f'Error updating configuration: {str(e)}'})
@@ -2227,78 +2523,50 @@ def get_modification_changes(modification):
     
     return '; '.join(changes)
 
+def _wants_gzip():
+    return request.args.get('gzip', '').lower() in ('1', 'true', 'yes')
+
+
+@app.route('/api/orders/export')
+@login_required
+@requires_role(['admin', 'manager'])
+def export_orders_csv():
+    """Stream orders as CSV, filtered by start, end, status and type"""
+    try:
+        criteria = order_filters(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    filename = f"orders_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    return csv_response(filename, ORDER_EXPORT_HEADER, order_rows(criteria), compress=_wants_gzip())
+
+
+@app.route('/api/order-items/export')
+@login_required
+@requires_role(['admin', 'manager'])
+def export_order_items_csv():
+    """Stream order lines as CSV, filtered on their order by start, end, status and type"""
+    try:
+        criteria = order_filters(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    filename = f"order_items_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    return csv_response(filename, ORDER_ITEM_EXPORT_HEADER, order_item_rows(criteria), compress=_wants_gzip())
+
+
 @app.route('/api/modifications/export')
 @login_required
 @requires_role(['admin', 'manager'])
 def export_modifications():
-    """Export modifications to CSV"""
+    """Stream modifications as CSV"""
     try:
-        import csv
-        from io import StringIO
-        
-        # Get filter parameters
-        staff_id = request.args.get('staff_id', type=int)
-        modification_type = request.args.get('type')
-        date_from = request.args.get('date_from')
-        date_to = request.args.get('date_to')
-        
-        # Build query
-        query = ScheduleModification.query.join(StaffSchedule).join(User, StaffSchedule.staff_id == User.id)
-        
-        if staff_id:
-            query = query.filter(StaffSchedule.staff_id == staff_id)
-        
-        if modification_type:
-            query = query.filter(ScheduleModification.modification_type == modification_type)
-        
-        if date_from:
-            query = query.filter(ScheduleModification.modified_at >= datetime.strptime(date_from, '%Y-%m-%d'))
-        
-        if date_to:
-            query = query.filter(ScheduleModification.modified_at <= datetime.strptime(date_to, '%Y-%m-%d') + timedelta(days=1))
-        
-        modifications = query.order_by(ScheduleModification.modified_at.desc()).all()
-        
-        # Create CSV
-        si = StringIO()
-        cw = csv.writer(si)
-        
-        # Write header
-        cw.writerow([
-            'Date', 'Time', 'Staff Member', 'Schedule Date', 'Modification Type',
-            'Old Start Time', 'Old End Time', 'Old Position', 'Old Notes',
-            'New Start Time', 'New End Time', 'New Position', 'New Notes',
-            'Reason', 'Modified By', 'Modifier Role'
-        ])
-        
-        # Write data
-        for mod in modifications:
-            cw.writerow([
-                mod.modified_at.strftime('%Y-%m-%d'),
-                mod.modified_at.strftime('%H:%M:%S'),
-                f"{mod.schedule.staff_member.first_name} {mod.schedule.staff_member.last_name}",
-                mod.schedule.date.strftime('%Y-%m-%d'),
-                mod.modification_type.title(),
-                mod.old_start_time.strftime('%H:%M') if mod.old_start_time else '',
-                mod.old_end_time.strftime('%H:%M') if mod.old_end_time else '',
-                mod.old_position or '',
-                mod.old_notes or '',
-                mod.new_start_time.strftime('%H:%M') if mod.new_start_time else '',
-                mod.new_end_time.strftime('%H:%M') if mod.new_end_time else '',
-                mod.new_position or '',
-                mod.new_notes or '',
-                mod.reason or '',
-                f"{mod.modifier.first_name} {mod.modifier.last_name}",
-                mod.modifier.role.name.title()
-            ])
-        
-        output = make_response(si.getvalue())
-        output.headers["Content-Disposition"] = f"attachment; filename=schedule_modifications_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-        output.headers["Content-type"] = "text/csv"
-        return output
-        
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        criteria = modification_filters(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    filename = f"schedule_modifications_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    return csv_response(filename, MODIFICATION_EXPORT_HEADER, modification_rows(criteria), compress=_wants_gzip())
 
 
 @app.errorhandler(404)
@@ -2312,6 +2580,25 @@ def internal_error(error):
     return render_template('errors/500.html'), 500
 
 
+_trending_cache = TTLCache(maxsize=1, ttl=300)
+
+
+def _trending_products(limit=5):
+    """Best-selling active products, shared by every customer for a few minutes"""
+    trending = _trending_cache.get('trending')
+    if trending is None:
+        rows = db.session.query(Product.name, Product.price, Product.description)\
+            .join(OrderItem, OrderItem.product_id == Product.id)\
+            .join(Order, OrderItem.order_id == Order.id)\
+            .filter(Order.status != OrderStatus.CANCELLED, Product.is_active == True)\
+            .group_by(Product.id, Product.name, Product.price, Product.description)\
+            .order_by(db.func.count(OrderItem.id).desc())\
+            .limit(limit).all()
+        trending = [{'name': name, 'price': price, 'description': description} for name, price, description in rows]
+        _trending_cache.set('trending', trending)
+    return trending
+
+
 @app.route('/customer-ai-insights')
 @login_required
 def customer_ai_insights():
@@ -2323,65 +2610,29 @@ def customer_ai_insights():
     # Get customer's order history
     customer_orders = Order.query.filter_by(customer_id=current_user.id).all()
     
-    # Generate personalized recommendations
     recommendations = []
     
-    # Popular items recommendation
-    popular_products = db.session.query(Product, db.func.count(OrderItem.id).label('order_count'))\
-        .join(OrderItem)\
-        .join(Order)\
-        .filter(Order.status != OrderStatus.CANCELLED)\
-        .group_by(Product.id)\
-        .order_by(db.func.count(OrderItem.id).desc())\
-        .limit(5).all()
+    # Precomputed by the recommendation job from what similar customers bought
+    personal = Product.query.join(CustomerRecommendation, CustomerRecommendation.product_id == Product.id)\
+        .filter(CustomerRecommendation.customer_id == current_user.id, Product.is_active == True)\
+        .order_by(CustomerRecommendation.rank).all()
+    if personal:
+        recommendations.append({
+            'type': 'personalized',
+            'title': 'Recommended for You',
+            'description': 'Customers who order what you order also love these',
+            'items': [{'name': product.name, 'price': product.price, 'description': product.description} for product in personal]
+        })
     
-    if popular_products:
+    trending = _trending_products()
+    if trending:
         recommendations.append({
             'type': 'trending',
             'title': 'Trending Items',
-            'description': 'Our most popular items this week',
-            'items': [{'name': p[0].name, 'price': p[0].price, 'description': p[0].description} for p in popular_products]
+            'description': 'Our most popular items right now',
+            'items': trending
         })
     
-    # Seasonal recommendations
-    current_month = datetime.now().month
-    seasonal_items = []
-    if current_month in [12, 1, 2]:  # Winter
-        seasonal_items = ['Hot Chocolate', 'Warm Bread', 'Comfort Pastries']
-    elif current_month in [3, 4, 5]:  # Spring
-        seasonal_items = ['Fresh Fruit Tarts', 'Light Cakes', 'Spring Pastries']
-    elif current_month in [6, 7, 8]:  # Summer
-        seasonal_items = ['Iced Coffee', 'Fruit Pies', 'Light Desserts']
-    else:  # Fall
-        seasonal_items = ['Pumpkin Spice Items', 'Warm Pies', 'Autumn Cakes']
-    
-    recommendations.append({
-        'type': 'seasonal',
-        'title': 'Seasonal Favorites',
-        'description': f'Perfect for {["Winter", "Spring", "Summer", "Fall"][(current_month % 12) // 3]}',
-        'items': [{'name': item, 'description': f'Delicious {item.lower()} perfect for the season'} for item in seasonal_items]
-    })
-    
-    # Personalized recommendations based on order history
-    if customer_orders:
-        # Get customer's favorite categories
-        customer_categories = db.session.query(Category, db.func.count(OrderItem.id).label('count'))\
-            .join(Product)\
-            .join(OrderItem)\
-            .join(Order)\
-            .filter(Order.customer_id == current_user.id)\
-            .group_by(Category.id)\
-            .order_by(db.func.count(OrderItem.id).desc())\
-            .limit(3).all()
-        
-        if customer_categories:
-            recommendations.append({
-                'type': 'personalized',
-                'title': 'Based on Your Preferences',
-                'description': 'Items you might love based on your order history',
-                'items': [{'name': cat[0].name, 'description': f'You\'ve ordered {cat[0].name.lower()} {cat[1]} times'} for cat in customer_categories]
-            })
-    
     # AI-powered tips
     ai_tips = [
         {
@@ -0,0 +1,119 @@
+import atexit
+import logging
+import threading
+from datetime import datetime
+
+from flask import request
+from flask_login import current_user
+from sqlalchemy import update
+
+from cache import TTLCache
+
+
+class SessionActivityBuffer:
+    """
+    Collect UserSession.last_activity updates in memory and write them in batches.
+
+    Each session token is recorded at most once per flush interval, and a
+    background thread writes everything recorded since the last flush with one
+    UPDATE per batch. The thread is started on the first recorded activity, so
+    a worker forked from a preloaded app starts its own. The sessions page is
+    therefore accurate to within the flush interval.
+    """
+
+    def __init__(self, app=None, interval=30, batch_size=500):
+        self.app = None
+        self.interval = interval
+        self.batch_size = batch_size
+        self._pending = {}
+        self._recent = TTLCache(maxsize=10000, ttl=interval)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.interval = app.config.get('SESSION_ACTIVITY_FLUSH_INTERVAL', self.interval)
+        self._recent = TTLCache(maxsize=10000, ttl=self.interval)
+        app.extensions['session_activity'] = self
+        app.before_request(self._touch_current_session)
+        atexit.register(self.stop)
+
+    def _touch_current_session(self):
+        token = request.cookies.get('session_token')
+        if token and current_user.is_authenticated:
+            self.touch(token)
+
+    def touch(self, token, when=None):
+        """Record activity on a session; a no-op if it was recorded within the interval"""
+        if self._recent.get(token):
+            return False
+        self._recent.set(token, True)
+        with self._lock:
+            self._pending[token] = when or datetime.utcnow()
+        self._start()
+        return True
+
+    def pending(self):
+        with self._lock:
+            return dict(self._pending)
+
+    def flush(self):
+        """Write the recorded activity, returning how many sessions were updated"""
+        from models import db, UserSession
+
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        tokens = list(pending)
+        updated = 0
+        try:
+            with db.engine.begin() as conn:
+                for offset in range(0, len(tokens), self.batch_size):
+                    batch = {token: pending[token] for token in tokens[offset:offset + self.batch_size]}
+                    result = conn.execute(
+                        update(UserSession)
+                        .where(UserSession.session_token.in_(batch))
+                        .values(last_activity=db.case(batch, value=UserSession.session_token))
+                    )
+                    updated += result.rowcount
+        except Exception:
+            # Keep the activity for the next flush unless newer activity was recorded meanwhile
+            with self._lock:
+                for token, when in pending.items():
+                    self._pending.setdefault(token, when)
+            raise
+        return updated
+
+    def _start(self):
+        # Without an app the buffer is only flushed by hand
+        if self._thread is not None or self.app is None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name='session-activity', daemon=True)
+                self._thread.start()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self._flush_in_context()
+
+    def _flush_in_context(self):
+        try:
+            with self.app.app_context():
+                self.flush()
+        except Exception:
+            logging.exception("Could not flush session activity")
+
+    def stop(self):
+        """Stop the flush thread and write what is still buffered"""
+        self._stop.set()
+        if self.app is not None and self._pending:
+            self._flush_in_context()
+
+
+session_activity = SessionActivityBuffer()
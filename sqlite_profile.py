@@ -0,0 +1,92 @@
+import sqlalchemy as sa
+from sqlalchemy import event
+
+
+def is_sqlite_file(uri):
+    """Whether the URI is a SQLite database in a file, rather than in memory or another database"""
+    url = sa.engine.make_url(uri)
+    if url.get_backend_name() != 'sqlite':
+        return False
+    return url.database not in (None, '', ':memory:') and url.query.get('mode') != 'memory'
+
+
+def engine_options(uri, config):
+    """
+    Engine options for the database at uri.
+
+    A SQLite file gets a pool sized for the worker's threads. Connections to
+    a local file cannot go stale, so it skips the pre-ping and recycling that
+    other databases get, and a writer waits up to SQLITE_BUSY_TIMEOUT_MS for
+    the write lock instead of failing with "database is locked".
+    """
+    if not is_sqlite_file(uri):
+        return {
+            "pool_recycle": 300,
+            "pool_pre_ping": True,
+        }
+    return {
+        "poolclass": sa.pool.QueuePool,
+        "pool_size": config["SQLITE_POOL_SIZE"],
+        "max_overflow": config["SQLITE_POOL_OVERFLOW"],
+        "pool_timeout": config["SQLITE_POOL_TIMEOUT"],
+        "connect_args": {
+            "timeout": config["SQLITE_BUSY_TIMEOUT_MS"] / 1000,
+            "check_same_thread": False,
+        },
+    }
+
+
+def sqlite_pragmas(config):
+    """The pragmas run on every new connection, in order"""
+    return (
+        # Readers no longer block the writer, nor the writer readers
+        ('journal_mode', config['SQLITE_JOURNAL_MODE']),
+        # In WAL mode NORMAL only syncs at checkpoints; a commit can be lost on power loss, not corrupted
+        ('synchronous', config['SQLITE_SYNCHRONOUS']),
+        ('busy_timeout', config['SQLITE_BUSY_TIMEOUT_MS']),
+        ('mmap_size', config['SQLITE_MMAP_SIZE']),
+        # Negative: in KiB rather than pages
+        ('cache_size', -config['SQLITE_CACHE_SIZE_KB']),
+        ('journal_size_limit', config['SQLITE_JOURNAL_SIZE_LIMIT']),
+        ('temp_store', 'MEMORY'),
+    )
+
+
+def apply_pragmas(dbapi_connection, pragmas):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas:
+            cursor.execute(f'PRAGMA {name}={value}')
+    finally:
+        cursor.close()
+
+
+class SQLiteProfile:
+    """
+    Runs the SQLITE_* pragmas on every connection to a SQLite database file.
+
+    Applies to every bind of the app that is a SQLite file, so a SQLite read
+    replica is set up the same way as the primary. Other databases, and
+    in-memory SQLite, are left alone.
+    """
+
+    def __init__(self, app=None):
+        self.pragmas = ()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from models import db
+
+        self.pragmas = sqlite_pragmas(app.config)
+        app.extensions['sqlite_profile'] = self
+        with app.app_context():
+            for engine in db.engines.values():
+                if is_sqlite_file(engine.url) and not event.contains(engine, 'connect', self._configure_connection):
+                    event.listen(engine, 'connect', self._configure_connection)
+
+    def _configure_connection(self, dbapi_connection, connection_record):
+        apply_pragmas(dbapi_connection, self.pragmas)
+
+
+sqlite_profile = SQLiteProfile()
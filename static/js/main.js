@@ -277,7 +277,8 @@ function initializeAIInsights() {
         });
     }
     
-    // Auto-refresh insights every 5 minutes on dashboard
+    // Auto-refresh insights every 5 minutes on dashboard; the server collapses
+    // requests from other tabs into the job that is already queued or just finished
     if (window.location.pathname === '/dashboard') {
         setInterval(refreshAIInsights, 300000);
     }
@@ -285,7 +286,6 @@ function initializeAIInsights() {
 
 function refreshAIInsights() {
     const btn = document.querySelector('.refresh-insights-btn');
-    const insightsContainer = document.querySelector('.ai-insights-container');
     
     if (btn) {
         btn.disabled = true;
@@ -300,15 +300,21 @@ function refreshAIInsights() {
     })
     .then(response => response.json())
     .then(data => {
-        if (data.success) {
-            showNotification('AI insights refreshed successfully', 'success');
-            // Reload the page to show updated insights
-            setTimeout(() => {
-                window.location.reload();
-            }, 1000);
-        } else {
+        if (!data.success) {
+            throw new Error('Refresh request rejected');
+        }
+        return waitForJob(data.job);
+    })
+    .then(job => {
+        if (job.status === 'failed') {
             showNotification('Failed to refresh insights', 'error');
+            return;
         }
+        showNotification('AI insights refreshed successfully', 'success');
+        // Reload the page to show updated insights
+        setTimeout(() => {
+            window.location.reload();
+        }, 1000);
     })
     .catch(error => {
         console.error('Error refreshing insights:', error);
@@ -322,6 +328,26 @@ function refreshAIInsights() {
     });
 }
 
+// Poll a background job until it has finished
+function waitForJob(job, interval = 2000, maxUnknown = 15) {
+    if (job.status === 'succeeded' || job.status === 'failed') {
+        return Promise.resolve(job);
+    }
+    
+    return new Promise(resolve => setTimeout(resolve, interval))
+        .then(() => fetch(`/api/insights/jobs/${job.id}`))
+        .then(response => {
+            // Other workers only know the job once it has started; keep asking for a while
+            if (response.status === 404) {
+                if (maxUnknown <= 0) {
+                    return Object.assign({}, job, { status: 'failed', error: 'Job not found' });
+                }
+                return waitForJob(job, interval, maxUnknown - 1);
+            }
+            return response.json().then(current => waitForJob(current, interval, maxUnknown));
+        });
+}
+
 // Order status updates
 function updateOrderStatus(orderId, newStatus) {
     const statusBadge = document.querySelector(`[data-order-id="${orderId}"] .status-badge`);
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Test script for the configuration cache and its version stamp
+"""
+
+import os
+import sys
+import threading
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import event
+
+from app import app, db
+from models import Configuration
+from config_cache import ConfigurationCache, configuration_cache, current_configuration_version
+
+KEYS = ('cache_test_rate', 'cache_test_enabled', 'cache_test_name')
+
+
+class StatementCounter:
+    """Counts the statements run by this thread while active"""
+
+    def __init__(self):
+        self.statements = []
+        self._thread = threading.get_ident()
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() == self._thread:
+            self.statements.append(statement)
+
+    def __enter__(self):
+        event.listen(db.engine, 'before_cursor_execute', self)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(db.engine, 'before_cursor_execute', self)
+
+
+def _cleanup():
+    Configuration.query.filter(Configuration.key.in_(KEYS)).delete(synchronize_session=False)
+    db.session.commit()
+    configuration_cache.invalidate()
+
+
+def test_values_are_typed_and_cached():
+    """Values come back converted, and repeated reads run no query"""
+    with app.app_context():
+        try:
+            Configuration.set_value('cache_test_rate', '8.5', data_type='float')
+            Configuration.set_value('cache_test_enabled', 'true', data_type='boolean')
+            assert Configuration.get_value('cache_test_rate') == 8.5
+
+            with StatementCounter() as counter:
+                for _ in range(100):
+                    assert Configuration.get_value('cache_test_enabled') is True
+                    assert Configuration.get_value('cache_test_missing', 'x') == 'x'
+            assert counter.statements == []
+        finally:
+            _cleanup()
+
+
+def test_bulk_update_bumps_version_once():
+    """A bulk update is one UPDATE plus one version bump, and other processes reload on the new version"""
+    with app.app_context():
+        try:
+            for key in KEYS:
+                Configuration.set_value(key, '1', data_type='integer')
+            other_worker = ConfigurationCache(check_interval=0)
+            assert other_worker.get('cache_test_name') == 1
+            version = current_configuration_version(db.session)
+
+            with StatementCounter() as counter:
+                updated = Configuration.bulk_update({key: 2 for key in KEYS} | {'cache_test_unknown': 3})
+            writes = [s for s in counter.statements if s.lstrip().upper().startswith(('UPDATE', 'INSERT'))]
+            print(f"Bulk update of {updated} keys ran {len(writes)} writes")
+            assert updated == 3
+            assert len(writes) == 2
+            assert current_configuration_version(db.session) == version + 1
+
+            assert Configuration.get_value('cache_test_name') == 2
+            assert other_worker.get('cache_test_rate') == 2
+            assert Configuration.get_value('cache_test_unknown') is None
+        finally:
+            _cleanup()
+
+
+def test_uncommitted_changes_are_not_cached():
+    """A flushed change is not served until committed, and nothing of it stays after a rollback"""
+    with app.app_context():
+        try:
+            Configuration.set_value('cache_test_rate', '1', data_type='integer')
+            configuration_cache.check_interval = 0
+            version = current_configuration_version(db.session)
+
+            Configuration.query.filter_by(key='cache_test_rate').first().value = '99'
+            db.session.flush()
+            assert Configuration.get_value('cache_test_rate') == 1
+            db.session.rollback()
+
+            assert Configuration.get_value('cache_test_rate') == 1
+            assert configuration_cache.version == version
+
+            # The next real change is still picked up
+            Configuration.set_value('cache_test_rate', '2', data_type='integer')
+            assert Configuration.get_value('cache_test_rate') == 2
+        finally:
+            configuration_cache.check_interval = app.config['CONFIG_VERSION_CHECK_INTERVAL']
+            _cleanup()
+
+
+if __name__ == "__main__":
+    test_values_are_typed_and_cached()
+    test_bulk_update_bumps_version_once()
+    test_uncommitted_changes_are_not_cached()
+    print("Configuration cache tests completed!")
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Test script for the streamed CSV exports
+"""
+
+import csv
+import gzip
+import io
+import os
+import sys
+import time
+from datetime import date, datetime
+from datetime import time as clock
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import app, db
+from werkzeug.datastructures import MultiDict
+from sqlalchemy import event
+
+from models import (
+    User, Category, Order, OrderItem, OrderStatus, OrderType, Product, StaffSchedule, ScheduleModification
+)
+from csv_export import (
+    stream_csv, order_filters, order_rows, order_item_rows, modification_filters, modification_rows
+)
+
+
+def test_stream_csv_chunks():
+    """Rows are written a chunk at a time and gzip output decompresses to the same CSV"""
+    rows = [[i, f'name {i}'] for i in range(25)]
+
+    chunks = list(stream_csv(['id', 'name'], iter(rows), chunk_size=10))
+    plain = b''.join(chunks).decode('utf-8')
+    print(f"Plain export: {len(chunks)} chunks, {len(plain)} bytes")
+    # Header, two full chunks and the remainder
+    assert len(chunks) == 4
+    parsed = list(csv.reader(io.StringIO(plain)))
+    assert parsed[0] == ['id', 'name']
+    assert parsed[-1] == ['24', 'name 24']
+
+    compressed = b''.join(stream_csv(['id', 'name'], iter(rows), compress=True, chunk_size=10))
+    assert gzip.decompress(compressed).decode('utf-8') == plain
+
+
+def test_order_export_filters():
+    """Status and type filters narrow both the order and the order line exports"""
+    with app.app_context():
+        customer = User.query.first()
+        stamp = int(time.time() * 1000)
+        category = Category(name=f'CSV {stamp}')
+        product = Product(name=f'CSV Loaf {stamp}', sku=f'CSV{stamp}', price=5, category=category)
+        db.session.add(product)
+        orders = [
+            Order(order_number=f'CSV{stamp}A', customer_id=customer.id, total_amount=10,
+                  status=OrderStatus.DELIVERED, order_type=OrderType.CATERING),
+            Order(order_number=f'CSV{stamp}B', customer_id=customer.id, total_amount=20,
+                  status=OrderStatus.CANCELLED, order_type=OrderType.CATERING),
+        ]
+        for order in orders:
+            order.items.append(OrderItem(product=product, quantity=2, unit_price=5, total_price=10))
+            db.session.add(order)
+        db.session.commit()
+
+        try:
+            criteria = order_filters({'status': 'delivered', 'type': 'catering'})
+            numbers = [row[0] for row in order_rows(criteria, chunk_size=2)]
+            print(f"Delivered catering orders: {len(numbers)}")
+            assert orders[0].order_number in numbers
+            assert orders[1].order_number not in numbers
+
+            lines = [row for row in order_item_rows(criteria) if row[0] == orders[0].order_number]
+            assert lines[0][4:7] == [product.sku, product.name, 2]
+
+            try:
+                order_filters({'status': 'lost'})
+                assert False, 'unknown status accepted'
+            except ValueError:
+                pass
+        finally:
+            for order in orders:
+                db.session.delete(order)
+            db.session.delete(product)
+            db.session.delete(category)
+            db.session.commit()
+
+
+def test_modification_rows_single_query():
+    """The modification export reads staff, modifier and role in one statement"""
+    with app.app_context():
+        user = User.query.first()
+        user_id = user.id
+        schedule = StaffSchedule(staff_id=user_id, date=date(2030, 1, 2), start_time=clock(8), end_time=clock(16))
+        modification = ScheduleModification(
+            schedule=schedule, modification_type='updated', new_start_time=clock(9),
+            reason='Swap', modified_by=user_id, modified_at=datetime(2030, 1, 1, 12, 30)
+        )
+        db.session.add_all([schedule, modification])
+        db.session.commit()
+
+        statements = []
+
+        def count(conn, cursor, statement, *args):
+            statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            criteria = modification_filters(MultiDict({'staff_id': str(user_id), 'date_from': '2030-01-01'}))
+            rows = list(modification_rows(criteria))
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count)
+            db.session.delete(modification)
+            db.session.delete(schedule)
+            db.session.commit()
+
+        print(f"Modification rows: {rows}, statements: {len(statements)}")
+        assert len(statements) == 1
+        assert len(rows) == 1
+        assert rows[0][:5] == ['2030-01-01', '12:30:00', f'{user.first_name} {user.last_name}', '2030-01-02', 'Updated']
+        assert rows[0][9] == '09:00'
+        assert rows[0][15] == user.role.name.title()
+
+
+if __name__ == "__main__":
+    test_stream_csv_chunks()
+    test_order_export_filters()
+    test_modification_rows_single_query()
+    print("CSV export tests completed!")
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Test script for the day-close report prebuilding
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+from datetime import date, datetime, time
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import app, db
+from models import User, Order, ReportArtifact
+from day_close import close_day, daily_sales_report, inventory_snapshot, DayCloseScheduler, DAILY_SALES
+
+
+def test_close_day_prebuilds_and_refreshes():
+    """Closing a day stores both reports; only an order change rebuilds the sales report"""
+    report_date = date(2020, 3, 14)
+    cache_dir = app.config.get('REPORT_CACHE_DIR')
+    app.config['REPORT_CACHE_DIR'] = tempfile.mkdtemp()
+    app.extensions.pop('report_cache', None)
+
+    try:
+        _close_day_and_refresh(report_date)
+    finally:
+        shutil.rmtree(app.config['REPORT_CACHE_DIR'], ignore_errors=True)
+        app.config['REPORT_CACHE_DIR'] = cache_dir
+        app.extensions.pop('report_cache', None)
+
+
+def _close_day_and_refresh(report_date):
+    with app.app_context():
+        customer = User.query.first()
+        order = Order(order_number=f'CLOSE{int(datetime.now().timestamp() * 1000)}', customer_id=customer.id,
+                      total_amount=12, created_at=datetime.combine(report_date, time(10)))
+        db.session.add(order)
+        db.session.commit()
+
+        try:
+            first = close_day(report_date)
+            print(f"First close: {first}")
+            assert first['reports']['daily_sales']['built']
+            assert first['reports']['inventory']['built']
+
+            again = close_day(report_date)
+            assert not again['reports']['daily_sales']['built']
+            assert not again['reports']['inventory']['built']
+
+            artifact, path = daily_sales_report(report_date)
+            stored_key = artifact.cache_key
+            assert os.path.exists(path)
+
+            order.total_amount = 15
+            db.session.commit()
+            changed, changed_path = daily_sales_report(report_date)
+            print(f"Sales report key: {stored_key[:12]} -> {changed.cache_key[:12]}")
+            assert changed.cache_key != stored_key
+            assert changed_path != path
+
+            snapshot, snapshot_path = inventory_snapshot(report_date)
+            assert snapshot is not None and os.path.exists(snapshot_path)
+
+            # A day that was never closed is not stored on a download
+            unclosed = date(2020, 3, 15)
+            assert daily_sales_report(unclosed) == (None, None)
+            assert ReportArtifact.query.filter_by(kind=DAILY_SALES, report_date=unclosed).count() == 0
+        finally:
+            ReportArtifact.query.filter_by(report_date=report_date).delete()
+            db.session.delete(order)
+            db.session.commit()
+
+
+def test_scheduler_next_run():
+    """The scheduler runs at the configured time, today if it is still ahead"""
+    scheduler = DayCloseScheduler()
+    scheduler.run_at = time(0, 5)
+    assert scheduler.next_run(datetime(2024, 5, 1, 0, 1)) == datetime(2024, 5, 1, 0, 5)
+    assert scheduler.next_run(datetime(2024, 5, 1, 9, 0)) == datetime(2024, 5, 2, 0, 5)
+
+
+if __name__ == "__main__":
+    test_close_day_prebuilds_and_refreshes()
+    test_scheduler_next_run()
+    print("Day close tests completed!")
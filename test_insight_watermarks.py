@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Test script for skipping AI analyses whose inputs have not changed
+"""
+
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import app, db
+from models import User, Category, Product, RawProduct, ProductRecipe, Order, OrderItem, Inventory
+from ai_engine import SmartBakeryAI
+
+
+def recomputed(engine):
+    return sorted(name for name, outcome in engine.last_run.items() if outcome == 'recomputed')
+
+
+def test_skip_until_inputs_change():
+    """Unchanged inputs skip every analysis; inserts, deletes and edits without a timestamp rerun the ones reading them"""
+    print("Testing insight watermarks...")
+
+    with app.app_context():
+        stamp = int(time.time() * 1000)
+        customer = User.query.filter_by(username='admin').first()
+        category = Category(name=f'Watermark {stamp}')
+        bun = Product(name=f'Bun {stamp}', sku=f'WM{stamp}', price=2, category=category)
+        sugar = RawProduct(name=f'Sugar {stamp}', unit_of_measure='kg', cost_per_unit=1, current_stock=50)
+        db.session.add_all([category, bun, sugar])
+        db.session.flush()
+        recipe = ProductRecipe(product_id=bun.id, raw_product_id=sugar.id, quantity_required=0.1, unit_of_measure='kg')
+        stock = Inventory(product_id=bun.id, quantity=5)
+        old = Order(order_number=f'WM{stamp}A', customer_id=customer.id, total_amount=2,
+                    created_at=datetime.utcnow() - timedelta(days=400), updated_at=datetime.utcnow() - timedelta(days=400))
+        order = Order(order_number=f'WM{stamp}B', customer_id=customer.id, total_amount=2)
+        order.items.append(OrderItem(product=bun, quantity=1, unit_price=2, total_price=2))
+        db.session.add_all([recipe, stock, old, order])
+        db.session.commit()
+
+        try:
+            SmartBakeryAI().generate_all_insights()
+            engine = SmartBakeryAI()
+            engine.generate_all_insights()
+            print(f"Unchanged: {engine.last_run}")
+            assert recomputed(engine) == []
+
+            # A line added to an existing order leaves the order's updated_at alone
+            db.session.execute(OrderItem.__table__.insert().values(
+                order_id=order.id, product_id=bun.id, quantity=3, unit_price=2, total_price=6))
+            db.session.commit()
+            engine = SmartBakeryAI()
+            engine.generate_all_insights()
+            print(f"Order line added: {engine.last_run}")
+            assert recomputed(engine) == ['demand_forecasting_ml', 'dynamic_pricing_optimization',
+                                          'supply_chain_optimization']
+
+            # Deleting an order that is not the newest leaves MAX(updated_at) alone
+            db.session.delete(old)
+            db.session.commit()
+            engine = SmartBakeryAI()
+            engine.generate_all_insights()
+            print(f"Order deleted: {engine.last_run}")
+            assert 'customer_behavior_analysis' in recomputed(engine)
+
+            recipe.quantity_required = 0.2
+            db.session.commit()
+            engine = SmartBakeryAI()
+            engine.generate_all_insights()
+            print(f"Recipe edited: {engine.last_run}")
+            assert recomputed(engine) == ['supply_chain_optimization']
+
+            # Stock changed without touching last_updated
+            db.session.execute(Inventory.__table__.update().where(Inventory.id == stock.id).values(quantity=50))
+            db.session.commit()
+            engine = SmartBakeryAI()
+            engine.generate_all_insights()
+            print(f"Stock changed: {engine.last_run}")
+            assert recomputed(engine) == ['dynamic_pricing_optimization']
+        finally:
+            for item in OrderItem.query.filter_by(order_id=order.id).all():
+                db.session.delete(item)
+            db.session.flush()
+            for obj in [order, recipe, stock, bun, sugar, category]:
+                db.session.delete(obj)
+            db.session.commit()
+
+
+if __name__ == "__main__":
+    test_skip_until_inputs_change()
+    print("Insight watermark tests completed!")
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Test script for the streamed inventory report PDF
+"""
+
+import base64
+import os
+import re
+import sys
+import time
+import zlib
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import app, db
+from models import Category, Product, Inventory
+from pdf_generator import SmartBillGenerator
+
+
+def pdf_text(pdf):
+    """The decoded content streams of a ReportLab PDF (ASCII85, then Flate), for searching shown text"""
+    text = []
+    for data in re.findall(rb'stream\r?\n(.*?)~>\s*endstream', pdf, re.S):
+        text.append(zlib.decompress(base64.a85decode(re.sub(rb'\s', b'', data))))
+    return b'\n'.join(text)
+
+
+def test_every_table_chunk_is_laid_out():
+    """A report of several rows_per_table chunks is a complete PDF holding every row"""
+    print("Testing inventory report chunks...")
+
+    with app.app_context():
+        stamp = int(time.time() * 1000)
+        category = Category(name=f'Report {stamp}')
+        products = [Product(name=f'Chunk {stamp} {i:03d}', sku=f'RPT{stamp}{i}', price=1, cost=0.5,
+                            category=category) for i in range(23)]
+        db.session.add_all([category] + products)
+        db.session.flush()
+        stock = [Inventory(product_id=product.id, quantity=i, min_stock_level=5, max_stock_level=50)
+                 for i, product in enumerate(products)]
+        db.session.add_all(stock)
+        db.session.commit()
+
+        try:
+            total_rows = Inventory.query.count()
+            rows_per_table = 5
+            pdf = SmartBillGenerator().generate_inventory_report(rows_per_table=rows_per_table).getvalue()
+            text = pdf_text(pdf)
+            tables = text.count(b'(Current Stock)')
+            print(f"{len(pdf)} bytes, {tables} tables for {total_rows} rows")
+
+            assert pdf.startswith(b'%PDF') and pdf.rstrip().endswith(b'%%EOF')
+            missing = [product.name for product in products if f'({product.name})'.encode() not in text]
+            assert missing == []
+            # A table split across pages repeats its header, so there can be more headers than chunks
+            assert tables >= -(-total_rows // rows_per_table)
+        finally:
+            for obj in stock:
+                db.session.delete(obj)
+            db.session.flush()
+            for obj in products + [category]:
+                db.session.delete(obj)
+            db.session.commit()
+
+
+if __name__ == "__main__":
+    test_every_table_chunk_is_laid_out()
+    print("Inventory report tests completed!")
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Test script for the streamed invoice ZIP export
+"""
+
+import io
+import os
+import sys
+import tempfile
+import time
+import zipfile
+from datetime import date, datetime
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import app, db
+from models import User, Order
+from pdf_cache import PDFCache
+from invoice_export import stream_invoice_zip, get_render_pool, _discard_render_pool
+
+
+class CountingCache(PDFCache):
+    """A PDF cache that remembers how many invoices were rendered into it"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.puts = 0
+
+    def put(self, key, data):
+        self.puts += 1
+        return super().put(key, data)
+
+
+def test_export_is_a_valid_zip_and_reuses_the_cache():
+    """Every order in the range is one PDF entry; the second export renders nothing"""
+    print("Testing invoice ZIP export...")
+
+    with app.app_context():
+        stamp = int(time.time() * 1000)
+        customer = User.query.first()
+        orders = [
+            Order(order_number=f'ZIP{stamp}{i}', customer_id=customer.id, total_amount=10 + i,
+                  created_at=created_at)
+            for i, created_at in enumerate([
+                datetime(2018, 3, 1, 0, 0),
+                datetime(2018, 3, 2, 12, 0),
+                datetime(2018, 3, 3, 23, 59, 59),
+                datetime(2018, 3, 4, 0, 0),   # the day after
+            ])
+        ]
+        db.session.add_all(orders)
+        db.session.commit()
+        expected = sorted(f'invoice_{order.order_number}.pdf' for order in orders[:3])
+
+        cache = CountingCache(tempfile.mkdtemp())
+        try:
+            for run in ('first', 'second'):
+                puts = cache.puts
+                data = b''.join(stream_invoice_zip(date(2018, 3, 1), date(2018, 3, 3), cache, chunk_size=2))
+                with zipfile.ZipFile(io.BytesIO(data)) as archive:
+                    names = sorted(archive.namelist())
+                    print(f"{run.capitalize()} export: {len(data)} bytes, {names}, rendered {cache.puts - puts}")
+                    assert archive.testzip() is None
+                    assert names == expected
+                    assert all(archive.read(name).startswith(b'%PDF') for name in names)
+            # The second export copied every invoice from the cache
+            assert cache.puts == 3
+        finally:
+            for order in orders:
+                db.session.delete(order)
+            db.session.commit()
+            _discard_render_pool(get_render_pool(2))
+
+
+if __name__ == "__main__":
+    test_export_is_a_valid_zip_and_reuses_the_cache()
+    print("Invoice export tests completed!")
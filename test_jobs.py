@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Test script for the background job runner
+"""
+
+import os
+import sys
+import threading
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import app
+from jobs import Job, JobRunner
+
+
+def wait_for(job, timeout=5):
+    """Block until the job has finished"""
+    import time
+    deadline = time.time() + timeout
+    while job.is_active and time.time() < deadline:
+        time.sleep(0.01)
+    return job
+
+
+def test_job_dedupe():
+    """Concurrent submissions with the same key collapse into one run"""
+    runner = JobRunner(app)
+    release = threading.Event()
+    calls = []
+
+    def slow_job():
+        calls.append(1)
+        release.wait(5)
+        return {'done': True}
+
+    first, created_first = runner.submit('insights:test', slow_job)
+    second, created_second = runner.submit('insights:test', slow_job)
+
+    print(f"First job {first.id} created={created_first}")
+    print(f"Second job {second.id} created={created_second}")
+    assert created_first
+    assert not created_second
+    assert first is second
+
+    release.set()
+    wait_for(first)
+    assert first.status == Job.SUCCEEDED
+    assert first.result == {'done': True}
+    assert len(calls) == 1
+
+    # A finished job inside the cooldown window is reused
+    third, created_third = runner.submit('insights:test', slow_job, cooldown=60)
+    assert not created_third
+    assert third is first
+
+    # Without a cooldown a new run starts
+    fourth, created_fourth = runner.submit('insights:test', slow_job)
+    assert created_fourth
+    wait_for(fourth)
+    assert len(calls) == 2
+    assert runner.get(fourth.id) is fourth
+
+
+def test_job_failure():
+    """Errors are captured on the job instead of propagating"""
+    runner = JobRunner(app)
+
+    def broken_job():
+        raise RuntimeError('boom')
+
+    job, created = runner.submit('insights:broken', broken_job)
+    wait_for(job)
+    print(f"Job status: {job.status}, error: {job.error}")
+    assert job.status == Job.FAILED
+    assert job.error == 'boom'
+
+
+def test_trailing_submissions_run_once_more():
+    """Submissions turned away while a job runs or cools down lead to exactly one more run"""
+    import time
+    runner = JobRunner(app)
+    release = threading.Event()
+    calls = []
+
+    def slow_job():
+        calls.append(time.monotonic())
+        release.wait(5)
+
+    first, _ = runner.submit('insights:trailing', slow_job, cooldown=0.3, trailing=True)
+    for _ in range(3):
+        job, created = runner.submit('insights:trailing', slow_job, cooldown=0.3, trailing=True)
+        assert not created
+    release.set()
+    wait_for(first)
+
+    deadline = time.time() + 5
+    while len(calls) < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    wait_for(runner.latest('insights:trailing'))
+    print(f"Runs: {len(calls)}, {calls[1] - calls[0]:.2f}s apart")
+    assert len(calls) == 2
+    assert calls[1] - calls[0] >= 0.3
+
+    # Nothing was turned away during the second run, so there is no third
+    time.sleep(0.5)
+    assert len(calls) == 2
+
+    # A submission inside the cooldown runs when it ends
+    runner.submit('insights:trailing', slow_job, cooldown=0.3, trailing=True)
+    deadline = time.time() + 5
+    while len(calls) < 3 and time.time() < deadline:
+        time.sleep(0.01)
+    assert len(calls) == 3
+
+
+def test_job_state_shared_between_workers():
+    """A job started by one worker process can be polled on another"""
+    import time
+    started_here = JobRunner(app)
+    elsewhere = JobRunner(app)
+
+    job, created = started_here.submit('insights:shared', lambda: {'count': 3})
+    wait_for(job)
+    with app.app_context():
+        deadline = time.time() + 5
+        seen = elsewhere.get(job.id)
+        while (seen is None or seen.is_active) and time.time() < deadline:
+            time.sleep(0.01)
+            seen = elsewhere.get(job.id)
+        print(f"Seen by another worker: {seen.to_dict()}")
+        assert seen is not job
+        assert seen.status == Job.SUCCEEDED
+        assert seen.result == {'count': 3}
+        assert elsewhere.get('unknown-job') is None
+
+
+if __name__ == "__main__":
+    test_job_dedupe()
+    test_job_failure()
+    test_trailing_submissions_run_once_more()
+    test_job_state_shared_between_workers()
+    print("Job runner tests completed!")
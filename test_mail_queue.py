@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Test script for the outbound mail queue, against a local aiosmtpd server
+"""
+
+import json
+import logging
+import os
+import socket
+import sys
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from app import app, db
+from models import OutboundEmail
+from mail_queue import mail_queue
+from utils import send_email_otp
+
+aiosmtpd_controller = pytest.importorskip('aiosmtpd.controller')
+
+
+class RecordingHandler:
+    def __init__(self):
+        self.messages = []
+        self.sessions = 0
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        self.sessions += 1
+        session.host_name = hostname
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append((envelope.rcpt_tos, envelope.content))
+        return '250 Message accepted for delivery'
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _use_smtp(port):
+    # Sent by the drain() calls below rather than the background worker
+    app.config.update(MAIL_QUEUE_WORKER=False, MAILGUN_API_KEY=None, MAIL_SMTP_HOST='127.0.0.1', MAIL_SMTP_PORT=port,
+                      MAIL_SMTP_USERNAME=None, MAIL_SMTP_PASSWORD=None, MAIL_SMTP_STARTTLS=False,
+                      MAIL_FROM='noreply@bakebrain.local')
+    mail_queue.reset_transports()
+
+
+def test_queued_mail_is_sent_over_one_connection():
+    """Requests only queue mail; draining sends it all over a single SMTP connection"""
+    handler = RecordingHandler()
+    port = _free_port()
+    controller = aiosmtpd_controller.Controller(handler, hostname='127.0.0.1', port=port)
+    controller.start()
+    try:
+        with app.app_context():
+            _use_smtp(port)
+            OutboundEmail.query.delete()
+            db.session.commit()
+
+            for i in range(3):
+                assert send_email_otp(f'queued{i}@example.com', f'00000{i}')
+            assert handler.messages == []
+
+            stats = mail_queue.drain()
+            print(f"Drain stats: {stats}, SMTP sessions: {handler.sessions}")
+            assert stats == {'sent': 3, 'retried': 0, 'failed': 0}
+            assert len(handler.messages) == 3 and handler.sessions == 1
+            assert OutboundEmail.query.filter_by(status='sent').count() == 3
+    finally:
+        mail_queue.reset_transports()
+        controller.stop()
+
+
+def test_failed_mail_is_retried_with_backoff():
+    """A send that fails is rescheduled and delivered once the server is back"""
+    port = _free_port()
+    with app.app_context():
+        _use_smtp(port)
+        OutboundEmail.query.delete()
+        db.session.commit()
+
+        message = mail_queue.enqueue('retry@example.com', 'Retry test', '<p>Hello</p>')
+        message_id = message.id
+        stats = mail_queue.drain()
+        assert stats == {'sent': 0, 'retried': 1, 'failed': 0}
+        message = db.session.get(OutboundEmail, message_id)
+        assert message.status == 'pending' and message.attempts == 1
+        assert message.next_attempt_at > datetime.utcnow() and message.last_error
+
+        # Not due yet, so a drain leaves it alone
+        assert mail_queue.drain() == {'sent': 0, 'retried': 0, 'failed': 0}
+
+        handler = RecordingHandler()
+        controller = aiosmtpd_controller.Controller(handler, hostname='127.0.0.1', port=port)
+        controller.start()
+        try:
+            message.next_attempt_at = datetime.utcnow()
+            db.session.commit()
+            assert mail_queue.drain()['sent'] == 1
+            assert handler.messages[0][0] == ['retry@example.com']
+            assert db.session.get(OutboundEmail, message_id).attempts == 2
+        finally:
+            mail_queue.reset_transports()
+            controller.stop()
+
+
+class FakeMailgun(BaseHTTPRequestHandler):
+    """Answers every message with the status and message set on the server"""
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        body = json.dumps({'message': self.server.reply[1]}).encode()
+        self.send_response(self.server.reply[0])
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_mailgun_rejections():
+    """A Mailgun auth error falls through to SMTP; only a rejected recipient fails for good"""
+    port = _free_port()
+    mailgun = HTTPServer(('127.0.0.1', 0), FakeMailgun)
+    threading.Thread(target=mailgun.serve_forever, daemon=True).start()
+    handler = RecordingHandler()
+    controller = aiosmtpd_controller.Controller(handler, hostname='127.0.0.1', port=port)
+    controller.start()
+    with app.app_context():
+        try:
+            _use_smtp(port)
+            app.config.update(MAILGUN_API_KEY='wrong-key', MAILGUN_DOMAIN='bakebrain.local',
+                              MAILGUN_API_URL=f'http://127.0.0.1:{mailgun.server_port}/v3')
+            mail_queue.reset_transports()
+            OutboundEmail.query.delete()
+            db.session.commit()
+
+            mailgun.reply = (401, 'Invalid private key')
+            mail_queue.enqueue('fallback@example.com', 'Fallback test', '<p>Hello</p>')
+            assert mail_queue.drain() == {'sent': 1, 'retried': 0, 'failed': 0}
+            assert handler.messages[0][0] == ['fallback@example.com']
+
+            app.config['MAIL_SMTP_HOST'] = None
+            mail_queue.reset_transports()
+            mailgun.reply = (403, 'Domain bakebrain.local is not allowed to send')
+            retried = mail_queue.enqueue('forbidden@example.com', 'Forbidden test', '<p>Hello</p>')
+            assert mail_queue.drain() == {'sent': 0, 'retried': 1, 'failed': 0}
+            assert db.session.get(OutboundEmail, retried.id).status == 'pending'
+
+            mailgun.reply = (400, "'to' parameter is not a valid address. please check documentation")
+            rejected = mail_queue.enqueue('not-an-address', 'Rejected test', '<p>Hello</p>')
+            assert mail_queue.drain() == {'sent': 0, 'retried': 0, 'failed': 1}
+            assert db.session.get(OutboundEmail, rejected.id).status == 'failed'
+        finally:
+            app.config.update(MAILGUN_API_KEY=None, MAILGUN_DOMAIN=None, MAIL_SMTP_HOST=None)
+            mail_queue.reset_transports()
+            controller.stop()
+            mailgun.shutdown()
+
+
+def test_unconfigured_mail_logs_the_message():
+    """Without a transport the one-time code still reaches the log"""
+    from mail_queue import LogTransport
+
+    records = []
+    handler = logging.Handler(logging.INFO)
+    handler.emit = records.append
+    root = logging.getLogger()
+    level = root.level
+    root.addHandler(handler)
+    root.setLevel(logging.INFO)
+    try:
+        LogTransport().send('otp@example.com', 'Your code', '<p>Your code is <b>482913</b></p>')
+    finally:
+        root.removeHandler(handler)
+        root.setLevel(level)
+    print(f"Logged: {[record.getMessage() for record in records]}")
+    assert any('482913' in record.getMessage() for record in records)
+
+
+if __name__ == "__main__":
+    test_queued_mail_is_sent_over_one_connection()
+    test_failed_mail_is_retried_with_backoff()
+    test_mailgun_rejections()
+    test_unconfigured_mail_logs_the_message()
+    print("Mail queue tests completed!")
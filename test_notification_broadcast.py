@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Test script for notification fan-out to a role or a list of users
+"""
+
+import os
+import sys
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import event
+
+from app import app, db
+from models import User, Role, Notification
+from notifications import notification_hub
+
+
+def test_broadcast_is_one_transaction():
+    """Recipients are resolved in one query and inserted in one statement and one commit"""
+    with app.app_context():
+        role = Role.query.filter_by(name='staff').first() or Role.query.first()
+        staff = [User(username=f'broadcast{i}', email=f'broadcast{i}@example.com', first_name='Broad',
+                      last_name=f'Cast{i}', role_id=role.id, active=True) for i in range(50)]
+        db.session.add_all(staff)
+        db.session.commit()
+        expected = User.query.filter_by(role_id=role.id, active=True).count()
+        staff_ids = [user.id for user in staff]
+        listener = notification_hub.subscribe(staff_ids[0])
+
+        statements = []
+        commits = []
+
+        def count_statement(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        def count_commit(conn):
+            commits.append(conn)
+
+        engine = db.engine
+        event.listen(engine, 'before_cursor_execute', count_statement)
+        event.listen(engine, 'commit', count_commit)
+        try:
+            sent = Notification.broadcast('Staff meeting at 3pm', role=role.name)
+        finally:
+            event.remove(engine, 'before_cursor_execute', count_statement)
+            event.remove(engine, 'commit', count_commit)
+            notification_hub.unsubscribe(staff_ids[0], listener)
+
+        print(f"Sent {sent} notifications with {len(statements)} statements and {len(commits)} commit")
+        assert sent == expected
+        assert len([s for s in statements if s.lstrip().upper().startswith('INSERT')]) == 1
+        assert len(commits) == 1
+        event_name, payload = listener.get_nowait()
+        assert event_name == 'notification' and payload['message'] == 'Staff meeting at 3pm'
+
+        assert Notification.broadcast('Just two', user_ids=staff_ids[:2]) == 2
+        assert Notification.query.filter(Notification.user_id.in_(staff_ids),
+                                         Notification.message == 'Just two').count() == 2
+
+        Notification.query.filter(Notification.user_id.in_(staff_ids)).delete(synchronize_session=False)
+        User.query.filter(User.id.in_(staff_ids)).delete(synchronize_session=False)
+        db.session.commit()
+
+
+if __name__ == "__main__":
+    test_broadcast_is_one_transaction()
+    print("Notification broadcast tests completed!")
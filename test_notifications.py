@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Test script for notification push and unread counts
+"""
+
+import os
+import sys
+import threading
+import time
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import app, db
+from models import User, Notification
+from notifications import notification_hub
+
+
+def _login(client, user_id):
+    with client.session_transaction() as sess:
+        sess['_user_id'] = str(user_id)
+
+
+def test_unread_count_follows_the_database():
+    """/api/notifications counts in the database, so changes made by another worker show up at once"""
+    with app.app_context():
+        user_id = User.query.first().id
+        expected = Notification.query.filter_by(user_id=user_id, is_read=False).count()
+        assert notification_hub.unread_count(user_id) == expected
+
+        Notification.create(user_id, 'Unread count test')
+        assert notification_hub.unread_count(user_id) == expected + 1
+
+        # A rolled back notification is neither counted nor published
+        db.session.add(Notification(user_id=user_id, message='Rolled back'))
+        db.session.flush()
+        db.session.rollback()
+        assert notification_hub.unread_count(user_id) == expected + 1
+
+    client = app.test_client()
+    _login(client, user_id)
+    client.post('/api/notifications/mark_read')
+    assert client.get('/api/notifications').get_json()['unread_count'] == 0
+
+    # Written without this process's hub hearing of it, as by another worker
+    with app.app_context():
+        db.session.execute(Notification.__table__.insert().values(
+            user_id=user_id, message='From another worker', is_read=False))
+        db.session.commit()
+    assert client.get('/api/notifications').get_json()['unread_count'] == 1
+    client.post('/api/notifications/mark_read')
+
+
+def test_stream_pushes_new_notifications():
+    """An open stream receives a notification committed by another thread"""
+    with app.app_context():
+        user_id = User.query.first().id
+
+    client = app.test_client()
+    _login(client, user_id)
+    response = client.get('/api/notifications/stream', buffered=False)
+    events = iter(response.response)
+    assert next(events).startswith(b'retry:')
+    assert b'event: unread' in next(events)
+
+    def notify():
+        time.sleep(0.2)
+        with app.app_context():
+            Notification.create(user_id, 'Pushed over SSE')
+
+    threading.Thread(target=notify).start()
+    started = time.perf_counter()
+    pushed = next(events)
+    print(f"Notification pushed after {(time.perf_counter() - started) * 1000:.0f} ms")
+    assert b'event: notification' in pushed and b'Pushed over SSE' in pushed
+    response.close()
+    assert notification_hub.listener_count(user_id) == 0
+
+
+def test_stream_is_limited_to_staff_roles_and_per_worker():
+    """Other roles, and streams over NOTIFICATION_STREAM_MAX, get 204 and fall back to polling"""
+    with app.app_context():
+        user = User.query.first()
+        user_id, role = user.id, user.role.name
+
+    client = app.test_client()
+    _login(client, user_id)
+    roles, limit = app.config['NOTIFICATION_STREAM_ROLES'], app.config['NOTIFICATION_STREAM_MAX']
+    try:
+        app.config['NOTIFICATION_STREAM_ROLES'] = [r for r in roles if r != role]
+        assert client.get('/api/notifications/stream').status_code == 204
+        page = client.get('/dashboard')
+        assert page.status_code == 200
+        page = page.get_data(as_text=True)
+        assert 'pollNotifications();' in page
+        assert "new EventSource('/api/notifications/stream')" not in page
+
+        app.config['NOTIFICATION_STREAM_ROLES'] = [role]
+        app.config['NOTIFICATION_STREAM_MAX'] = 1
+        first = client.get('/api/notifications/stream', buffered=False)
+        assert first.status_code == 200
+        second = client.get('/api/notifications/stream')
+        print(f"Stream over the limit: {second.status_code}")
+        assert second.status_code == 204
+        assert notification_hub.listener_count() == 1
+        first.close()
+        assert notification_hub.listener_count() == 0
+    finally:
+        app.config['NOTIFICATION_STREAM_ROLES'], app.config['NOTIFICATION_STREAM_MAX'] = roles, limit
+
+
+if __name__ == "__main__":
+    test_unread_count_follows_the_database()
+    test_stream_pushes_new_notifications()
+    test_stream_is_limited_to_staff_roles_and_per_worker()
+    print("Notification tests completed!")
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Test script for the on-disk invoice PDF cache
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import app, db
+from models import User, Order, Configuration
+from pdf_cache import PDFCache
+from config_cache import configuration_cache
+from pdf_generator import get_cached_invoice
+
+
+def test_lru_eviction():
+    """The cache never grows past max_bytes and drops the least recently used file"""
+    cache = PDFCache(tempfile.mkdtemp(), max_bytes=2500)
+
+    first = PDFCache.make_key('a')
+    second = PDFCache.make_key('b')
+    third = PDFCache.make_key('c')
+    cache.put(first, b'x' * 1000)
+    time.sleep(0.01)
+    cache.put(second, b'x' * 1000)
+    time.sleep(0.01)
+
+    # Reading the first file makes the second one the eviction candidate
+    assert cache.get(first)
+    time.sleep(0.01)
+    cache.put(third, b'x' * 1000)
+
+    print(f"Cached: first={bool(cache.get(first))} second={bool(cache.get(second))} third={bool(cache.get(third))}")
+    assert cache.get(first)
+    assert cache.get(second) is None
+    assert cache.get(third)
+
+
+def test_invoice_key_follows_order_and_config():
+    """A cached invoice is reused until the order or the invoice configuration changes"""
+    with app.app_context():
+        customer = User.query.first()
+        order = Order(order_number=f'CACHE{int(time.time() * 1000)}', customer_id=customer.id, total_amount=10)
+        db.session.add(order)
+        db.session.commit()
+
+        cache = PDFCache(tempfile.mkdtemp())
+        try:
+            key, path = get_cached_invoice(order, cache)
+            assert os.path.exists(path)
+            again_key, again_path = get_cached_invoice(order, cache)
+            assert (again_key, again_path) == (key, path)
+
+            Configuration.set_value('invoice_footer', 'See you soon!')
+            changed_key, changed_path = get_cached_invoice(order, cache)
+            print(f"Keys: {key[:12]} -> {changed_key[:12]}")
+            assert changed_key != key
+            assert changed_path != path
+        finally:
+            Configuration.query.filter_by(key='invoice_footer').delete()
+            db.session.delete(order)
+            db.session.commit()
+            # The bulk delete bypassed the flush that bumps the version
+            configuration_cache.invalidate()
+
+
+if __name__ == "__main__":
+    test_lru_eviction()
+    test_invoice_key_follows_order_and_config()
+    print("PDF cache tests completed!")
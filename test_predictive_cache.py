@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Test script for the cached predictive analytics artifact
+"""
+
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import event
+
+from app import app, db
+from models import User, Order, OrderStatus
+from routes import _forecast_cache, _predictive_artifact, _sales_trend_direction
+
+
+def previous_trend_direction():
+    """The trend as the endpoint computed it before: Python sums over the two halves of the recent orders"""
+    recent_orders = Order.query.filter(
+        Order.created_at >= datetime.now() - timedelta(days=30),
+        Order.status != OrderStatus.CANCELLED
+    ).order_by(Order.created_at).all()
+
+    if len(recent_orders) < 2:
+        return "→ Insufficient Data"
+    first_half = sum([o.total_amount for o in recent_orders[:len(recent_orders) // 2]])
+    second_half = sum([o.total_amount for o in recent_orders[len(recent_orders) // 2:]])
+    if second_half > first_half:
+        return "↗️ Increasing"
+    elif second_half < first_half:
+        return "↘️ Decreasing"
+    return "→ Stable"
+
+
+def test_trend_matches_previous_computation():
+    """The grouped aggregate gives the same direction as summing the orders in Python"""
+    print("Testing sales trend direction...")
+
+    with app.app_context():
+        stamp = int(time.time() * 1000)
+        customer = User.query.filter_by(username='admin').first()
+
+        def seed(early_amount, late_amount):
+            orders = []
+            for i, days_ago in enumerate([25, 22, 20, 6, 3, 1]):
+                orders.append(Order(
+                    order_number=f'TREND{stamp}{early_amount}{i}', customer_id=customer.id,
+                    total_amount=early_amount if days_ago > 15 else late_amount,
+                    created_at=datetime.now() - timedelta(days=days_ago)
+                ))
+            # Ignored by both
+            orders.append(Order(order_number=f'TREND{stamp}{early_amount}X', customer_id=customer.id,
+                                total_amount=100000, status=OrderStatus.CANCELLED,
+                                created_at=datetime.now() - timedelta(days=2)))
+            db.session.add_all(orders)
+            db.session.commit()
+            return orders
+
+        for early_amount, late_amount, expected in ((10, 1000, "↗️ Increasing"), (1000, 10, "↘️ Decreasing")):
+            orders = seed(early_amount, late_amount)
+            try:
+                direction = _sales_trend_direction()
+                print(f"{early_amount} -> {late_amount}: {direction}")
+                assert direction == expected
+                assert direction == previous_trend_direction()
+            finally:
+                for order in orders:
+                    db.session.delete(order)
+                db.session.commit()
+
+
+def test_cached_artifact_runs_no_query():
+    """Within PREDICTIVE_CACHE_TTL the artifact is served without touching the database"""
+    print("Testing predictive artifact cache...")
+
+    statements = []
+    thread = threading.get_ident()
+
+    def count(conn, cursor, statement, *args):
+        if threading.get_ident() == thread:
+            statements.append(statement)
+
+    with app.app_context():
+        _forecast_cache.clear()
+        try:
+            first = _predictive_artifact()
+            event.listen(db.engine, 'before_cursor_execute', count)
+            try:
+                second = _predictive_artifact()
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', count)
+            print(f"Second call ran {len(statements)} statements")
+            assert second is first
+            assert statements == []
+        finally:
+            _forecast_cache.clear()
+
+
+if __name__ == "__main__":
+    test_trend_matches_previous_computation()
+    test_cached_artifact_runs_no_query()
+    print("Predictive cache tests completed!")
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Test script for the cached user principals
+"""
+
+import os
+import sys
+import threading
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import event
+
+from app import app, db
+from models import User
+from principals import load_principal, invalidate_principal, principal_cache
+
+
+def count_statements(func):
+    """Run func and return (result, statements it issued on this thread)"""
+    statements = []
+    thread = threading.get_ident()
+
+    def count(conn, cursor, statement, *args):
+        if threading.get_ident() == thread:
+            statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', count)
+    try:
+        return func(), statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count)
+
+
+def test_principal_cached():
+    """A cached principal authenticates and authorises without SQL"""
+    with app.app_context():
+        user = User.query.filter_by(username='admin').first()
+        principal_cache.clear()
+
+        first, statements = count_statements(lambda: load_principal(user.id))
+        assert len(statements) == 1
+        second, statements = count_statements(lambda: (load_principal(user.id).role.name, load_principal(user.id).first_name))
+        print(f"Cached principal: {second}, statements: {len(statements)}")
+        assert statements == []
+        assert second == ('admin', user.first_name)
+        assert first.is_authenticated and first.is_active
+
+
+def test_principal_invalidation():
+    """Edits are picked up after invalidation, and deactivated users are logged out"""
+    with app.app_context():
+        user = User.query.filter_by(username='admin').first()
+        original = user.first_name
+        load_principal(user.id)
+
+        try:
+            user.first_name = 'Renamed'
+            db.session.commit()
+            assert load_principal(user.id).first_name == original
+            invalidate_principal(user.id)
+            assert load_principal(user.id).first_name == 'Renamed'
+
+            user.active = False
+            db.session.commit()
+            invalidate_principal(user.id)
+            assert load_principal(user.id) is None
+        finally:
+            user.first_name = original
+            user.active = True
+            db.session.commit()
+            invalidate_principal(user.id)
+
+
+def test_principal_falls_back_to_user():
+    """Attributes outside the snapshot are read from the User row"""
+    with app.app_context():
+        user = User.query.filter_by(username='admin').first()
+        principal = load_principal(user.id)
+        assert principal.orders == user.orders
+        assert principal.user is user
+
+
+if __name__ == "__main__":
+    test_principal_cached()
+    test_principal_invalidation()
+    test_principal_falls_back_to_user()
+    print("Principal cache tests completed!")
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Test script for AI engine stage profiling
+"""
+
+import os
+import sys
+import threading
+import tracemalloc
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import app
+from models import db, Role, AnalysisRun
+import profiling
+
+
+def test_stage_metrics_persisted():
+    """A profiled run records SQL statements and rows per stage and is saved"""
+    with app.app_context():
+        role_count = Role.query.count()
+
+        with profiling.profile_run('insights:test') as run:
+            with profiling.stage('load_roles'):
+                roles = Role.query.all()
+                blob = [bytearray(1024) for _ in range(256)]
+            with profiling.stage('idle'):
+                pass
+
+        stages = {metrics.name: metrics for metrics in run.stages}
+        print(f"Run: {run.to_dict()}")
+        for metrics in run.stages:
+            print(f"  {metrics.to_dict()}")
+
+        assert len(roles) == role_count
+        assert stages['load_roles'].sql_count == 1
+        assert stages['load_roles'].rows_read == role_count
+        assert stages['load_roles'].peak_memory_kb >= 256
+        assert stages['idle'].sql_count == 0
+        assert run.rows_read >= role_count
+        assert run.peak_memory_kb >= stages['load_roles'].peak_memory_kb
+
+        record = db.session.get(AnalysisRun, run.record.id)
+        assert record.status == 'completed'
+        assert [stage.stage for stage in record.stages] == ['load_roles', 'idle']
+        del blob
+
+
+def test_stage_outside_run():
+    """Stages are a no-op when no run is being profiled"""
+    with app.app_context():
+        with profiling.stage('orphan') as metrics:
+            Role.query.all()
+        assert metrics is None
+
+
+def test_failed_run_recorded():
+    """A failing run is still persisted with its error"""
+    with app.app_context():
+        try:
+            with profiling.profile_run('insights:broken', track_memory=False) as run:
+                with profiling.stage('explode'):
+                    raise RuntimeError('boom')
+        except RuntimeError:
+            pass
+
+        record = db.session.get(AnalysisRun, run.record.id)
+        print(f"Failed run: {record.to_dict()}")
+        assert record.status == 'failed'
+        assert record.error == 'boom'
+        assert record.stages[0].status == 'failed'
+
+
+def test_concurrent_runs_do_not_share_tracing():
+    """While one run measures memory, a concurrent run neither stops tracing nor resets its peak"""
+    entered, release = threading.Event(), threading.Event()
+    results = {}
+
+    def measured():
+        with app.app_context():
+            with profiling.profile_run('insights:measured') as run:
+                blob = bytearray(512 * 1024)
+                entered.set()
+                release.wait(5)
+                del blob
+            results['measured'] = run
+
+    thread = threading.Thread(target=measured)
+    thread.start()
+    try:
+        entered.wait(5)
+        with app.app_context():
+            with profiling.profile_run('insights:concurrent') as run:
+                Role.query.all()
+        assert run.peak_memory_kb is None
+        assert tracemalloc.is_tracing()
+    finally:
+        release.set()
+        thread.join(5)
+
+    print(f"Measured run: {results['measured'].to_dict()}")
+    assert results['measured'].peak_memory_kb >= 512
+    assert not tracemalloc.is_tracing()
+
+
+if __name__ == "__main__":
+    test_stage_metrics_persisted()
+    test_stage_outside_run()
+    test_failed_run_recorded()
+    test_concurrent_runs_do_not_share_tracing()
+    print("Profiling tests completed!")
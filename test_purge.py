@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Test script for the expired session and token purge
+"""
+
+import os
+import sys
+import uuid
+from datetime import datetime, timedelta
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import app, db
+from models import User, UserSession, EmailVerification, PasswordReset, BackgroundJob
+from purge import purge_expired
+
+
+def test_purge_expired_in_batches():
+    """Rows past their expiry and the retention period are deleted in batches; live rows stay"""
+    with app.app_context():
+        user = User.query.first()
+        long_ago = datetime.utcnow() - timedelta(days=3)
+        soon = datetime.utcnow() + timedelta(hours=1)
+
+        expired = [UserSession(user_id=user.id, session_token=UserSession.generate_token(), expires_at=long_ago)
+                   for _ in range(3)]
+        expired.append(UserSession(user_id=user.id, session_token=UserSession.generate_token(), expires_at=soon,
+                                   is_active=False, last_activity=long_ago))
+        expired += [EmailVerification(email='purge@example.com', otp='123456', expires_at=long_ago) for _ in range(2)]
+        expired.append(PasswordReset(email='purge@example.com', token=PasswordReset.generate_token(), expires_at=long_ago))
+        expired.append(BackgroundJob(id=uuid.uuid4().hex, key='purge:test', status='succeeded', finished_at=long_ago))
+        live = [
+            UserSession(user_id=user.id, session_token=UserSession.generate_token(), expires_at=soon),
+            EmailVerification(email='purge@example.com', otp='654321', expires_at=soon),
+            PasswordReset(email='purge@example.com', token=PasswordReset.generate_token(), expires_at=soon),
+        ]
+        db.session.add_all(expired + live)
+        db.session.commit()
+        live_ids = [(type(row), row.id) for row in live]
+
+        try:
+            stats = purge_expired(retention_hours=24, batch_size=2)
+            print(f"Purge stats: {stats}")
+            assert stats['tables']['user_session']['removed'] >= 4
+            assert stats['tables']['user_session']['batches'] >= 2
+            assert stats['tables']['email_verification']['removed'] >= 2
+            assert stats['tables']['password_reset']['removed'] >= 1
+            assert stats['tables']['background_job']['removed'] >= 1
+            for model, row_id in live_ids:
+                assert db.session.get(model, row_id) is not None
+
+            assert purge_expired(retention_hours=24)['removed'] == 0
+        finally:
+            for model, row_id in live_ids:
+                db.session.query(model).filter_by(id=row_id).delete()
+            db.session.commit()
+
+
+if __name__ == "__main__":
+    test_purge_expired_in_batches()
+    print("Purge tests completed!")
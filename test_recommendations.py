@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Test script for the precomputed customer recommendations
+"""
+
+import os
+import sys
+import time
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import app, db
+from models import User, Role, Category, Product, Order, OrderItem, CustomerRecommendation
+from jobs import job_runner
+from recommendations import refresh_recommendations
+
+
+def wait_for_background_refresh(timeout=10):
+    """Let a refresh queued by the test's own commits finish first"""
+    deadline = time.time() + timeout
+    job = job_runner.latest('recommendations:refresh')
+    while job is not None and job.is_active and time.time() < deadline:
+        time.sleep(0.05)
+
+
+def recommended(customer):
+    return [row.product_id for row in CustomerRecommendation.query.filter_by(
+        customer_id=customer.id).order_by(CustomerRecommendation.rank)]
+
+
+def test_item_similarity_recommendations():
+    """Customers are recommended what customers with similar baskets buy, never what they already buy"""
+    with app.app_context():
+        stamp = int(time.time() * 1000)
+        role = Role.query.filter_by(name='customer').first()
+        category = Category(name=f'Reco {stamp}')
+        bread, croissant, tart, retired = [
+            Product(name=f'{name} {stamp}', sku=f'RECO{stamp}{i}', price=3, category=category, is_active=i != 3)
+            for i, name in enumerate(['Bread', 'Croissant', 'Tart', 'Retired'])
+        ]
+        customers = [
+            User(username=f'reco{stamp}{i}', email=f'reco{stamp}{i}@example.com', first_name='Reco',
+                 last_name=str(i), role_id=role.id)
+            for i in range(3)
+        ]
+        db.session.add_all([category, bread, croissant, tart, retired] + customers)
+        db.session.flush()
+
+        orders = []
+
+        def place(customer, *products):
+            order = Order(order_number=f'RECO{stamp}{len(orders)}', customer_id=customer.id, total_amount=3)
+            for product in products:
+                order.items.append(OrderItem(product=product, quantity=1, unit_price=3, total_price=3))
+            db.session.add(order)
+            orders.append(order)
+
+        place(customers[0], bread, croissant, retired)
+        place(customers[1], bread, croissant, tart)
+        place(customers[2], bread)
+        queued_before = job_runner.latest('recommendations:refresh')
+        db.session.commit()
+
+        try:
+            # Commits outside a request leave the refresh to the caller
+            assert job_runner.latest('recommendations:refresh') is queued_before
+            result = refresh_recommendations(full=True)
+            print(f"Full refresh: {result}")
+            assert croissant.id in recommended(customers[2])
+            assert bread.id not in recommended(customers[2])
+            assert retired.id not in recommended(customers[2])
+            assert recommended(customers[0]) == [tart.id]
+
+            # Only the customer who ordered again is rescored
+            place(customers[2], croissant)
+            db.session.commit()
+            result = refresh_recommendations()
+            print(f"Incremental refresh: {result}")
+            assert result['mode'] == 'incremental'
+            assert result['customers'] <= 1
+            assert croissant.id not in recommended(customers[2])
+            assert tart.id in recommended(customers[2])
+
+            # An order placed through the web app queues the refresh itself
+            with app.test_request_context():
+                place(customers[1], bread)
+                db.session.commit()
+            assert job_runner.latest('recommendations:refresh') is not queued_before
+        finally:
+            wait_for_background_refresh()
+            CustomerRecommendation.query.filter(
+                CustomerRecommendation.customer_id.in_([customer.id for customer in customers])
+            ).delete(synchronize_session=False)
+            for order in orders:
+                db.session.delete(order)
+            db.session.flush()
+            for obj in customers + [bread, croissant, tart, retired, category]:
+                db.session.delete(obj)
+            db.session.commit()
+
+
+if __name__ == "__main__":
+    test_item_similarity_recommendations()
+    print("Recommendation tests completed!")
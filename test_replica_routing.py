@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Test script for read replica routing, with a second SQLite database as the replica
+"""
+
+import os
+import sys
+import tempfile
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask
+from sqlalchemy import insert
+
+import app as _app  # noqa: F401 - registers the models
+from models import db, Role, Order
+from db_routing import replica_reads, replica_status
+
+
+def make_app():
+    directory = tempfile.mkdtemp()
+    replica_app = Flask(__name__)
+    replica_app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(directory, 'primary.db')}"
+    replica_app.config['SQLALCHEMY_BINDS'] = {'replica': f"sqlite:///{os.path.join(directory, 'replica.db')}"}
+    replica_app.config['REPLICA_MAX_LAG'] = 30
+    replica_app.config['REPLICA_LAG_CHECK_INTERVAL'] = 60
+    db.init_app(replica_app)
+
+    with replica_app.app_context():
+        db.create_all()
+        db.metadata.create_all(db.engines['replica'])
+        with db.engines['replica'].begin() as conn:
+            conn.execute(insert(Role.__table__).values(name='replica-role'))
+        db.session.add(Role(name='primary-role'))
+        db.session.commit()
+    return replica_app
+
+
+def role_names():
+    return {role.name for role in Role.query.all()}
+
+
+def test_reads_routed_to_replica():
+    """SELECTs inside replica_reads() hit the replica; writes still go to the primary"""
+    replica_app = make_app()
+    with replica_app.app_context():
+        assert role_names() == {'primary-role'}
+
+        with replica_reads():
+            assert role_names() == {'replica-role'}
+            db.session.add(Role(name='written-in-block'))
+            db.session.commit()
+
+        print(f"Primary roles: {role_names()}")
+        assert role_names() == {'primary-role', 'written-in-block'}
+        assert replica_status()['serving_reads']
+
+
+def test_stale_replica_falls_back():
+    """A replica behind the primary by more than REPLICA_MAX_LAG stops serving reads"""
+    replica_app = make_app()
+    with replica_app.app_context():
+        db.session.add(Order(order_number='LAG1', customer_id=1, total_amount=5))
+        db.session.commit()
+
+        status = replica_status()
+        print(f"Replica status: {status}")
+        assert status['configured']
+        assert not status['serving_reads']
+        with replica_reads():
+            assert role_names() == {'primary-role'}
+
+
+if __name__ == "__main__":
+    test_reads_routed_to_replica()
+    test_stale_replica_falls_back()
+    print("Replica routing tests completed!")
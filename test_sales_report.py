@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Test script for the date-range sales report
+"""
+
+import os
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import app, db
+from models import User, Order, OrderStatus
+from pdf_generator import SmartBillGenerator
+from routes import _sales_report_range
+
+
+def test_report_ranges():
+    """Periods resolve to inclusive ranges ending today; explicit dates win"""
+    print("Testing report ranges...")
+
+    today = datetime.utcnow().date()
+    assert _sales_report_range({})[:2] == (today, today)
+    assert _sales_report_range({'date': '2024-02-29'})[:2] == (date(2024, 2, 29), date(2024, 2, 29))
+    assert _sales_report_range({'period': '7d'})[:2] == (today - timedelta(days=6), today)
+    assert _sales_report_range({'period': 'week'})[0].weekday() == 0
+    assert _sales_report_range({'period': 'month'})[0] == today.replace(day=1)
+    assert _sales_report_range({'period': 'ytd'})[0] == today.replace(month=1, day=1)
+    assert _sales_report_range({'start': '2024-01-01', 'end': '2024-01-31', 'period': 'week'})[:2] == \
+        (date(2024, 1, 1), date(2024, 1, 31))
+    try:
+        _sales_report_range({'start': '2024-02-01', 'end': '2024-01-31'})
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('An end date before the start date was accepted')
+
+
+def test_figures_on_seeded_orders():
+    """Totals cover the first and last instant of the range only, and cancelled orders earn nothing"""
+    print("Testing sales report figures...")
+
+    with app.app_context():
+        stamp = int(time.time() * 1000)
+        customer = User.query.filter_by(username='admin').first()
+        seeded = [
+            (datetime(2019, 6, 9, 23, 59, 59), 1000, OrderStatus.DELIVERED),   # the day before
+            (datetime(2019, 6, 10, 0, 0), 10, OrderStatus.DELIVERED),
+            (datetime(2019, 6, 10, 15, 30), 20, OrderStatus.PENDING),
+            (datetime(2019, 6, 11, 12, 0), 500, OrderStatus.CANCELLED),
+            (datetime(2019, 6, 12, 23, 59, 59, 999999), 30, OrderStatus.DELIVERED),
+            (datetime(2019, 6, 13, 0, 0), 2000, OrderStatus.DELIVERED),        # the day after
+        ]
+        orders = [
+            Order(order_number=f'SALES{stamp}{i}', customer_id=customer.id, total_amount=amount,
+                  status=status, created_at=created_at)
+            for i, (created_at, amount, status) in enumerate(seeded)
+        ]
+        db.session.add_all(orders)
+        db.session.commit()
+
+        try:
+            generator = SmartBillGenerator()
+            figures = generator.sales_report_figures(date(2019, 6, 10), date(2019, 6, 12))
+            print(f"Figures: {figures}")
+            assert figures['total_orders'] == 4
+            assert figures['cancelled_orders'] == 1
+            assert figures['sold_orders'] == 3
+            assert figures['total_revenue'] == 60
+            assert figures['avg_order_value'] == 20
+            assert figures['daily_rows'] == [('2019-06-10', 2, 30.0), ('2019-06-12', 1, 30.0)]
+
+            single_day = generator.sales_report_figures(date(2019, 6, 11), date(2019, 6, 11))
+            assert single_day['total_orders'] == 1 and single_day['cancelled_orders'] == 1
+            assert single_day['total_revenue'] == 0 and single_day['avg_order_value'] == 0
+
+            pdf = generator.generate_sales_report(date(2019, 6, 10), date(2019, 6, 12))
+            assert pdf.read(4) == b'%PDF'
+        finally:
+            for order in orders:
+                db.session.delete(order)
+            db.session.commit()
+
+
+if __name__ == "__main__":
+    test_report_ranges()
+    test_figures_on_seeded_orders()
+    print("Sales report tests completed!")
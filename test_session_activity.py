@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Test script for the batched session activity updates
+"""
+
+import os
+import sys
+import threading
+from datetime import datetime, timedelta
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import event
+
+from app import app, db
+from models import User, UserSession
+from session_activity import SessionActivityBuffer
+
+
+def test_activity_coalesced_and_flushed():
+    """Repeated activity is recorded once per interval and written with one UPDATE"""
+    with app.app_context():
+        user = User.query.first()
+        sessions = [UserSession(user_id=user.id, session_token=UserSession.generate_token(),
+                                last_activity=datetime(2020, 1, 1)) for _ in range(3)]
+        db.session.add_all(sessions)
+        db.session.commit()
+        tokens = [s.session_token for s in sessions]
+
+        # Without an app the buffer has no flush thread and is flushed by hand
+        buffer = SessionActivityBuffer(interval=60)
+        seen = datetime.utcnow() - timedelta(seconds=5)
+        try:
+            assert buffer.touch(tokens[0], seen)
+            assert not buffer.touch(tokens[0])
+            buffer.touch(tokens[1], seen)
+            assert len(buffer.pending()) == 2
+
+            statements = []
+            thread = threading.get_ident()
+
+            def count(conn, cursor, statement, *args):
+                if threading.get_ident() == thread and statement.startswith('UPDATE'):
+                    statements.append(statement)
+
+            event.listen(db.engine, 'before_cursor_execute', count)
+            try:
+                updated = buffer.flush()
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', count)
+
+            print(f"Updated {updated} sessions with {len(statements)} statement(s)")
+            assert updated == 2
+            assert len(statements) == 1
+            assert buffer.pending() == {}
+
+            db.session.expire_all()
+            activity = {s.session_token: s.last_activity for s in UserSession.query.filter(UserSession.session_token.in_(tokens))}
+            assert activity[tokens[0]] == seen
+            assert activity[tokens[1]] == seen
+            assert activity[tokens[2]] == datetime(2020, 1, 1)
+        finally:
+            UserSession.query.filter(UserSession.session_token.in_(tokens)).delete(synchronize_session=False)
+            db.session.commit()
+
+
+if __name__ == "__main__":
+    test_activity_coalesced_and_flushed()
+    print("Session activity tests completed!")
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Test script for the SQLite engine profile
+"""
+
+import os
+import sys
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import sqlalchemy as sa
+
+from app import app, db
+from sqlite_profile import engine_options, is_sqlite_file
+
+
+def test_engine_options_per_database():
+    """SQLite files get the sized pool and busy timeout; other databases keep pre-ping and recycling"""
+    print("Testing engine options...")
+
+    assert is_sqlite_file('sqlite:///bakery.db')
+    assert not is_sqlite_file('sqlite://')
+    assert not is_sqlite_file('sqlite:///:memory:')
+    assert not is_sqlite_file('postgresql://bakery@localhost/bakery')
+
+    options = engine_options('sqlite:///bakery.db', app.config)
+    assert options['poolclass'] is sa.pool.QueuePool
+    assert options['pool_size'] == app.config['SQLITE_POOL_SIZE']
+    assert options['connect_args']['timeout'] == app.config['SQLITE_BUSY_TIMEOUT_MS'] / 1000
+    assert 'pool_pre_ping' not in options
+
+    options = engine_options('postgresql://bakery@localhost/bakery', app.config)
+    assert options == {'pool_recycle': 300, 'pool_pre_ping': True}
+
+
+def test_pragmas_on_every_connection():
+    """Each new pooled connection runs in WAL mode with the configured pragmas"""
+    print("Testing connection pragmas...")
+
+    with app.app_context():
+        if not is_sqlite_file(db.engine.url):
+            print("Not a SQLite database file; skipping")
+            return
+
+        with db.engine.connect() as first, db.engine.connect() as second:
+            for connection in (first, second):
+                assert connection.exec_driver_sql('PRAGMA journal_mode').scalar() == 'wal'
+                assert connection.exec_driver_sql('PRAGMA synchronous').scalar() == 1
+                assert connection.exec_driver_sql('PRAGMA busy_timeout').scalar() == app.config['SQLITE_BUSY_TIMEOUT_MS']
+                assert connection.exec_driver_sql('PRAGMA cache_size').scalar() == -app.config['SQLITE_CACHE_SIZE_KB']
+
+        # With WAL, an open read transaction does not keep a writer from committing
+        with db.engine.connect() as reader, db.engine.connect() as writer:
+            reader.exec_driver_sql('BEGIN')
+            before = reader.exec_driver_sql('SELECT COUNT(*) FROM configuration_version').scalar()
+            writer.exec_driver_sql('CREATE TABLE IF NOT EXISTS wal_probe (id INTEGER PRIMARY KEY)')
+            writer.exec_driver_sql('INSERT INTO wal_probe DEFAULT VALUES')
+            writer.commit()
+            assert reader.exec_driver_sql('SELECT COUNT(*) FROM configuration_version').scalar() == before
+            reader.rollback()
+            writer.exec_driver_sql('DROP TABLE wal_probe')
+            writer.commit()
+
+
+if __name__ == "__main__":
+    test_engine_options_per_database()
+    test_pragmas_on_every_connection()
+    print("SQLite profile tests completed!")
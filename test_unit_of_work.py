@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Test script for the request-scoped unit of work
+"""
+
+import os
+import sys
+import time
+from decimal import Decimal
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import event
+
+from app import app, db
+from models import User, Notification, Configuration, Category, Product, ProductRecipe, RawProduct
+from notifications import notification_hub
+
+
+class CommitCounter:
+    def __init__(self):
+        self.commits = 0
+
+    def __call__(self, conn):
+        self.commits += 1
+
+    def __enter__(self):
+        event.listen(db.engine, 'commit', self)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(db.engine, 'commit', self)
+
+
+def test_helpers_commit_once_per_request():
+    """Helpers only stage inside a request; the request commits once at the end"""
+    with app.app_context():
+        user_id = User.query.first().id
+
+    with app.test_request_context('/'):
+        with CommitCounter() as counter:
+            Notification.create(user_id, 'Unit of work 1')
+            Notification.create(user_id, 'Unit of work 2')
+            Configuration.set_value('unit_of_work_test', '1')
+            assert counter.commits == 0
+            app.process_response(app.response_class('ok'))
+        print(f"Three helper calls, {counter.commits} commit")
+        assert counter.commits == 1
+
+    with app.test_request_context('/'):
+        Notification.create(user_id, 'Unit of work failed')
+        app.process_response(app.response_class('error', status=500))
+
+    with app.app_context():
+        messages = {n.message for n in Notification.query.filter(Notification.message.like('Unit of work%'))}
+        assert messages == {'Unit of work 1', 'Unit of work 2'}
+        Notification.query.filter(Notification.message.like('Unit of work%')).delete(synchronize_session=False)
+        Configuration.query.filter_by(key='unit_of_work_test').delete()
+        db.session.commit()
+
+
+def test_savepoint_rolls_back_only_the_failed_step():
+    """A short recipe consumes nothing, and the rest of the request is still committed"""
+    suffix = int(time.time() * 1000)
+    with app.app_context():
+        user_id = User.query.first().id
+        category = Category(name=f'UoW {suffix}')
+        flour = RawProduct(name=f'Flour {suffix}', unit_of_measure='kg', cost_per_unit=1, current_stock=10)
+        butter = RawProduct(name=f'Butter {suffix}', unit_of_measure='kg', cost_per_unit=1, current_stock=1)
+        product = Product(name=f'Croissant {suffix}', price=3, category=category)
+        db.session.add_all([category, flour, butter, product])
+        db.session.flush()
+        db.session.add_all([
+            ProductRecipe(product_id=product.id, raw_product_id=flour.id, quantity_required=2, unit_of_measure='kg'),
+            ProductRecipe(product_id=product.id, raw_product_id=butter.id, quantity_required=1, unit_of_measure='kg'),
+        ])
+        db.session.commit()
+        ids = {'category': category.id, 'flour': flour.id, 'butter': butter.id, 'product': product.id}
+
+    listener = notification_hub.subscribe(user_id)
+    try:
+        with app.test_request_context('/'):
+            Notification.create(user_id, 'Before the shortage')
+            product = db.session.get(Product, ids['product'])
+            assert product.consume_raw_materials(3) is False
+            app.process_response(app.response_class('ok'))
+
+        with app.app_context():
+            assert db.session.get(RawProduct, ids['flour']).current_stock == Decimal('10')
+            assert db.session.get(RawProduct, ids['butter']).current_stock == Decimal('1')
+            assert Notification.query.filter_by(message='Before the shortage').count() == 1
+        event_name, payload = listener.get_nowait()
+        assert payload['message'] == 'Before the shortage'
+    finally:
+        notification_hub.unsubscribe(user_id, listener)
+        with app.app_context():
+            Notification.query.filter_by(message='Before the shortage').delete()
+            ProductRecipe.query.filter_by(product_id=ids['product']).delete()
+            Product.query.filter_by(id=ids['product']).delete()
+            RawProduct.query.filter(RawProduct.id.in_([ids['flour'], ids['butter']])).delete()
+            Category.query.filter_by(id=ids['category']).delete()
+            db.session.commit()
+
+
+if __name__ == "__main__":
+    test_helpers_commit_once_per_request()
+    test_savepoint_rolls_back_only_the_failed_step()
+    print("Unit of work tests completed!")
@@ -0,0 +1,83 @@
+from contextlib import contextmanager
+
+from flask import g, has_request_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+class RequestUnitOfWork:
+    """
+    One commit per request for changes made by model helpers.
+
+    Helpers such as Notification.create call commit() instead of committing
+    the session themselves. Inside a request that only flushes, so the rows
+    get their ids and constraint errors surface where they happen, and the
+    request's changes are committed together after the view returns: views
+    that commit themselves commit them along with their own, and otherwise
+    they are committed before the response is sent. A response with a 5xx
+    status rolls them back instead. Outside a request, in jobs, CLI commands
+    and scripts, commit() commits straight away as before.
+
+    Use savepoint() around a step that may have to be undone on its own
+    without discarding the rest of the request.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['unit_of_work'] = self
+        app.after_request(self._commit_request)
+
+    @property
+    def active(self):
+        return has_request_context()
+
+    def commit(self):
+        """Commit the session, or stage its changes for the end of the request"""
+        from models import db
+
+        if self.active:
+            db.session.flush()
+            g.unit_of_work_pending = True
+        else:
+            db.session.commit()
+
+    @contextmanager
+    def savepoint(self):
+        """
+        Run the block in a nested transaction. If it raises, only the changes
+        made inside it are rolled back, and the exception propagates.
+        """
+        from models import db
+
+        with db.session.begin_nested():
+            yield
+
+    def _commit_request(self, response):
+        from models import db
+
+        if not g.pop('unit_of_work_pending', False):
+            return response
+        if response.status_code >= 500:
+            db.session.rollback()
+            return response
+        try:
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return response
+
+
+unit_of_work = RequestUnitOfWork()
+
+
+@event.listens_for(Session, 'after_commit')
+def _clear_staged_changes(session):
+    # A view that commits itself also commits what the helpers staged
+    if has_request_context():
+        g.pop('unit_of_work_pending', None)
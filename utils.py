@@ -1,6 +1,3 @@
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 from datetime import datetime, timedelta
 import random
 import string
@@ -9,8 +6,8 @@ from flask import abort, current_app
 from flask_login import current_user
 from models import Order, Product, Inventory, AIInsight, OrderStatus
 from app import db
-import os
-import requests
+import profiling
+from mail_queue import mail_queue
 
 
 def generate_order_number():
@@ -34,6 +31,7 @@ def requires_role(roles):
     return decorator
 
 
+@profiling.profiled('generate_ai_insights')
 def generate_ai_insights():
     """Generate AI-powered insights for bakery operations"""
     insights = []
@@ -146,217 +144,54 @@ def generate_delivery_time_estimate(preparation_time, order_type):
     return datetime.now() + timedelta(minutes=base_time)
 
 
-def send_email_otp(email, otp):
-    """
-    Send OTP email using a free email service
-    Using Mailgun's free tier or Gmail SMTP
+def _otp_email_html(otp):
+    return f"""
+    <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
+        <h2 style="color: #333;">Email Verification</h2>
+        <p>Your verification code is:</p>
+        <div style="background-color: #f4f4f4; padding: 20px; text-align: center; font-size: 24px; font-weight: bold; color: #333; margin: 20px 0;">
+            {otp}
+        </div>
+        <p>This code will expire in 10 minutes.</p>
+        <p>If you didn't request this verification, please ignore this email.</p>
+    </div>
     """
-    try:
-        # Try Mailgun first (free tier available)
-        return send_email_via_mailgun(email, otp)
-    except Exception as e:
-        try:
-            # Fallback to Gmail SMTP
-            return send_email_via_gmail(email, otp)
-        except Exception as e2:
-            # Last resort: use a free email API service
-            return send_email_via_free_api(email, otp)
-    except Exception as e3:
-        print(f"All email methods failed: {e3}")
-        return False
-
-def send_email_via_mailgun(email, otp):
-    """Send email using Mailgun (free tier)"""
-    try:
-        # You can sign up for free Mailgun account
-        # For now, we'll use a mock implementation
-        mailgun_api_key = os.environ.get('MAILGUN_API_KEY', '')
-        mailgun_domain = os.environ.get('MAILGUN_DOMAIN', '')
-        
-        if not mailgun_api_key or not mailgun_domain:
-            raise Exception("Mailgun credentials not configured")
-        
-        url = f"https://api.mailgun.net/v3/{mailgun_domain}/messages"
-        auth = ("api", mailgun_api_key)
-        
-        data = {
-            "from": f"BakeBrain <noreply@{mailgun_domain}>",
-            "to": email,
-            "subject": "Email Verification - BakeBrain",
-            "html": f"""
-            <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
-                <h2 style="color: #333;">Email Verification</h2>
-                <p>Your verification code is:</p>
-                <div style="background-color: #f4f4f4; padding: 20px; text-align: center; font-size: 24px; font-weight: bold; color: #333; margin: 20px 0;">
-                    {otp}
-                </div>
-                <p>This code will expire in 10 minutes.</p>
-                <p>If you didn't request this verification, please ignore this email.</p>
-            </div>
-            """
-        }
-        
-        response = requests.post(url, auth=auth, data=data)
-        return response.status_code == 200
-    except Exception as e:
-        raise e
 
-def send_email_via_gmail(email, otp):
-    """Send email using Gmail SMTP (requires app password)"""
-    try:
-        gmail_user = os.environ.get('GMAIL_USER', '')
-        gmail_password = os.environ.get('GMAIL_APP_PASSWORD', '')
-        
-        if not gmail_user or not gmail_password:
-            raise Exception("Gmail credentials not configured")
-        
-        msg = MIMEMultipart()
-        msg['From'] = gmail_user
-        msg['To'] = email
-        msg['Subject'] = "Email Verification - BakeBrain"
-        
-        body = f"""
-        <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
-            <h2 style="color: #333;">Email Verification</h2>
-            <p>Your verification code is:</p>
-            <div style="background-color: #f4f4f4; padding: 20px; text-align: center; font-size: 24px; font-weight: bold; color: #333; margin: 20px 0;">
-                {otp}
-            </div>
-            <p>This code will expire in 10 minutes.</p>
-            <p>If you didn't request this verification, please ignore this email.</p>
+def _password_reset_email_html(reset_url):
+    return f"""
+    <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
+        <h2 style="color: #333;">Password Reset Request</h2>
+        <p>You requested a password reset for your BakeBrain account.</p>
+        <p>Click the button below to reset your password:</p>
+        <div style="text-align: center; margin: 30px 0;">
+            <a href="{reset_url}" style="background-color: #007bff; color: white; padding: 12px 24px; text-decoration: none; border-radius: 5px; display: inline-block;">Reset Password</a>
         </div>
-        """
-        
-        msg.attach(MIMEText(body, 'html'))
-        
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(gmail_user, gmail_password)
-        text = msg.as_string()
-        server.sendmail(gmail_user, email, text)
-        server.quit()
-        
-        return True
-    except Exception as e:
-        raise e
+        <p>This link will expire in 1 hour.</p>
+        <p>If you didn't request this reset, please ignore this email.</p>
+    </div>
+    """
 
-def send_email_via_free_api(email, otp):
-    """Send email using a free email API service"""
+def send_email_otp(email, otp):
+    """
+    Queue the OTP email. It is sent by the mail queue worker, which tries
+    Mailgun and then SMTP and retries failures with backoff.
+    """
     try:
-        # Using a free email service like EmailJS or similar
-        # For demonstration, we'll use a mock implementation
-        # In production, you can integrate with services like:
-        # - EmailJS (free tier available)
-        # - SendGrid (free tier available)
-        # - Mailchimp (free tier available)
-        
-        # Mock successful email sending
-        print(f"Mock email sent to {email} with OTP: {otp}")
+        mail_queue.enqueue(email, "Email Verification - BakeBrain", _otp_email_html(otp))
         return True
     except Exception as e:
-        raise e
+        print(f"Could not queue verification email: {e}")
+        return False
 
 def send_password_reset_email(email, reset_token):
-    """Send password reset email"""
+    """Queue the password reset email"""
     try:
         reset_url = f"http://localhost:5000/reset-password?token={reset_token}"
-        
-        # Try Mailgun first
-        return send_password_reset_via_mailgun(email, reset_url)
-    except Exception as e:
-        try:
-            # Fallback to Gmail SMTP
-            return send_password_reset_via_gmail(email, reset_url)
-        except Exception as e2:
-            # Last resort: use a free email API service
-            return send_password_reset_via_free_api(email, reset_url)
-    except Exception as e3:
-        print(f"All email methods failed: {e3}")
-        return False
-
-def send_password_reset_via_mailgun(email, reset_url):
-    """Send password reset email using Mailgun"""
-    try:
-        mailgun_api_key = os.environ.get('MAILGUN_API_KEY', '')
-        mailgun_domain = os.environ.get('MAILGUN_DOMAIN', '')
-        
-        if not mailgun_api_key or not mailgun_domain:
-            raise Exception("Mailgun credentials not configured")
-        
-        url = f"https://api.mailgun.net/v3/{mailgun_domain}/messages"
-        auth = ("api", mailgun_api_key)
-        
-        data = {
-            "from": f"BakeBrain <noreply@{mailgun_domain}>",
-            "to": email,
-            "subject": "Password Reset - BakeBrain",
-            "html": f"""
-            <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
-                <h2 style="color: #333;">Password Reset Request</h2>
-                <p>You requested a password reset for your BakeBrain account.</p>
-                <p>Click the button below to reset your password:</p>
-                <div style="text-align: center; margin: 30px 0;">
-                    <a href="{reset_url}" style="background-color: #007bff; color: white; padding: 12px 24px; text-decoration: none; border-radius: 5px; display: inline-block;">Reset Password</a>
-                </div>
-                <p>This link will expire in 1 hour.</p>
-                <p>If you didn't request this reset, please ignore this email.</p>
-            </div>
-            """
-        }
-        
-        response = requests.post(url, auth=auth, data=data)
-        return response.status_code == 200
-    except Exception as e:
-        raise e
-
-def send_password_reset_via_gmail(email, reset_url):
-    """Send password reset email using Gmail SMTP"""
-    try:
-        gmail_user = os.environ.get('GMAIL_USER', '')
-        gmail_password = os.environ.get('GMAIL_APP_PASSWORD', '')
-        
-        if not gmail_user or not gmail_password:
-            raise Exception("Gmail credentials not configured")
-        
-        msg = MIMEMultipart()
-        msg['From'] = gmail_user
-        msg['To'] = email
-        msg['Subject'] = "Password Reset - BakeBrain"
-        
-        body = f"""
-        <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
-            <h2 style="color: #333;">Password Reset Request</h2>
-            <p>You requested a password reset for your BakeBrain account.</p>
-            <p>Click the button below to reset your password:</p>
-            <div style="text-align: center; margin: 30px 0;">
-                <a href="{reset_url}" style="background-color: #007bff; color: white; padding: 12px 24px; text-decoration: none; border-radius: 5px; display: inline-block;">Reset Password</a>
-            </div>
-            <p>This link will expire in 1 hour.</p>
-            <p>If you didn't request this reset, please ignore this email.</p>
-        </div>
-        """
-        
-        msg.attach(MIMEText(body, 'html'))
-        
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(gmail_user, gmail_password)
-        text = msg.as_string()
-        server.sendmail(gmail_user, email, text)
-        server.quit()
-        
-        return True
-    except Exception as e:
-        raise e
-
-def send_password_reset_via_free_api(email, reset_url):
-    """Send password reset email using free API"""
-    try:
-        # Mock successful email sending
-        print(f"Mock password reset email sent to {email} with URL: {reset_url}")
+        mail_queue.enqueue(email, "Password Reset - BakeBrain", _password_reset_email_html(reset_url))
         return True
     except Exception as e:
-        raise e
+        print(f"Could not queue password reset email: {e}")
+        return False
 
 def check_password_strength(password):
     """